@@ -0,0 +1,129 @@
+"""Requests per second of the sync (WSGI) and async (ASGI) versions of run_algorithm, at equal concurrency.
+
+Earth Engine is stubbed out: the threshold-based classification sleeps for a fixed latency.
+Requests go through the middleware of the project settings, with tracing on, and the views keep
+their metrics decorators. For every ``--concurrency``, the WSGI deployment is modelled by that
+many threads, one per sync worker or gthread thread, and the ASGI deployment by a single event
+loop whose view pool has that many threads (``ASYNC_VIEW_MAX_CONCURRENCY``), so the difference
+comes from the handlers and not from how many requests are processed at the same time.
+
+Usage:
+    python -m benchmarks.async_views [--concurrency 8 32] [--clients 64] [--requests 256] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'riceexplorer.settings')
+
+import django
+django.setup()
+
+from django.test import Client
+from django.test.client import BOUNDARY, encode_multipart
+from django.test.utils import override_settings
+from django.urls import path
+
+import empirical.views as views
+import service.executor as executor
+import service.main as service
+
+urlpatterns = [
+    path('sync', views.run_algorithm),
+    path('async', views.run_algorithm_async),
+]
+
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+
+FILTERS = {'dataset': {'name': 'COPERNICUS/S1_GRD', 'boundary': 'CHITAWAN'}, 'op': 'and', 'seasons': []}
+
+
+def stub_service(latency):
+    def get_threshold_results(filters, progress=None):
+        time.sleep(latency)
+        return {'combined': {'tile_url': '', 'download_url': '', 'area': 0}}
+    service.get_threshold_results = get_threshold_results
+
+
+def post_data():
+    payload = io.BytesIO(json.dumps(FILTERS).encode())
+    payload.name = 'filters.json'
+    return encode_multipart(BOUNDARY, {'json': payload})
+
+
+def bench_wsgi(n_requests, workers):
+    client = Client()
+
+    def request(_):
+        return client.post('/sync', post_data(), content_type=CONTENT_TYPE).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        codes = list(pool.map(request, range(n_requests)))
+    return n_requests / (time.perf_counter() - start), codes
+
+
+async def bench_asgi(n_requests, clients):
+    # drive the ASGI application directly, as an ASGI server would
+    from django.core.handlers.asgi import ASGIHandler
+    app = ASGIHandler()
+    semaphore = asyncio.Semaphore(clients)
+
+    async def request():
+        body = post_data()
+        scope = {
+            'type': 'http', 'method': 'POST', 'path': '/async', 'query_string': b'', 'root_path': '',
+            'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+            'headers': [(b'content-type', CONTENT_TYPE.encode()), (b'content-length', str(len(body)).encode())],
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        response = {}
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+
+        async with semaphore:
+            await app(scope, receive, send)
+        return response['status']
+
+    start = time.perf_counter()
+    codes = await asyncio.gather(*(request() for _ in range(n_requests)))
+    return n_requests / (time.perf_counter() - start), codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32],
+                        help="requests processed at the same time: WSGI threads and ASGI view pool threads")
+    parser.add_argument('--clients', type=int, default=64, help="concurrent clients")
+    parser.add_argument('--requests', type=int, default=256, help="total requests")
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds spent waiting on Earth Engine per request")
+    args = parser.parse_args()
+
+    stub_service(args.latency)
+
+    for concurrency in args.concurrency:
+        with override_settings(ROOT_URLCONF=__name__, DEBUG=False, TRACING=True, ASYNC_VIEW_MAX_CONCURRENCY=concurrency):
+            # the view pool is sized on first use
+            executor._view_executor = None
+
+            wsgi_rps, codes = bench_wsgi(args.requests, min(concurrency, args.clients))
+            assert set(codes) == {200}, codes
+
+            asgi_rps, codes = asyncio.run(bench_asgi(args.requests, args.clients))
+            assert set(codes) == {200}, codes
+
+        print(f"concurrency {concurrency:3d}  {args.clients:4d} clients  "
+              f"WSGI {wsgi_rps:8.1f} requests/s  ASGI {asgi_rps:8.1f} requests/s  ratio {asgi_rps / wsgi_rps:5.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Size of the Earth Engine graph of make_composite() for windows planned on the server and in Python.
+
+The previous make_composite() mapped a function over a server-side list of window starts; the
+function filtered the whole pool by date and wrapped each composite in ee.Algorithms.If, so the
+server ran one filterDate and one conditional per window. The planner runs one filterDate and
+groups the images with a join.
+
+The serialized graphs are built without being computed, but building them needs an initialized
+client: the credentials are read like the app does, from the EE_ACCOUNT and EE_CREDENTIALS
+environment variables.
+
+Usage:
+    python -m benchmarks.composite_graph [--days 6 12 30] [--start 2021-01 --end 2022-01]
+"""
+import argparse
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'riceexplorer.settings')
+
+
+def graph_stats(collection):
+    import ee
+    graph = ee.serializer.toJSON(collection)
+    return len(graph), graph.count('"Filter.dateRangeContains"'), graph.count('"Algorithms.If"')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, nargs='+', default=[6, 12, 30])
+    parser.add_argument('--start', default='2021-01')
+    parser.add_argument('--end', default='2022-01')
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    import ee
+    from utils.credential import EE_CREDENTIALS
+    ee.Initialize(EE_CREDENTIALS)
+
+    from service.dates import composite_windows
+    from service.main import make_composite
+    from service.testing import server_side_make_composite
+
+    pool = ee.ImageCollection('COPERNICUS/S1_GRD').select('VH')
+    print(f"{'days':>5} {'windows':>8} {'planner':>8} {'graph bytes':>12} {'filterDate nodes':>17} "
+          f"{'If nodes':>9} {'filterDate runs':>16} {'If runs':>8}")
+    for days in args.days:
+        windows = len(composite_windows(args.start, args.end, days))
+        for name, func in (('server', server_side_make_composite), ('python', make_composite)):
+            size, filters, conditionals = graph_stats(func(pool, args.start, args.end, days))
+            # nodes of the server-side planner are evaluated once per window
+            runs = windows if name == 'server' else 1
+            print(f"{days:>5} {windows:>8} {name:>8} {size:>12} {filters:>17} {conditionals:>9} "
+                  f"{filters * runs:>16} {conditionals * runs:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Wall time, round-trips and graph sizes of the pipelines run against the Earth Engine emulator.
+
+The threshold-based classification (of one district, of all districts in a batch, and of five
+years in a batch), the supervised classification and the phenology sampling run end to end
+through service.ee_emulator, on synthetic rasters of the default boundary file, with a fixed
+latency added to every request. No credentials are needed.
+
+Usage:
+    python -m benchmarks.emulated_pipelines [--latency 0 0.5] [--samples 200] [--size 256 96] [--repeat 3]
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'riceexplorer.settings')
+os.environ['EE_BACKEND'] = 'emulator'
+
+from service.testing import CLASSIFICATION_FILTERS, DATASET, THRESHOLD_FILTERS, make_samples
+
+
+def pipelines(samples):
+    import copy
+    from service import main
+
+    def threshold():
+        img, boundary, scale = main.run_threshold_based_classification(copy.deepcopy(THRESHOLD_FILTERS))
+        return main.make_empirical_results(img, boundary, scale)
+
+    def districts():
+        # every district of the boundary file, in one request
+        img, districts, scale = main.run_batch_threshold_classification(copy.deepcopy(THRESHOLD_FILTERS))
+        return main.make_batch_results(img, districts, scale, main.get_batch_districts(THRESHOLD_FILTERS))
+
+    def years():
+        # the seasons of five years, in one request
+        imgs, boundary, scale = main.run_multi_year_threshold_classification(
+            {**copy.deepcopy(THRESHOLD_FILTERS), 'years': list(range(2017, 2022))})
+        return main.make_multi_year_threshold_results(imgs, boundary, scale)
+
+    def classification():
+        res = main.run_supervised_classification(copy.deepcopy(CLASSIFICATION_FILTERS), copy.deepcopy(samples))
+        return main.make_classification_results(*res)
+
+    def phenology():
+        return main.get_phenology({
+            'dataset': DATASET,
+            'samples': samples,
+            'phenology_dates': {'start_date': '2021-01', 'end_date': '2021-12'},
+        })
+
+    return {'threshold': threshold, 'districts': districts, 'years': years, 'classification': classification, 'phenology': phenology}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, nargs='+', default=[0, 0.5], help="seconds per round-trip")
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--size', type=int, nargs=2, default=[256, 96], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from service.ee_client import ee
+
+    samples = make_samples(args.samples)
+    for latency in args.latency:
+        ee.configure(latency=latency, width=args.size[0], height=args.size[1])
+        for name, run in pipelines(samples).items():
+            ee.reset_stats()
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                run()
+            elapsed = (time.perf_counter() - start) / args.repeat
+            stats = ee.get_stats()
+            round_trips = sum(stats['round_trips'].values()) // args.repeat
+            nodes = sum(stats['nodes'].values()) // args.repeat
+            print(f"{name:15s} latency {latency:4.2f} s  {elapsed:7.3f} s/request  {round_trips:3d} round-trips  {nodes:5d} nodes")
+
+
+if __name__ == '__main__':
+    main()
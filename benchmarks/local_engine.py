@@ -0,0 +1,67 @@
+"""Throughput of the local NumPy threshold-based classification on synthetic Sentinel-1 stacks.
+
+Each stack holds one VV/VH image every 6 days over a year, saved to a temporary .npy file and
+memory-mapped, and is classified with two seasons on a single process and on a process pool.
+
+Usage:
+    python -m benchmarks.local_engine [--sizes 256 512 1024 2048] [--tile-size 512] [--workers N]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from service.local_engine import RasterStack, run_threshold_based_classification, to_millis
+
+FILTERS = {
+    'dataset': {
+        'name': 'COPERNICUS/S1_GRD',
+        'feature': 'VH',
+        'ascd': True,
+        'desc': True,
+        'composite': 'median',
+        'composite_days': 12,
+    },
+    'op': 'and',
+    'seasons': [
+        {'name': 'sowing', 'start': '2021-06-01', 'end': '2021-08-01', 'min': -30, 'max': -18},
+        {'name': 'peak', 'start': '2021-08-01', 'end': '2021-10-15', 'min': -18, 'max': -10},
+    ],
+}
+
+
+def make_stack(directory, size, seed=0):
+    rng = np.random.default_rng(seed)
+    timestamps = [to_millis('2021-01-01') + i * 6 * 86400000 for i in range(61)]
+    data = rng.normal(-15, 4, (len(timestamps), 2, size, size)).astype(np.float32)
+    path = os.path.join(directory, f'stack_{size}.npy')
+    np.save(path, data)
+    return RasterStack.from_npy(path, ['VV', 'VH'], timestamps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 512, 1024, 2048])
+    parser.add_argument('--tile-size', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            stack = make_stack(directory, size)
+            megapixels = size * size * len(stack) / 1e6
+            timings = {}
+            for workers in (1, args.workers):
+                start = time.perf_counter()
+                res, _ = run_threshold_based_classification(FILTERS, stack, tile_size=args.tile_size, workers=workers)
+                timings[workers] = time.perf_counter() - start
+            print(f"{size:5d} x {size:<5d} x {len(stack)} images  "
+                  f"1 process {timings[1]:7.2f} s ({megapixels / timings[1]:7.1f} Mpx/s)  "
+                  f"{args.workers} processes {timings[args.workers]:7.2f} s ({megapixels / timings[args.workers]:7.1f} Mpx/s)  "
+                  f"rice {np.nanmean(res):.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Time and memory of writing a local export, from synthetic GeoTIFF tiles.
+
+Splits the bounding box of ``--bounds`` into tiles with service.local_export.plan_tiles(), encodes
+a random classification of every tile as a GeoTIFF, one pixel larger than asked like the downloads
+of getDownloadURL, and writes them with write_mosaic(). The written file is read back and compared
+with the classification. Needs rasterio, but neither Earth Engine nor the network.
+
+Usage:
+    python -m benchmarks.local_export [--bounds 84.2 27.4 84.9 27.8] [--scale 30] [--tile-size 2048]
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+from service.conversion import METERS_PER_DEGREE
+from service.local_export import NODATA, plan_tiles, write_mosaic
+
+
+def encode_tile(data):
+    from rasterio.io import MemoryFile
+
+    with MemoryFile() as memfile:
+        with memfile.open(driver='GTiff', width=data.shape[1], height=data.shape[0], count=1, dtype='uint8') as dst:
+            dst.write(data, 1)
+        return memfile.read()
+
+
+def make_tiles(expected, tiles):
+    for row, col, height, width in tiles:
+        data = np.full((height + 1, width + 1), NODATA, 'uint8')
+        data[:height, :width] = expected[row:row + height, col:col + width]
+        yield (row, col, height, width), encode_tile(data)
+
+
+def main():
+    import warnings
+    import rasterio
+    from rasterio.errors import NotGeoreferencedWarning
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bounds', type=float, nargs=4, default=[84.2, 27.4, 84.9, 27.8], metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'))
+    parser.add_argument('--scale', type=float, default=30, help="pixel size in meters")
+    parser.add_argument('--tile-size', type=int, default=2048)
+    args = parser.parse_args()
+
+    # the synthetic tiles are not georeferenced, like the mosaic windows they are written to
+    warnings.simplefilter('ignore', NotGeoreferencedWarning)
+    width, height, transform, tiles = plan_tiles(args.bounds, args.scale / METERS_PER_DEGREE, args.tile_size)
+    rng = np.random.default_rng(0)
+    expected = rng.integers(0, 2, (height, width), dtype='uint8')
+    expected[rng.random(expected.shape) < 0.1] = NODATA
+    print(f"{width} x {height} pixels in {len(tiles)} tiles")
+
+    path = os.path.join(tempfile.mkdtemp(), 'mosaic.tif')
+    start = time.perf_counter()
+    write_mosaic(path, width, height, transform, make_tiles(expected, tiles), len(tiles))
+    seconds = time.perf_counter() - start
+    with rasterio.open(path) as src:
+        identical = np.array_equal(src.read(1), expected)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"written in {seconds:.2f} s, {os.path.getsize(path) / 1024:.1f} KiB, peak RSS {peak:.1f} MiB, "
+          f"{'identical to' if identical else 'DIFFERENT from'} the classification")
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
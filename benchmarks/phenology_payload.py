@@ -0,0 +1,61 @@
+"""Payload size and serialization time of the phenology response formats.
+
+Builds a synthetic get_phenology() result, i.e. a GeoJSON FeatureCollection with one
+"<timestamp>_feature" property per composite, and compares it with the columnar formats
+of service.serialization.phenology_to_columnar().
+
+Usage:
+    python -m benchmarks.phenology_payload [--samples 1000] [--composites 36] [--nodata 0.1]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from service.serialization import NODATA, phenology_to_columnar
+
+
+def make_feature_collection(n_samples, n_composites, nodata_ratio, seed=0):
+    rng = np.random.default_rng(seed)
+    timestamps = 1577836800000 + np.arange(n_composites) * 12 * 86400000
+    values = rng.uniform(-0.2, 0.9, (n_samples, n_composites))
+    values[rng.random(values.shape) < nodata_ratio] = NODATA
+    features = []
+    for i in range(n_samples):
+        props = {f'{j}_{t}_feature': float(v) for j, (t, v) in enumerate(zip(timestamps, values[i]))}
+        props['class'] = int(rng.integers(0, 2))
+        geometry = {'type': 'Point', 'coordinates': [float(84 + rng.random()), float(27 + rng.random())]}
+        features.append({'type': 'Feature', 'geometry': geometry, 'id': str(i), 'properties': props})
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def measure(label, func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        payload = func()
+    serialize = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        json.loads(payload)
+    parse = (time.perf_counter() - start) / repeat
+    print(f"{label:18s} {len(payload) / 1024:10.1f} KiB  serialize {serialize * 1000:8.1f} ms  parse {parse * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--composites', type=int, default=36)
+    parser.add_argument('--nodata', type=float, default=0.1, help="ratio of missing values")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    fc = make_feature_collection(args.samples, args.composites, args.nodata)
+    print(f"{args.samples} samples x {args.composites} composites")
+    measure('geojson', lambda: json.dumps(fc), args.repeat)
+    measure('columnar json', lambda: json.dumps(phenology_to_columnar(fc, 'json')), args.repeat)
+    measure('columnar base64', lambda: json.dumps(phenology_to_columnar(fc, 'base64')), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Latency of make_empirical_results and make_classification_results with a fake Earth Engine client.
+
+Every round-trip (getInfo, getMapId, getThumbURL) of the fake client sleeps for a fixed delay,
+so the wall time shows whether the calls add up or overlap.
+
+Usage:
+    python -m benchmarks.results_concurrency [--delay 0.5] [--repeat 3]
+"""
+import argparse
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'riceexplorer.settings')
+
+
+class _Info(dict):
+    def __missing__(self, key):
+        return 0
+
+
+class FakeNode:
+    """Stand-in for any Earth Engine object: every attribute and call returns the node itself."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __getattr__(self, name):
+        if name in ('getInfo', 'getMapId', 'getThumbURL'):
+            return lambda *args, **kwargs: self._client.round_trip(name)
+        return self
+
+
+class FakeEE:
+    """Fake ``ee`` module whose round-trips sleep for ``delay`` seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def round_trip(self, name):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if name == 'getMapId':
+            return {'tile_fetcher': SimpleNamespace(url_format='https://tiles/{z}/{x}/{y}')}
+        if name == 'getThumbURL':
+            return 'https://thumbnail'
+        return _Info()
+
+    def __getattr__(self, name):
+        return FakeNode(self)
+
+
+def run(delay, repeat):
+    import service.main as service
+    import service.executor as executor
+
+    fake_ee = FakeEE(delay)
+    service.ee = fake_ee
+    img, boundary = FakeNode(fake_ee), FakeNode(fake_ee)
+
+    for label, workers in (('sequential', 1), ('concurrent', 8)):
+        executor._executor = None
+        from django.conf import settings
+        settings.EE_MAX_CONCURRENT_CALLS = workers
+        for name, func, args in (
+            ('make_empirical_results', service.make_empirical_results, (img, boundary, 10)),
+            ('make_classification_results', service.make_classification_results, (img, boundary, 10, FakeNode(fake_ee))),
+        ):
+            fake_ee.calls = 0
+            start = time.perf_counter()
+            for _ in range(repeat):
+                func(*args)
+            elapsed = (time.perf_counter() - start) / repeat
+            print(f"{name:28s} {label:10s} {fake_ee.calls // repeat} round-trips  {elapsed:.3f} s/request")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--delay', type=float, default=0.5, help="seconds per round-trip")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.delay, args.repeat)
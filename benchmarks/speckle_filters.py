@@ -0,0 +1,57 @@
+"""Throughput of the NumPy speckle filters on synthetic Sentinel-1 images, in megapixels per second.
+
+Each image holds VV and VH bands of gamma-distributed speckle in dB, and is filtered in tiles on a
+single process and on a process pool.
+
+Usage:
+    python -m benchmarks.speckle_filters [--sizes 512 1024 2048] [--tile-size 512] [--workers N]
+"""
+import argparse
+import os
+import time
+from functools import partial
+
+import numpy as np
+
+from service.local_speckle_filters import boxcar, filter_tiles, refined_lee
+
+FILTERS = {
+    'boxcar median': partial(boxcar, reducer='median'),
+    'boxcar mean': partial(boxcar, reducer='mean'),
+    'refined lee': refined_lee,
+}
+
+
+def make_image(size, seed=0):
+    rng = np.random.default_rng(seed)
+    # 4-look speckle over a smooth backscatter
+    backscatter = np.power(10, rng.normal(-15, 3, (2, size, size)) / 10)
+    speckle = rng.gamma(4, 1 / 4, (2, size, size))
+    return (10 * np.log10(backscatter * speckle)).astype(np.float32)
+
+
+def run(filter_func, img, tile_size, workers):
+    start = time.perf_counter()
+    filter_tiles(filter_func, img, tile_size, workers)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[512, 1024, 2048])
+    parser.add_argument('--tile-size', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    print(f"{'filter':<15} {'size':>6} {'1 process':>12} {f'{args.workers} processes':>14}")
+    for size in args.sizes:
+        img = make_image(size)
+        megapixels = img.size / 1e6
+        for name, filter_func in FILTERS.items():
+            single = run(filter_func, img, args.tile_size, 1)
+            pool = run(filter_func, img, args.tile_size, args.workers)
+            print(f"{name:<15} {size:>6} {megapixels / single:>8.1f} Mpx/s {megapixels / pool:>8.1f} Mpx/s")
+
+
+if __name__ == '__main__':
+    main()
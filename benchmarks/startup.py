@@ -0,0 +1,134 @@
+"""Time to the first served request and memory of every worker process, spawned or forked.
+
+Spawned workers start a new interpreter and load the app themselves, like gunicorn without
+preload. Forked workers are forked from a process that has loaded the app and called
+service.ee_client.prepare_fork(), like gunicorn with the settings of gunicorn.conf.py. Each
+worker serves one request to ``--path`` through the WSGI application and reports the time since
+it was started, its resident memory, and the memory that is its own (not shared with the parent).
+
+The Earth Engine backend is the emulator unless ``--backend earthengine`` is given, which needs
+the credentials of the .env file; the time to the first request then includes the initialization.
+
+Usage:
+    python -m benchmarks.startup [--workers 4] [--path /tasks/] [--backend emulator]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'riceexplorer.settings')
+
+
+def memory():
+    """Resident and private memory of this process in MiB, from /proc"""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return fields.get('Rss', 0) / 1024, (fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)) / 1024
+
+
+def serve(application, path):
+    from wsgiref.util import setup_testing_defaults
+
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET'}
+    setup_testing_defaults(environ)
+    status = []
+    body = application(environ, lambda s, headers, exc_info=None: status.append(s))
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return status[0]
+
+
+def load_app():
+    from riceexplorer.wsgi import application
+    return application
+
+
+def report(start, status):
+    rss, private = memory()
+    return {'seconds': time.time() - start, 'status': status, 'rss': rss, 'private': private}
+
+
+def child(path, start):
+    # a spawned worker
+    print(json.dumps(report(start, serve(load_app(), path))))
+
+
+def spawned(path, workers):
+    results = []
+    for _ in range(workers):
+        start = time.time()
+        out = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--child', path, '--start', repr(start)],
+                             check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+
+def forked(path, workers):
+    from service.ee_client import prepare_fork
+
+    start = time.time()
+    application = load_app()
+    prepare_fork()
+    print(f"parent loaded the app in {time.time() - start:.2f} s")
+
+    results = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        start = time.time()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                data = json.dumps(report(start, serve(application, path))).encode()
+            except Exception as e:
+                data = json.dumps({'error': repr(e)}).encode()
+            os.write(write_fd, data)
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as f:
+            results.append(json.loads(f.read()))
+        os.waitpid(pid, 0)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--path', default='/tasks/')
+    parser.add_argument('--backend', choices=['emulator', 'earthengine'], default='emulator')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--start', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.start)
+        return
+
+    os.environ['EE_BACKEND'] = args.backend
+    results = {'spawned': spawned(args.path, args.workers)}
+    import django
+    django.setup()
+    results['forked'] = forked(args.path, args.workers)
+
+    for mode, workers in results.items():
+        for i, res in enumerate(workers):
+            if 'error' in res:
+                print(f"{mode:8s} worker {i}  {res['error']}")
+                continue
+            print(f"{mode:8s} worker {i}  first request {res['seconds']:6.3f} s ({res['status']})  "
+                  f"RSS {res['rss']:6.1f} MiB  private {res['private']:6.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
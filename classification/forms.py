@@ -4,4 +4,6 @@ class PostForm(forms.Form):
     json = forms.FileField(required=True)
     boundary_file = forms.FileField(required=False)
     samples = forms.FileField(required=True)
+    # export of the results: a Drive export task, or tiles downloaded into a local GeoTIFF
+    mode = forms.ChoiceField(choices=[('drive', 'drive'), ('local', 'local')], required=False)
     
\ No newline at end of file
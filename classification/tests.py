@@ -1,3 +1,24 @@
-from django.test import TestCase
+import copy
 
-# Create your tests here.
+from service import main
+from service.testing import CLASSIFICATION_FILTERS, EmulatorTestCase, make_samples
+
+
+class ClassificationRoundTripTest(EmulatorTestCase):
+    """Requests of the supervised classification: more requests or larger graphs are a performance regression"""
+
+    def classify(self, samples):
+        res = main.run_supervised_classification(copy.deepcopy(CLASSIFICATION_FILTERS), copy.deepcopy(samples))
+        return main.make_classification_results(*res)
+
+    def test_classification(self):
+        samples = make_samples(80)
+        self.classify(samples)
+        # the training table, then the confusion matrix, tiles and thumbnail
+        self.assertEqual(self.round_trips(), {'getInfo': 2, 'getMapId': 1, 'getThumbURL': 1})
+        self.assertLessEqual(self.nodes(), 549)
+
+        # the training table of the same samples is reused
+        self.ee.reset_stats()
+        self.classify(samples)
+        self.assertEqual(self.round_trips(), {'getInfo': 1, 'getMapId': 1, 'getThumbURL': 1})
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
@@ -5,6 +6,9 @@ from . import views
 app_name = 'classification'
 
 urlpatterns = [
-    path('', views.handle_run_classification, name="run_supervised_classification"),
-    path('export', views.handle_export_classification, name='export_classification')
+    path('', views.handle_run_classification_async if settings.ASYNC_VIEWS else views.handle_run_classification, name="run_supervised_classification"),
+    path('export', views.handle_export_classification_async if settings.ASYNC_VIEWS else views.handle_export_classification, name='export_classification'),
+    path('jobs', views.submit_classification_job_async if settings.ASYNC_VIEWS else views.submit_classification_job, name='submit_classification_job'),
+    path('years', views.handle_run_multi_year_classification_async if settings.ASYNC_VIEWS else views.handle_run_multi_year_classification, name='run_multi_year_classification'),
+    path('sweep', views.handle_run_classification_sweep_async if settings.ASYNC_VIEWS else views.handle_run_classification_sweep, name='run_classification_sweep'),
 ]
\ No newline at end of file
@@ -1,15 +1,21 @@
 import json
 from django.core.exceptions import BadRequest
-from django.http.response import HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse
+from django.core.files.base import ContentFile
+from django.http.response import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
 
 from classification.forms import PostForm
 
 import service.main as service
+from service.executor import async_view
+from service.jobs import JobQueueFull
+from service.metrics import observe_view, record_error
+from service.tracing import stage
 
 
 @csrf_exempt
+@observe_view('handle_run_classification')
 def handle_run_classification(request):
     if request.method == "POST":
         form = PostForm(request.POST, request.FILES)
@@ -22,11 +28,14 @@ def handle_run_classification(request):
                 return HttpResponseBadRequest('No ground truth samples provided.')
 
             try:
-                img, boundary, scale, confusion_matrix = service.run_supervised_classification(
-                    filters, json.load(request.FILES['samples']))
+                with stage('parse'):
+                    samples = json.load(request.FILES['samples'])
+                img, boundary, scale, confusion_matrix = service.run_supervised_classification(filters, samples)
                 res = service.make_classification_results(img, boundary, scale, confusion_matrix)
-                return JsonResponse(res)
+                with stage('serialize'):
+                    return JsonResponse(res)
             except Exception as e:
+                record_error('handle_run_classification', e)
                 return HttpResponseBadRequest(e)
 
         else:
@@ -35,26 +44,136 @@ def handle_run_classification(request):
         return HttpResponseNotAllowed(["GET"])
 
 @csrf_exempt
+@observe_view('handle_export_classification')
 def handle_export_classification(request):
     if request.method == "POST":
         form = PostForm(request.POST, request.FILES)
         if form.is_valid():
             filters = json.load(request.FILES['json'])
+            local = form.cleaned_data['mode'] == 'local'
             if 'boundary_file' in request.FILES:
-                filters['dataset']['boundary_file'] = request.FILES['boundary_file']
+                boundary_file = request.FILES['boundary_file']
+                if local:
+                    # the upload is closed when the request ends, keep its content for the job
+                    boundary_file = ContentFile(boundary_file.read(), name=boundary_file.name)
+                filters['dataset']['boundary_file'] = boundary_file
 
             if 'samples' not in request.FILES:
                 return HttpResponseBadRequest('No ground truth samples provided.')
 
             try:
-                img, boundary, scale, confusion_matrix = service.run_supervised_classification(
-                    filters, json.load(request.FILES['samples']))
-                taskId = service.export_result(img, boundary, scale)
+                samples = json.load(request.FILES['samples'])
+                if local:
+                    # reported by tasks/<id> like an export task
+                    taskId = service.submit_local_export(filters, samples).id
+                else:
+                    img, boundary, scale, confusion_matrix = service.run_supervised_classification(filters, samples)
+                    taskId = service.export_result(img, boundary, scale)
                 return JsonResponse(taskId, safe=False)
+            except JobQueueFull as e:
+                return HttpResponse(e, status=503)
+            except Exception as e:
+                record_error('handle_export_classification', e)
+                return HttpResponseBadRequest(e)
+
+        else:
+            return HttpResponseBadRequest("Form is invalid, please check if all parameters are set.")
+    else:
+        return HttpResponseNotAllowed(["GET"])
+
+@csrf_exempt
+@observe_view('submit_classification_job')
+def submit_classification_job(request):
+    if request.method == "POST":
+        form = PostForm(request.POST, request.FILES)
+        if form.is_valid():
+            filters = json.load(request.FILES['json'])
+            if 'boundary_file' in request.FILES:
+                # the upload is closed when the request ends, keep its content for the job
+                boundary_file = request.FILES['boundary_file']
+                filters['dataset']['boundary_file'] = ContentFile(boundary_file.read(), name=boundary_file.name)
+
+            if 'samples' not in request.FILES:
+                return HttpResponseBadRequest('No ground truth samples provided.')
+
+            try:
+                job = service.submit_classification_job(filters, json.load(request.FILES['samples']))
+                return JsonResponse(job.id, safe=False)
+            except JobQueueFull as e:
+                return HttpResponse(e, status=503)
             except Exception as e:
+                record_error('submit_classification_job', e)
                 return HttpResponseBadRequest(e)
 
         else:
             return HttpResponseBadRequest("Form is invalid, please check if all parameters are set.")
     else:
-        return HttpResponseNotAllowed(["GET"])
\ No newline at end of file
+        return HttpResponseNotAllowed(["GET"])
+
+@csrf_exempt
+@observe_view('handle_run_multi_year_classification')
+def handle_run_multi_year_classification(request):
+    if request.method == "POST":
+        form = PostForm(request.POST, request.FILES)
+        if form.is_valid():
+            # the filters of handle_run_classification, with the list of 'years' to shift the period to
+            filters = json.load(request.FILES['json'])
+            if 'boundary_file' in request.FILES:
+                filters['dataset']['boundary_file'] = request.FILES['boundary_file']
+
+            if 'samples' not in request.FILES:
+                return HttpResponseBadRequest('No ground truth samples provided.')
+
+            try:
+                with stage('parse'):
+                    samples = json.load(request.FILES['samples'])
+                results, boundary, scale = service.run_multi_year_supervised_classification(filters, samples)
+                res = service.make_multi_year_classification_results(results, boundary, scale)
+                with stage('serialize'):
+                    return JsonResponse(res)
+            except Exception as e:
+                record_error('handle_run_multi_year_classification', e)
+                return HttpResponseBadRequest(e)
+
+        else:
+            return HttpResponseBadRequest("Form is invalid, please check if all parameters are set.")
+    else:
+        return HttpResponseNotAllowed(["GET"])
+
+@csrf_exempt
+@observe_view('handle_run_classification_sweep')
+def handle_run_classification_sweep(request):
+    if request.method == "POST":
+        form = PostForm(request.POST, request.FILES)
+        if form.is_valid():
+            # the filters of handle_run_classification, with the models and specs to compare under 'sweep'
+            filters = json.load(request.FILES['json'])
+            if 'boundary_file' in request.FILES:
+                filters['dataset']['boundary_file'] = request.FILES['boundary_file']
+
+            if 'samples' not in request.FILES:
+                return HttpResponseBadRequest('No ground truth samples provided.')
+
+            try:
+                with stage('parse'):
+                    samples = json.load(request.FILES['samples'])
+                sweep = service.run_classification_sweep(filters, samples)
+                res = service.make_sweep_results(filters, *sweep)
+                with stage('serialize'):
+                    return JsonResponse(res)
+            except Exception as e:
+                record_error('handle_run_classification_sweep', e)
+                return HttpResponseBadRequest(e)
+
+        else:
+            return HttpResponseBadRequest("Form is invalid, please check if all parameters are set.")
+    else:
+        return HttpResponseNotAllowed(["GET"])
+
+
+# async versions for the ASGI entry point, see the ASYNC_VIEWS setting
+handle_run_classification_async = async_view(handle_run_classification)
+handle_export_classification_async = async_view(handle_export_classification)
+submit_classification_job_async = async_view(submit_classification_job)
+handle_run_multi_year_classification_async = async_view(handle_run_multi_year_classification)
+handle_run_classification_sweep_async = async_view(handle_run_classification_sweep)
\ No newline at end of file
@@ -2,4 +2,6 @@ from django import forms
 
 class PostForm(forms.Form):
     json = forms.FileField(required=True)
-    boundary_file = forms.FileField(required=False)
\ No newline at end of file
+    boundary_file = forms.FileField(required=False)
+    # export of the results: a Drive export task, or tiles downloaded into a local GeoTIFF
+    mode = forms.ChoiceField(choices=[('drive', 'drive'), ('local', 'local')], required=False)
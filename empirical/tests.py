@@ -1,3 +1,423 @@
+import copy
+import json
+import math
+import threading
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import numpy as np
 from django.test import TestCase
 
-# Create your tests here.
+from service import local_engine, main
+from service.data_processing import compute_feature
+from service.local_export import NODATA, fetch_tile, plan_tiles, tile_download_params, write_mosaic
+from service.local_speckle_filters import boxcar, filter_tiles, refined_lee
+from service.dates import to_millis
+from service.testing import DATASET, THRESHOLD_FILTERS, EmulatorTestCase, server_side_make_composite
+
+
+class TileServer(ThreadingHTTPServer):
+    """Stands for the download urls of Earth Engine: serves the tiles of a raster as GeoTIFF
+
+    The tile is read from the ``crs_transform`` and ``dimensions`` parameters of the url, see
+    tile_download_params(), and has one more row and column than asked, outside the raster.
+    The first ``failures`` requests of every url are answered with a 503.
+    """
+
+    def __init__(self, raster, transform, failures=0):
+        super().__init__(('127.0.0.1', 0), TileHandler)
+        self.raster = raster
+        self.transform = transform
+        self.failures = failures
+        self.requests = {}
+
+    def url(self, tile):
+        return f"http://127.0.0.1:{self.server_port}/download?{urlencode(tile_download_params(self.transform, tile))}"
+
+
+class TileHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        from rasterio.io import MemoryFile
+
+        url = urlparse(self.path)
+        count = self.server.requests[self.path] = self.server.requests.get(self.path, 0) + 1
+        if url.path != '/download':
+            return self.send_error(404)
+        if count <= self.server.failures:
+            return self.send_error(503)
+        params = parse_qs(url.query)
+        x_scale, _, west, _, y_scale, north = json.loads(params['crs_transform'][0])
+        width, height = map(int, params['dimensions'][0].split('x'))
+        col = round((west - self.server.transform[2]) / x_scale)
+        row = round((north - self.server.transform[5]) / y_scale)
+        data = np.full((height + 1, width + 1), NODATA, dtype=np.uint8)
+        data[:height, :width] = self.server.raster[row:row + height, col:col + width]
+        with MemoryFile() as memfile:
+            with memfile.open(driver='GTiff', width=width + 1, height=height + 1, count=1, dtype='uint8') as dst:
+                dst.write(data, 1)
+            content = memfile.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/tiff')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalExportTest(TestCase):
+
+    def setUp(self):
+        self.width, self.height, self.transform, self.tiles = plan_tiles((84, 27, 90, 30), 0.01, tile_size=256)
+        rng = np.random.default_rng(0)
+        self.raster = rng.integers(0, 2, (self.height, self.width), dtype=np.uint8)
+        self.raster[rng.random(self.raster.shape) < 0.1] = NODATA
+
+    def serve(self, failures=0):
+        server = TileServer(self.raster, self.transform, failures)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_fetch_tile_retries_server_errors(self):
+        import requests
+
+        server = self.serve(failures=2)
+        url = server.url(self.tiles[0])
+        self.assertTrue(fetch_tile(url, retries=2, backoff=0).startswith(b'II*\x00'))
+        self.assertEqual(server.requests[urlparse(url)._replace(scheme='', netloc='').geturl()], 3)
+
+        url = server.url(self.tiles[1])
+        with self.assertRaises(requests.HTTPError):
+            fetch_tile(url, retries=1, backoff=0)
+
+    def test_fetch_tile_does_not_retry_client_errors(self):
+        import requests
+
+        server = self.serve()
+        with self.assertRaises(requests.HTTPError):
+            fetch_tile(f"http://127.0.0.1:{server.server_port}/missing", retries=3, backoff=0)
+        self.assertEqual(server.requests['/missing'], 1)
+
+    def test_write_mosaic_places_tiles(self):
+        import os
+        import tempfile
+        import rasterio
+        from rasterio.transform import Affine
+
+        self.assertEqual((self.width, self.height, len(self.tiles)), (600, 300, 6))
+        server = self.serve(failures=1)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'mosaic.tif')
+        progress = []
+        # in the order of the downloads, not of the grid
+        tiles = ((tile, fetch_tile(server.url(tile), backoff=0)) for tile in reversed(self.tiles))
+        write_mosaic(path, self.width, self.height, self.transform, tiles, len(self.tiles), lambda *args: progress.append(args))
+
+        with rasterio.open(path) as src:
+            np.testing.assert_array_equal(src.read(1), self.raster)
+            self.assertEqual(src.transform, Affine(*self.transform))
+            self.assertEqual(src.nodata, NODATA)
+        self.assertEqual(progress[-1], (1.0, "6 of 6 tiles written"))
+        self.assertFalse(os.path.exists(path + '.part'))
+
+
+class ThresholdRoundTripTest(EmulatorTestCase):
+    """Requests of the threshold-based pipelines: more requests or larger graphs are a performance regression"""
+
+    def test_threshold(self):
+        main.get_threshold_results(copy.deepcopy(THRESHOLD_FILTERS))
+        self.assertEqual(self.round_trips(), {'getInfo': 1, 'getMapId': 1, 'getThumbURL': 1})
+        self.assertLessEqual(self.nodes(), 302)
+
+        # an identical request is answered from the result cache
+        self.ee.reset_stats()
+        main.get_threshold_results(copy.deepcopy(THRESHOLD_FILTERS))
+        self.assertEqual(self.round_trips(), {})
+
+    def test_districts(self):
+        filters = {**copy.deepcopy(THRESHOLD_FILTERS), 'districts': ['CHITAWAN', 'DANG', 'KAILALI']}
+        res = main.get_batch_threshold_results(filters)
+        self.assertEqual(set(res['districts']), {'CHITAWAN', 'DANG', 'KAILALI'})
+        # the areas of all districts in one request
+        self.assertEqual(self.round_trips(), {'getInfo': 1})
+        self.assertLessEqual(self.nodes(), 149)
+
+        # the tiles of a district on demand
+        self.ee.reset_stats()
+        main.get_batch_district_tiles(filters, 'DANG')
+        self.assertEqual(self.round_trips(), {'getMapId': 1})
+
+    def test_years(self):
+        filters = {**copy.deepcopy(THRESHOLD_FILTERS), 'years': list(range(2017, 2022))}
+        res = main.get_multi_year_threshold_results(filters)
+        self.assertEqual(len(res['years']), 5)
+        # the areas of all years in one request
+        self.assertEqual(self.round_trips(), {'getInfo': 1})
+        self.assertLessEqual(self.nodes(), 414)
+
+
+class ReduceImagesTest(TestCase):
+
+    def test_mode(self):
+        nan = np.nan
+        data = np.array([
+            [[1, 2, nan, nan, 5]],
+            [[3, 2, nan, 4, 5]],
+            [[3, 1, nan, nan, 6]],
+            [[1, 1, nan, nan, 6]],
+        ], dtype=np.float32)
+        # the smallest value on ties, NaN only where all values are NaN
+        np.testing.assert_array_equal(local_engine.reduce_images(data, 'mode'), [[1, 1, nan, 4, 5]])
+
+
+class MakeCompositeTest(EmulatorTestCase):
+    """make_composite() against the server-side planner it replaced; the images of the emulator are 6 days apart, at midnight"""
+
+    def composites(self, make_composite, *args, **kwargs):
+        pool = compute_feature(DATASET['name'], self.ee.ImageCollection(DATASET['name']), 'VH')
+        images = self.ee.evaluate(make_composite(pool, *args, **kwargs))
+        return [int(props['system:time_start']) for props, _ in images], [image['feature'] for _, image in images]
+
+    def assertSameComposites(self, *args, **kwargs):
+        timestamps, values = self.composites(main.make_composite, *args, **kwargs)
+        expected_timestamps, expected_values = self.composites(server_side_make_composite, *args, **kwargs)
+        self.assertEqual(timestamps, expected_timestamps)
+        for res, expected in zip(values, expected_values):
+            np.testing.assert_array_equal(res, expected)
+        return timestamps, values
+
+    def test_methods(self):
+        for method in ('median', 'mean', 'minimum', 'maximum', 'mode'):
+            with self.subTest(method=method):
+                timestamps, _ = self.assertSameComposites('2021-06-01', '2021-08-01', 12, method=method)
+                self.assertEqual(len(timestamps), 5)
+
+    def test_empty_windows(self):
+        # windows of 2 days, 2 of every 3 without images
+        timestamps, _ = self.assertSameComposites('2021-06-01', '2021-07-01', 2)
+        self.assertEqual(len(timestamps), 5)
+        # no image at all
+        self.assertEqual(self.assertSameComposites('2014-01-01', '2014-02-01', 12), ([], []))
+
+    def test_end_on_window_boundary(self):
+        # ee.List.sequence() includes the end, the empty window starting there is dropped
+        timestamps, _ = self.assertSameComposites('2021-06-01', '2021-07-01', 10)
+        self.assertEqual(timestamps, [to_millis(date) for date in ('2021-06-01', '2021-06-11', '2021-06-21')])
+
+    def test_truncated_last_window(self):
+        # the last window, from July 19, is cut at July 28 and leaves out the image of that day
+        timestamps, values = self.assertSameComposites('2021-06-01', '2021-07-28', 12)
+        self.assertEqual(timestamps[-1], to_millis('2021-07-19'))
+        image = self.ee.evaluate(compute_feature(DATASET['name'], self.ee.ImageCollection(DATASET['name']), 'VH')
+                                 .filterDate('2021-07-22', '2021-07-23'))
+        np.testing.assert_array_equal(values[-1], image[0][1]['feature'])
+
+
+class LocalEngineTest(EmulatorTestCase):
+    """service.local_engine against the Earth Engine pipelines, on the images of the emulator
+
+    The emulator reduces collections and neighborhoods with the functions of the local engine, so
+    these tests cover the pipelines around them: dates, windows, features, thresholds and masks.
+    """
+
+    # fine enough for rice fields in the boundary
+    emulator_options = {'width': 384, 'height': 160, 'latency': 0}
+
+    def stack(self, start_date, end_date):
+        images = self.ee.evaluate(self.ee.ImageCollection(DATASET['name']).filterDate(start_date, end_date))
+        bands = list(images[0][1])
+        return local_engine.RasterStack(np.stack([[image[b] for b in bands] for _, image in images]), bands,
+                                        [props['system:time_start'] for props, _ in images],
+                                        [props for props, _ in images])
+
+    def evaluate_stack(self, collection):
+        images = self.ee.evaluate(collection)
+        return [props['system:time_start'] for props, _ in images], np.stack([image['feature'] for _, image in images])
+
+    def test_compute_feature(self):
+        stack = self.stack('2021-06-01', '2021-07-01')
+        pool = self.ee.ImageCollection(DATASET['name']).filterDate('2021-06-01', '2021-07-01')
+        for feature in ('VH', 'VV', 'VH/VV'):
+            with self.subTest(feature=feature):
+                timestamps, expected = self.evaluate_stack(compute_feature(DATASET['name'], pool, feature))
+                res = local_engine.compute_feature(DATASET['name'], stack, feature)
+                self.assertEqual(res.timestamps.tolist(), timestamps)
+                np.testing.assert_allclose(res.data[:, 0], expected, rtol=1e-6)
+
+        # the ratio of the bands in dB, not of the backscatter, like the expression of map_radar()
+        res = local_engine.compute_feature(DATASET['name'], stack, 'VH/VV')
+        np.testing.assert_allclose(res.data[:, 0], stack.select('VH') / stack.select('VV'), rtol=1e-6)
+        self.assertTrue((res.data > 0).all())
+
+    def test_make_composite(self):
+        stack = local_engine.compute_feature(DATASET['name'], self.stack('2021-05-01', '2021-09-01'), 'VH')
+        pool = compute_feature(DATASET['name'], self.ee.ImageCollection(DATASET['name']), 'VH')
+        for method in ('median', 'mean', 'minimum', 'maximum', 'mode'):
+            with self.subTest(method=method):
+                timestamps, expected = self.evaluate_stack(main.make_composite(pool, '2021-06-01', '2021-08-01', 12, method))
+                res = local_engine.make_composite(stack, '2021-06-01', '2021-08-01', 12, method)
+                self.assertEqual(res.timestamps.tolist(), timestamps)
+                np.testing.assert_allclose(res.data[:, 0], expected, rtol=1e-6)
+
+    def test_threshold(self):
+        filters = copy.deepcopy(THRESHOLD_FILTERS)
+        img, _, scale = main.run_threshold_based_classification(filters)
+        expected = self.ee.evaluate(img)['feature']
+        res, local_scale = local_engine.run_threshold_based_classification(
+            filters, self.stack('2021-05-01', '2021-11-01'), tile_size=32, workers=1)
+
+        self.assertEqual(local_scale, scale)
+        # Earth Engine clips the result to the boundary, the local stack is the whole grid
+        inside = ~np.isnan(expected)
+        self.assertTrue(inside.any() and (~inside).any())
+        np.testing.assert_array_equal(res[inside], expected[inside])
+        self.assertTrue(0 < np.nanmean(expected) < 1)
+
+    def test_compute_hectare_area(self):
+        img, boundary, scale = main.run_threshold_based_classification(copy.deepcopy(THRESHOLD_FILTERS))
+        expected = self.ee.evaluate(main.compute_hectare_area(img, 'feature', boundary.geometry(), scale))
+        res = self.ee.evaluate(img)['feature']
+
+        # the pixels of the emulator are degrees wide, whatever the scale
+        area = local_engine.compute_hectare_area(res, scale, self.ee.grid_transform())
+        self.assertAlmostEqual(area / expected, 1, places=2)
+
+
+# Per-pixel transcription of the graph of service.speckle_filters.refined_lee(), with the semantics of
+# Earth Engine: neighborhoods skip masked pixels and pixels outside the image, reduceNeighborhood()
+# masks the pixels that are masked in its input, operations on a masked band are masked, reduce()
+# skips masked bands, toArray() is masked if any band is, and Image.divide() gives 0 for x / 0.
+# Masked values are None. Variances are population variances, like service.local_speckle_filters.
+
+KERNEL3 = [[1] * 3 for _ in range(3)]
+SAMPLE_KERNEL = [[1 if r % 2 and c % 2 else 0 for c in range(7)] for r in range(7)]
+RECT_KERNEL = [[0] * 7 for _ in range(3)] + [[1] * 7 for _ in range(4)]
+DIAG_KERNEL = [[1 if c <= r else 0 for c in range(7)] for r in range(7)]
+
+
+def rotate(kernel, times):
+    # clockwise by 90 degrees, like ee.Kernel.rotate() with a positive count
+    for _ in range(times):
+        kernel = [[kernel[len(kernel) - 1 - c][r] for c in range(len(kernel))] for r in range(len(kernel))]
+    return kernel
+
+
+DIRECTION_KERNELS = [k for i in range(4) for k in (rotate(RECT_KERNEL, i), rotate(DIAG_KERNEL, i))]
+
+
+def neighbors(img, r, c, kernel):
+    # values under a kernel centered on (r, c), in the row-major order of neighborhoodToBands()
+    h = len(kernel) // 2
+    values = []
+    for i, row in enumerate(kernel):
+        for j, weight in enumerate(row):
+            if weight:
+                inside = 0 <= r + i - h < len(img) and 0 <= c + j - h < len(img[0])
+                values.append(img[r + i - h][c + j - h] if inside else None)
+    return values
+
+
+def reduce_neighborhood(img, kernel, reducer):
+    out = [[None] * len(img[0]) for _ in img]
+    for r in range(len(img)):
+        for c in range(len(img[0])):
+            if img[r][c] is None:
+                continue
+            values = [v for v in neighbors(img, r, c, kernel) if v is not None]
+            mean = sum(values) / len(values)
+            out[r][c] = mean if reducer == 'mean' else sum((v - mean) ** 2 for v in values) / len(values)
+    return out
+
+
+def ee_refined_lee(img_db):
+    """The filtered image in dB, NaN where masked, and the direction of every pixel, 0 where masked"""
+    img = [[None if math.isnan(v) else 10 ** (v / 10) for v in row] for row in img_db.tolist()]
+    mean3, variance3 = reduce_neighborhood(img, KERNEL3, 'mean'), reduce_neighborhood(img, KERNEL3, 'variance')
+    dir_stats = [(reduce_neighborhood(img, k, 'mean'), reduce_neighborhood(img, k, 'variance')) for k in DIRECTION_KERNELS]
+    out = np.full(img_db.shape, np.nan)
+    directions = np.zeros(img_db.shape, dtype=int)
+    pairs = ((1, 7), (6, 2), (3, 5), (0, 8))
+    for r in range(len(img)):
+        for c in range(len(img[0])):
+            m = neighbors(mean3, r, c, SAMPLE_KERNEL)
+            v = neighbors(variance3, r, c, SAMPLE_KERNEL)
+            gradients = [None if m[i] is None or m[j] is None else abs(m[i] - m[j]) for i, j in pairs]
+            if all(g is None for g in gradients):
+                continue
+            max_gradient = max(g for g in gradients if g is not None)
+            bands = [None if None in (m[i], m[4], m[j]) else int(m[i] - m[4] > m[4] - m[j]) * (k + 1)
+                     for k, (i, j) in enumerate(pairs)]
+            bands += [None if bands[k] is None else int(bands[k] == 0) * (k + 5) for k in range(4)]
+            # the direction bands of the maximum gradients
+            selected = [d for k, d in enumerate(bands) if d is not None and gradients[k % 4] == max_gradient]
+            if not selected:
+                continue
+            direction = directions[r, c] = sum(selected)
+            if None in m or None in v or not 1 <= direction <= 8:
+                continue
+            sigmaV = sum(sorted(vk / (mk * mk) for vk, mk in zip(v, m))[:5]) / 5
+            dir_mean, dir_var = (stats[r][c] for stats in dir_stats[direction - 1])
+            X = (dir_var - dir_mean * dir_mean * sigmaV) / (sigmaV + 1)
+            b = X / dir_var if dir_var else 0
+            out[r, c] = 10 * math.log10(dir_mean + b * (img[r][c] - dir_mean))
+    return out, directions
+
+
+class SpeckleFilterTest(TestCase):
+
+    def setUp(self):
+        nan = np.nan
+        self.small = np.array([[1, 2, 3], [4, nan, 6], [7, 8, 9]], dtype=np.float32)
+        # integer dB: the powers and their window sums are exact, so the gradients tie exactly
+        rng = np.random.default_rng(0)
+        self.image = 10 * rng.integers(0, 4, (14, 16)).astype(np.float32)
+        self.image[3:13, 3:14] = 20
+        self.image[rng.random(self.image.shape) < 0.05] = np.nan
+
+    def test_boxcar_median(self):
+        nan = np.nan
+        # pixels outside the image are skipped like masked ones, not counted as NaN or 0
+        expected = [[2, 3, 3], [4, nan, 6], [7, 7, 8]]
+        np.testing.assert_array_equal(boxcar(self.small, radius=1), expected)
+        # the mean of the 2 middle values of an even count
+        np.testing.assert_array_equal(boxcar(np.array([[1, 2], [3, 4]]), radius=1), [[2.5, 2.5], [2.5, 2.5]])
+        np.testing.assert_array_equal(boxcar(np.stack([self.small, self.small + 1]), radius=1),
+                                      [expected, np.add(expected, 1)])
+
+    def test_boxcar_mean(self):
+        nan = np.nan
+        expected = [[7 / 3, 16 / 5, 11 / 3], [22 / 5, nan, 28 / 5], [19 / 3, 34 / 5, 23 / 3]]
+        np.testing.assert_allclose(boxcar(self.small, radius=1, reducer='mean'), expected, rtol=1e-6)
+
+    def test_refined_lee(self):
+        expected, directions = ee_refined_lee(self.image)
+        # ties of 2, 3 and 4 gradients, whose direction bands are summed
+        self.assertTrue({15, 18, 26} <= set(directions.flat))
+        np.testing.assert_allclose(refined_lee(self.image), expected, atol=1e-4)
+
+    def test_refined_lee_masks(self):
+        res = refined_lee(self.image)
+        # sigmaV is masked when a sampled window is centered on a masked pixel
+        for r, c in np.argwhere(np.isnan(self.image)):
+            for dr, dc in ((0, 2), (2, 0), (2, 2), (-2, -2)):
+                if 0 <= r + dr < res.shape[0] and 0 <= c + dc < res.shape[1]:
+                    self.assertTrue(np.isnan(res[r + dr, c + dc]))
+        # in a uniform image the 4 gradients tie everywhere, and the sum of their directions is not a direction
+        self.assertTrue(np.isnan(refined_lee(np.full((9, 9), 20.0))).all())
+
+    def test_filter_tiles_halo(self):
+        rng = np.random.default_rng(1)
+        image = rng.normal(-15, 3, (2, 37, 45)).astype(np.float32)
+        image[rng.random(image.shape) < 0.05] = np.nan
+        for filter_func in (boxcar, partial(boxcar, radius=1, reducer='mean'), refined_lee):
+            expected = np.stack([filter_func(band) for band in image])
+            for workers in (1, 2):
+                with self.subTest(filter_func=filter_func, workers=workers):
+                    res = filter_tiles(filter_func, image, tile_size=8, workers=workers)
+                    np.testing.assert_allclose(res, expected, rtol=1e-6)
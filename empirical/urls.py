@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
@@ -5,6 +6,10 @@ from . import views
 app_name = 'empirical'
 
 urlpatterns = [
-    path('', views.run_algorithm, name="set_params"),
-    path('export', views.handle_export_result, name="export")
+    path('', views.run_algorithm_async if settings.ASYNC_VIEWS else views.run_algorithm, name="set_params"),
+    path('export', views.handle_export_result_async if settings.ASYNC_VIEWS else views.handle_export_result, name="export"),
+    path('jobs', views.submit_algorithm_job_async if settings.ASYNC_VIEWS else views.submit_algorithm_job, name="submit_job"),
+    path('batch', views.run_batch_algorithm_async if settings.ASYNC_VIEWS else views.run_batch_algorithm, name="batch"),
+    path('batch/tiles', views.get_batch_tiles_async if settings.ASYNC_VIEWS else views.get_batch_tiles, name="batch_tiles"),
+    path('years', views.run_multi_year_algorithm_async if settings.ASYNC_VIEWS else views.run_multi_year_algorithm, name="years"),
 ]
\ No newline at end of file
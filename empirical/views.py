@@ -1,4 +1,5 @@
 from django.core.exceptions import BadRequest
+from django.core.files.base import ContentFile
 from django.http.response import HttpResponseBadRequest
 from empirical.forms import PostForm
 from django.http import HttpResponse, JsonResponse, HttpResponseNotAllowed
@@ -6,9 +7,14 @@ from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
 import json
 
 import service.main as service
+from service.executor import async_view
+from service.jobs import JobQueueFull
+from service.metrics import observe_view, record_error
+from service.tracing import stage
 
 
 @csrf_exempt
+@observe_view('run_algorithm')
 def run_algorithm(request):
     if request.method == "POST":
         form = PostForm(request.POST, request.FILES)
@@ -18,10 +24,11 @@ def run_algorithm(request):
                 filters['dataset']['boundary_file'] = request.FILES['boundary_file']
                 
             try:
-                img, boundary, scale = service.run_threshold_based_classification(filters)
-                res = service.make_empirical_results(img, boundary, scale)
-                return JsonResponse(res)
+                res = service.get_threshold_results(filters)
+                with stage('serialize'):
+                    return JsonResponse(res)
             except Exception as e:
+                record_error('run_algorithm', e)
                 return HttpResponseBadRequest(e)
         else:
             return HttpResponseBadRequest("Form is invalid, please check if all parameters are set.")
@@ -30,22 +37,137 @@ def run_algorithm(request):
         return HttpResponseNotAllowed(["GET"])  
 
 @csrf_exempt
+@observe_view('handle_export_result')
 def handle_export_result(request):
     if request.method == "POST":
         form = PostForm(request.POST, request.FILES)
         if form.is_valid():
             filters = json.load(request.FILES['json'])
+            local = form.cleaned_data['mode'] == 'local'
             if 'boundary_file' in request.FILES:
-                filters['dataset']['boundary_file'] = request.FILES['boundary_file']
+                boundary_file = request.FILES['boundary_file']
+                if local:
+                    # the upload is closed when the request ends, keep its content for the job
+                    boundary_file = ContentFile(boundary_file.read(), name=boundary_file.name)
+                filters['dataset']['boundary_file'] = boundary_file
                 
             try:
-                img, boundary, scale = service.run_threshold_based_classification(filters)
-                taskId = service.export_result(img, boundary, scale)
+                if local:
+                    # reported by tasks/<id> like an export task
+                    taskId = service.submit_local_export(filters).id
+                else:
+                    img, boundary, scale = service.run_threshold_based_classification(filters)
+                    taskId = service.export_result(img, boundary, scale)
                 return JsonResponse(taskId, safe=False)
+            except JobQueueFull as e:
+                return HttpResponse(e, status=503)
+            except Exception as e:
+                record_error('handle_export_result', e)
+                return HttpResponseBadRequest(e)
+        else:
+            return HttpResponseBadRequest("Form is invalid, please check if all parameters are set.")
+
+    else:
+        return HttpResponseNotAllowed(["GET"])
+
+@csrf_exempt
+@observe_view('submit_algorithm_job')
+def submit_algorithm_job(request):
+    if request.method == "POST":
+        form = PostForm(request.POST, request.FILES)
+        if form.is_valid():
+            filters = json.load(request.FILES['json'])
+            if 'boundary_file' in request.FILES:
+                # the upload is closed when the request ends, keep its content for the job
+                boundary_file = request.FILES['boundary_file']
+                filters['dataset']['boundary_file'] = ContentFile(boundary_file.read(), name=boundary_file.name)
+                
+            try:
+                job = service.submit_threshold_job(filters)
+                return JsonResponse(job.id, safe=False)
+            except JobQueueFull as e:
+                return HttpResponse(e, status=503)
+            except Exception as e:
+                record_error('submit_algorithm_job', e)
+                return HttpResponseBadRequest(e)
+        else:
+            return HttpResponseBadRequest("Form is invalid, please check if all parameters are set.")
+
+    else:
+        return HttpResponseNotAllowed(["GET"])
+
+@csrf_exempt
+@observe_view('run_batch_algorithm')
+def run_batch_algorithm(request):
+    if request.method == "POST":
+        form = PostForm(request.POST, request.FILES)
+        if form.is_valid():
+            # the filters of run_algorithm, with a list of 'districts' in place of the boundary
+            filters = json.load(request.FILES['json'])
+                
+            try:
+                res = service.get_batch_threshold_results(filters)
+                with stage('serialize'):
+                    return JsonResponse(res)
+            except Exception as e:
+                record_error('run_batch_algorithm', e)
+                return HttpResponseBadRequest(e)
+        else:
+            return HttpResponseBadRequest("Form is invalid, please check if all parameters are set.")
+
+    else:
+        return HttpResponseNotAllowed(["GET"])
+
+@csrf_exempt
+@observe_view('get_batch_tiles')
+def get_batch_tiles(request):
+    if request.method == "POST":
+        form = PostForm(request.POST, request.FILES)
+        if form.is_valid():
+            # the filters of run_batch_algorithm, with the 'district' to map
+            filters = json.load(request.FILES['json'])
+                
+            try:
+                res = service.get_batch_district_tiles(filters, filters.pop('district', None))
+                return JsonResponse(res)
+            except Exception as e:
+                record_error('get_batch_tiles', e)
+                return HttpResponseBadRequest(e)
+        else:
+            return HttpResponseBadRequest("Form is invalid, please check if all parameters are set.")
+
+    else:
+        return HttpResponseNotAllowed(["GET"])
+
+@csrf_exempt
+@observe_view('run_multi_year_algorithm')
+def run_multi_year_algorithm(request):
+    if request.method == "POST":
+        form = PostForm(request.POST, request.FILES)
+        if form.is_valid():
+            # the filters of run_algorithm, with the list of 'years' to shift the seasons to
+            filters = json.load(request.FILES['json'])
+            if 'boundary_file' in request.FILES:
+                filters['dataset']['boundary_file'] = request.FILES['boundary_file']
+                
+            try:
+                res = service.get_multi_year_threshold_results(filters)
+                with stage('serialize'):
+                    return JsonResponse(res)
             except Exception as e:
+                record_error('run_multi_year_algorithm', e)
                 return HttpResponseBadRequest(e)
         else:
             return HttpResponseBadRequest("Form is invalid, please check if all parameters are set.")
 
     else:
-        return HttpResponseNotAllowed(["GET"])
\ No newline at end of file
+        return HttpResponseNotAllowed(["GET"])
+
+
+# async versions for the ASGI entry point, see the ASYNC_VIEWS setting
+run_algorithm_async = async_view(run_algorithm)
+handle_export_result_async = async_view(handle_export_result)
+submit_algorithm_job_async = async_view(submit_algorithm_job)
+run_batch_algorithm_async = async_view(run_batch_algorithm)
+get_batch_tiles_async = async_view(get_batch_tiles)
+run_multi_year_algorithm_async = async_view(run_multi_year_algorithm)
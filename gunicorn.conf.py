@@ -0,0 +1,29 @@
+"""gunicorn settings, read from the working directory by the command of the Procfile
+
+The app is loaded once in the master process and the workers are forked from it, so they share
+the memory of the imported modules. The Earth Engine access token is also fetched once, before
+forking, and every worker initializes its own client in the background as soon as it starts,
+see service.ee_client.
+"""
+
+preload_app = True
+
+
+def when_ready(server):
+    # runs in the master, before the first workers are forked
+    from service.ee_client import prepare_fork
+    prepare_fork()
+
+
+def post_worker_init(worker):
+    import threading
+    from service.ee_client import ensure_initialized
+
+    def initialize():
+        try:
+            ensure_initialized()
+        except Exception as e:
+            # attempted again on first use
+            print("Cannot initialize GEE:", e)
+
+    threading.Thread(target=initialize, daemon=True).start()
@@ -1,3 +1,31 @@
-from django.test import TestCase
+from service import main
+from service.testing import DATASET, EmulatorTestCase, make_samples
 
-# Create your tests here.
+
+class PhenologyRoundTripTest(EmulatorTestCase):
+    """Requests of the phenology sampling: more requests or larger graphs are a performance regression"""
+
+    def request(self, count):
+        return {
+            'dataset': DATASET,
+            'samples': make_samples(count),
+            'phenology_dates': {'start_date': '2021-01', 'end_date': '2021-12'},
+        }
+
+    def test_phenology(self):
+        res = main.get_phenology(self.request(80))
+        self.assertEqual(len(res['features']), 80)
+        self.assertEqual(self.round_trips(), {'getInfo': 1})
+        self.assertLessEqual(self.nodes(), 78)
+
+    def test_batches(self):
+        features = list(main.iter_phenology(self.request(50), batch_size=50))
+        self.assertEqual(len(features), 50)
+        batch_nodes = self.nodes()
+
+        self.ee.reset_stats()
+        features = list(main.iter_phenology(self.request(230), batch_size=50))
+        self.assertEqual(len(features), 230)
+        self.assertEqual(self.round_trips(), {'getInfo': 5})
+        # the graph of a batch does not grow with the number of samples
+        self.assertLessEqual(self.nodes(), 5 * batch_nodes)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
@@ -5,6 +6,6 @@ from . import views
 app_name = 'phenology'
 
 urlpatterns = [
-    path('', views.handleSaveSettings, name="index"),
-    path('monthly_composite', views.handleGetMonthlyComposite, name="monthly_composite")
+    path('', views.handleSaveSettingsAsync if settings.ASYNC_VIEWS else views.handleSaveSettings, name="index"),
+    path('monthly_composite', views.handleGetMonthlyCompositeAsync if settings.ASYNC_VIEWS else views.handleGetMonthlyComposite, name="monthly_composite")
 ]
\ No newline at end of file
@@ -1,28 +1,60 @@
 from django import http
+from django.conf import settings
 from django.http.response import HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse
 from django.shortcuts import render
-from django.http import HttpResponse, HttpRequest, HttpResponseBadRequest
+from django.http import HttpResponse, HttpRequest, HttpResponseBadRequest, StreamingHttpResponse
 
 from django.views.generic.base import TemplateView
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
 
 import json
 import service.main as service
+from service.serialization import phenology_to_columnar
+from service.executor import async_view
+from service.metrics import observe_view, record_error
+
+
+def ndjson_lines(features):
+    """Lines of a streamed phenology response, one sampled feature per line
+
+    The status of the response is sent before the first batch is sampled, so an error ends the
+    stream with a last line ``{"error": "<message>"}``, which a complete stream never has.
+    """
+    try:
+        for f in features:
+            yield json.dumps(f) + "\n"
+    except Exception as e:
+        record_error('handleSaveSettings', e)
+        yield json.dumps({'error': str(e)}) + "\n"
 
 
 @csrf_exempt
+@observe_view('handleSaveSettings')
 def handleSaveSettings(request: HttpRequest) -> HttpResponse:
     if request.method == "POST":
         try:
             data = json.loads(request.body)
+            if request.GET.get('format') == 'ndjson':
+                # one sampled feature per line, streamed while the batches are processed
+                lines = ndjson_lines(service.iter_phenology(data))
+                if settings.ASYNC_VIEWS:
+                    # Django 4.0 iterates streamed responses on the event loop of the ASGI server,
+                    # where each batch would block every other request: the lines are made here,
+                    # on the view pool, and sent at once
+                    return HttpResponse(b"".join(line.encode() for line in lines), content_type="application/x-ndjson")
+                return StreamingHttpResponse(lines, content_type="application/x-ndjson")
             res = service.get_phenology(data)
+            if request.GET.get('format') == 'columnar':
+                res = phenology_to_columnar(res, request.GET.get('encoding', 'json'))
             return JsonResponse(res)
         except Exception as e:
+            record_error('handleSaveSettings', e)
             return HttpResponseBadRequest(e)
     else:
         return HttpResponseNotAllowed(["GET"])
 
 @csrf_exempt
+@observe_view('handleGetMonthlyComposite')
 def handleGetMonthlyComposite(request: HttpRequest) -> HttpResponse:
     try:
         params_dict = request.GET
@@ -39,5 +71,11 @@ def handleGetMonthlyComposite(request: HttpRequest) -> HttpResponse:
         res = service.get_monthly_composite(start_date, end_date)
         return JsonResponse(res, safe=False)
     except Exception as e:
+        record_error('handleGetMonthlyComposite', e)
         print(e)
         return HttpResponseBadRequest(e)
+
+
+# async versions for the ASGI entry point, see the ASYNC_VIEWS setting
+handleSaveSettingsAsync = async_view(handleSaveSettings)
+handleGetMonthlyCompositeAsync = async_view(handleGetMonthlyComposite)
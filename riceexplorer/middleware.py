@@ -0,0 +1,35 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from service.tracing import end_trace, start_trace, stage
+
+
+class TracingMiddleware:
+    """Trace every request, see service.tracing, and report the timings in a Server-Timing header.
+
+    With ``?trace=1``, JSON object responses also get a ``debug`` field holding every stage and
+    Earth Engine call. The middleware removes itself unless the ``TRACING`` setting is on.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TRACING', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trace, token = start_trace()
+        try:
+            with stage('view'):
+                response = self.get_response(request)
+        finally:
+            end_trace(token)
+
+        response['Server-Timing'] = trace.server_timing()
+        if request.GET.get('trace') and not response.streaming and response.get('Content-Type') == 'application/json':
+            content = json.loads(response.content)
+            if isinstance(content, dict):
+                content['debug'] = trace.to_dict()
+                response.content = json.dumps(content)
+        return response
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'riceexplorer.middleware.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -148,3 +149,110 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 #         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
 #     ]
 # }
+
+# Service caches
+
+# Number of parsed uploaded boundary files kept in memory, and for how many
+# seconds (None keeps them until they are evicted)
+BOUNDARY_CACHE_SIZE = 32
+BOUNDARY_CACHE_TTL = None
+
+# Seconds a tile url of Earth Engine stays valid; cached tile urls must not
+# outlive their map id
+MAP_ID_TTL = 60 * 60
+
+# Results of threshold-based classifications. The backend is 'memory' (per
+# process), 'django' (RESULT_CACHE_LOCATION is an alias of CACHES) or 'file'
+# (RESULT_CACHE_LOCATION is a directory).
+RESULT_CACHE_BACKEND = 'memory'
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_TTL = MAP_ID_TTL
+RESULT_CACHE_LOCATION = os.path.join(BASE_DIR, 'cache', 'results')
+
+# Band values of the samples of supervised classifications, keyed by the
+# samples and the dataset filters, so that changing the model or the training
+# ratio does not sample the composites again
+TRAINING_TABLE_CACHE_BACKEND = 'memory'
+TRAINING_TABLE_CACHE_SIZE = 32
+TRAINING_TABLE_CACHE_TTL = 24 * 60 * 60
+TRAINING_TABLE_CACHE_LOCATION = os.path.join(BASE_DIR, 'cache', 'training_tables')
+
+# Tile urls of the monthly false color composites, shared by all worker
+# processes through files
+TILE_CACHE_BACKEND = 'file'
+TILE_CACHE_SIZE = 1024
+TILE_CACHE_TTL = MAP_ID_TTL
+TILE_CACHE_LOCATION = os.path.join(BASE_DIR, 'cache', 'tiles')
+
+# Earth Engine
+
+# 'earthengine', or 'emulator' to run the pipelines offline on small synthetic
+# rasters (see service.ee_emulator), e.g. for benchmarks and tests. The
+# emulator options are the grid (bounds, width, height), the dates of its
+# datasets (start_date, end_date), the seconds added to every request
+# (latency) and the random seed (seed).
+EE_BACKEND = os.environ.get('EE_BACKEND', 'earthengine')
+EE_EMULATOR = {
+    'latency': float(os.environ.get('EE_EMULATOR_LATENCY', 0)),
+}
+
+# Maximum number of Earth Engine requests a worker process issues at the same time
+EE_MAX_CONCURRENT_CALLS = 8
+
+# Background jobs started through the jobs endpoints: how many run at the same
+# time in a worker process, how many finished jobs are remembered, and how many
+# can wait for a thread before new jobs are refused with a 503
+JOB_MAX_WORKERS = 2
+JOB_HISTORY_SIZE = 100
+JOB_MAX_QUEUED = 20
+# The state of the jobs is also written to files in this folder, so that the
+# jobs/ and tasks/ requests answered by any gunicorn worker find the jobs of
+# the others; set to None when the app runs in a single process
+JOB_STORE_LOCATION = os.path.join(BASE_DIR, 'cache', 'jobs')
+
+# Export task statuses (tasks/ and tasks/<id>) are served from memory; the task
+# list is fetched from Earth Engine at most once every this many seconds
+TASK_STATUS_MIN_REFRESH = 5
+# Task ids that Earth Engine does not know are answered with null, which the
+# frontend reports as "Task not found", without asking Earth Engine again for
+# this many seconds (None: the refresh interval above)
+TASK_STATUS_MISSING_TTL = None
+
+# Downloads of exported files: Drive file ids are looked up once per title, and
+# files are streamed from Drive in chunks of this many bytes while a copy is
+# kept in results/ for later downloads
+DRIVE_FILE_CACHE_SIZE = 1024
+DRIVE_DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Local exports (export with mode=local): the result is downloaded in tiles of
+# at most this many pixels per side, this many at a time, each retried this
+# many times, and written into a GeoTIFF in results/. Requires rasterio.
+LOCAL_EXPORT_TILE_SIZE = 2048
+LOCAL_EXPORT_MAX_IN_FLIGHT = 4
+LOCAL_EXPORT_RETRIES = 3
+
+# Serve the app with async views, for the ASGI entry point (e.g. `daphne
+# riceexplorer.asgi:application`). Blocking work of each request runs on a
+# thread pool of ASYNC_VIEW_MAX_CONCURRENCY threads per worker process.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'false').lower() == 'true'
+ASYNC_VIEW_MAX_CONCURRENCY = 32
+
+# Time the stages and Earth Engine calls of every request, reported in a
+# Server-Timing header, and in a `debug` field of JSON responses for requests
+# with ?trace=1
+TRACING = os.environ.get('TRACING', 'false').lower() == 'true'
+
+# Metrics served at /metrics: every worker process writes its metrics to a
+# file of METRICS_DIR at most every METRICS_FLUSH_INTERVAL seconds, and the
+# endpoint merges the files of all workers. Clear the folder when deploying.
+METRICS_DIR = os.path.join(BASE_DIR, 'cache', 'metrics')
+METRICS_FLUSH_INTERVAL = 5
+
+# Streamed phenology requests (phenology/?format=ndjson): samples per Earth
+# Engine request, and how many of these requests run at the same time
+PHENOLOGY_BATCH_SIZE = 500
+PHENOLOGY_MAX_IN_FLIGHT = 4
+
+# Classifier sweeps (classification/sweep): most classifier configurations
+# trained in the graph of one request
+CLASSIFICATION_SWEEP_MAX_CONFIGURATIONS = 32
@@ -13,10 +13,11 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include, re_path
 
-from .views import get_task_with_id, home, get_tasks, handle_download_file
+from .views import get_task_with_id, home, get_tasks, handle_download_file, get_task_with_id_async, get_tasks_async, handle_download_file_async, get_jobs, get_job_with_id, handle_cancel_job, get_metrics
 
 urlpatterns = [
     path('', home, name="home"),
@@ -25,10 +26,16 @@ urlpatterns = [
     path('empirical/', include('empirical.urls')),
     path('classification/', include('classification.urls')),
     
-    path("tasks/<str:id>", get_task_with_id),
-    path("tasks/", get_tasks),
+    path("tasks/<str:id>", get_task_with_id_async if settings.ASYNC_VIEWS else get_task_with_id),
+    path("tasks/", get_tasks_async if settings.ASYNC_VIEWS else get_tasks),
     
-    path("download/<str:id>", handle_download_file),
+    path("metrics", get_metrics),
+    
+    path("jobs/<str:id>/cancel", handle_cancel_job),
+    path("jobs/<str:id>", get_job_with_id),
+    path("jobs/", get_jobs),
+    
+    path("download/<str:id>", handle_download_file_async if settings.ASYNC_VIEWS else handle_download_file),
 
     re_path(r"^$", home),
     re_path(r"^(?:.*)/?$", home),
@@ -1,15 +1,14 @@
-from django.http import FileResponse, HttpResponseNotFound
+from django.http import HttpResponse, HttpResponseNotFound
+from django.http.response import HttpResponseNotAllowed
+from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render
 from django.http.response import JsonResponse
-from service.main import get_task_list, get_the_task, download_file
-from utils.credential import EE_CREDENTIALS
-import ee
+from service.main import get_task_list, get_the_task, download_file, get_job_list, get_the_job, cancel_job
+from service.executor import async_view
+from service.downloads import result_file_response
+from service.metrics import render as render_metrics
 
 def home(request):
-    
-    # if EE_CREDENTIALS:
-    #     ee.Initialize(EE_CREDENTIALS)
-    
     return render(request, 'index.html')
 
 def get_tasks(request):
@@ -18,10 +17,37 @@ def get_tasks(request):
 def get_task_with_id(request, id):
     return JsonResponse(get_the_task(id), safe=False)
 
+def get_metrics(request):
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4")
+
+def get_jobs(request):
+    return JsonResponse(get_job_list(), safe=False)
+
+def get_job_with_id(request, id):
+    job = get_the_job(id)
+    if job is None:
+        return HttpResponseNotFound()
+    return JsonResponse(job, safe=False)
+
+@csrf_exempt
+def handle_cancel_job(request, id):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    job = cancel_job(id)
+    if job is None:
+        return HttpResponseNotFound()
+    return JsonResponse(job, safe=False)
+
 def handle_download_file(request, id):
     
-    filename = download_file(id)
-    if filename is not None:
-        return FileResponse(open(filename, 'rb'), as_attachment=True, )
+    result = download_file(id)
+    if result is not None:
+        return result_file_response(request, result)
     else:
-        return HttpResponseNotFound()
\ No newline at end of file
+        return HttpResponseNotFound()
+
+
+# async versions for the ASGI entry point, see the ASYNC_VIEWS setting
+get_tasks_async = async_view(get_tasks)
+get_task_with_id_async = async_view(get_task_with_id)
+handle_download_file_async = async_view(handle_download_file)
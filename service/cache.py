@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def canonical_hash(*parts):
+    """Hash json-like values independently of dictionary key order.
+
+    Returns:
+        str: The hex SHA-256 digest of the canonical JSON of ``parts``
+    """
+    data = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """A thread-safe, size-bounded least-recently-used cache.
+
+    Args:
+        maxsize (int, optional): Maximum number of entries kept. Defaults to 128.
+        ttl (float, optional): Seconds an entry stays valid, or None to keep entries until evicted. Defaults to None.
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl is not None and entry[0] < time.monotonic():
+                del self._data[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, func):
+        """Get the value of a key, computing and storing it with ``func()`` on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = func()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
+
+
+class DjangoCache:
+    """Cache backed by one of the caches configured in the Django settings.
+
+    Size-bounded eviction is left to the Django cache backend, e.g. its ``MAX_ENTRIES`` option.
+
+    Args:
+        alias (str, optional): Name of the cache in ``settings.CACHES``. Defaults to 'default'.
+        ttl (float, optional): Seconds an entry stays valid, or None to keep entries until evicted. Defaults to None.
+        prefix (str, optional): Prefix added to every key. Defaults to ''.
+    """
+
+    def __init__(self, alias='default', ttl=None, prefix=''):
+        from django.core.cache import caches
+        self._cache = caches[alias]
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        value = self._cache.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._cache.set(self.prefix + key, value, self.ttl)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class FileCache:
+    """Cache that stores json-like values as JSON files in a directory.
+
+    Entries survive restarts and are shared by all processes using the same directory.
+
+    Args:
+        location (str): Directory of the cache files, created if missing.
+        maxsize (int, optional): Maximum number of files kept; the least recently used are removed first. Defaults to 128.
+        ttl (float, optional): Seconds an entry stays valid, or None to keep entries until evicted. Defaults to None.
+    """
+
+    def __init__(self, location, maxsize=128, ttl=None):
+        self.location = location
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(location, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.location, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return default
+        if entry['expires'] is not None and entry['expires'] < time.time():
+            self._remove(path)
+            self.misses += 1
+            return default
+        os.utime(path)
+        self.hits += 1
+        return entry['value']
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'expires': expires, 'value': value}, f)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            self.evictions += 1
+        except OSError:
+            pass
+
+    def _evict(self):
+        files = []
+        for entry in os.scandir(self.location):
+            if entry.name.endswith('.json'):
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        if len(files) > self.maxsize:
+            files.sort()
+            for _, path in files[:len(files) - self.maxsize]:
+                self._remove(path)
+
+    def values(self):
+        """Values of all the entries that have not expired, in no particular order."""
+        values = []
+        for entry in os.scandir(self.location):
+            if entry.name.endswith('.json'):
+                try:
+                    with open(entry.path) as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if data['expires'] is None or data['expires'] >= time.time():
+                    values.append(data['value'])
+        return values
+
+    def clear(self):
+        for entry in os.scandir(self.location):
+            if entry.name.endswith('.json'):
+                self._remove(entry.path)
+
+    def __len__(self):
+        return sum(1 for entry in os.scandir(self.location) if entry.name.endswith('.json'))
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self),
+            'maxsize': self.maxsize,
+        }
+
+
+def make_cache(backend='memory', maxsize=128, ttl=None, location=None):
+    """Create a cache with one of the supported backends.
+
+    Args:
+        backend (str, optional): 'memory' for an in-process LRU cache, 'django' for a cache of the Django settings
+            (``location`` is its alias) or 'file' for JSON files in the ``location`` directory. Defaults to 'memory'.
+        maxsize (int, optional): Maximum number of entries, not used by the 'django' backend. Defaults to 128.
+        ttl (float, optional): Seconds an entry stays valid. Defaults to None.
+        location (str, optional): Cache alias or directory. Defaults to None.
+
+    Raises:
+        ValueError: unknown backend
+
+    Returns:
+        LRUCache | DjangoCache | FileCache: the cache
+    """
+    if backend == 'memory':
+        return LRUCache(maxsize=maxsize, ttl=ttl)
+    if backend == 'django':
+        return DjangoCache(alias=location or 'default', ttl=ttl)
+    if backend == 'file':
+        return FileCache(location, maxsize=maxsize, ttl=ttl)
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+def cache_from_settings(name, backend='memory', maxsize=128, ttl=None, location=None):
+    """Create a cache configured by the ``<name>_BACKEND``, ``<name>_SIZE``, ``<name>_TTL`` and ``<name>_LOCATION`` settings.
+
+    The arguments are the defaults of the settings, see make_cache(). The cache is reported
+    by the metrics endpoint under the lowercase name.
+    """
+    from django.conf import settings
+    from .metrics import registry
+    cache = make_cache(
+        backend=getattr(settings, f'{name}_BACKEND', backend),
+        maxsize=getattr(settings, f'{name}_SIZE', maxsize),
+        ttl=getattr(settings, f'{name}_TTL', ttl),
+        location=getattr(settings, f'{name}_LOCATION', location),
+    )
+    # hit ratios are reported by the metrics endpoint
+    registry.register_cache(name.lower(), cache)
+    return cache
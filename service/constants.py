@@ -1,4 +1,4 @@
-import ee
+from django.core.exceptions import BadRequest
 
 DATASET_LIST = {
     'radar': {
@@ -75,6 +75,13 @@ DATASET_LIST = {
     }
 }
 
+def get_dataset_scale(dataset_name):
+    if dataset_name in DATASET_LIST['radar']:
+        return DATASET_LIST['radar'][dataset_name]['scale']
+    if dataset_name in DATASET_LIST['optical']:
+        return DATASET_LIST['optical'][dataset_name]['scale']
+    raise BadRequest("dataset name not found")
+
 FEATURE_LIST = {
     'radar': {
         'VH': "VH band",
@@ -89,10 +96,11 @@ FEATURE_LIST = {
     },
 }
 
+# classifiers by name, as ee.Classifier methods
 MODEL_LIST = {
-    'Random Forest': ee.Classifier.smileRandomForest,
-    'Gradient Tree Boost': ee.Classifier.smileGradientTreeBoost,
-    'Support Vector Machine': ee.Classifier.libsvm,
-    'CART': ee.Classifier.smileCart,
-    'Naive Bayes': ee.Classifier.smileNaiveBayes,
+    'Random Forest': 'smileRandomForest',
+    'Gradient Tree Boost': 'smileGradientTreeBoost',
+    'Support Vector Machine': 'libsvm',
+    'CART': 'smileCart',
+    'Naive Bayes': 'smileNaiveBayes',
 }
\ No newline at end of file
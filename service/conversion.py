@@ -1,7 +1,12 @@
 import json
+import logging
 import os
+import threading
 from django.core.exceptions import BadRequest
-import ee
+from .ee_client import ee
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
 
 def shp_to_ee(in_shp):
     """Converts a shapefile to Earth Engine objects.
@@ -19,7 +24,7 @@ def shp_to_ee(in_shp):
     except Exception as e:
         print(e)
 
-def shp_reader_to_geojson(shp_reader):
+def shp_reader_to_features(shp_reader):
     fields = shp_reader.fields[1:]
     field_names = [field[0] for field in fields]
     buffer = []
@@ -27,6 +32,10 @@ def shp_reader_to_geojson(shp_reader):
         atr = dict(zip(field_names, sr.record))
         geom = sr.shape.__geo_interface__
         buffer.append(dict(type="Feature", geometry=geom, properties=atr))
+    return buffer
+
+def shp_reader_to_geojson(shp_reader):
+    buffer = shp_reader_to_features(shp_reader)
     
     import json
     geojson = json.dumps({"type": "FeatureCollection",
@@ -112,7 +121,244 @@ def geojson_to_ee(geo_json):
 
 
 
-def shp_zip_to_ee(file):
+def file_digest(file):
+    """Compute the SHA-256 digest of the content of a file.
+
+    Args:
+        file (str | file-like): File path, Django uploaded file or a binary file-like object.
+
+    Returns:
+        str: The hex digest
+    """
+    import hashlib
+
+    h = hashlib.sha256()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                h.update(chunk)
+    elif hasattr(file, 'chunks'):
+        for chunk in file.chunks():
+            h.update(chunk)
+        file.seek(0)
+    else:
+        file.seek(0)
+        for chunk in iter(lambda: file.read(1 << 16), b''):
+            h.update(chunk)
+        file.seek(0)
+    return h.hexdigest()
+
+
+# approximate length of one degree of latitude, in meters
+METERS_PER_DEGREE = 111320
+
+
+def scale_to_tolerance(scale):
+    """Convert a dataset scale to a simplification tolerance of half a pixel.
+
+    Args:
+        scale (float): Pixel size in meters, e.g. the ``scale`` of a dataset in DATASET_LIST.
+
+    Returns:
+        float: The tolerance in degrees
+    """
+    return scale / 2 / METERS_PER_DEGREE
+
+
+def _clean_ring(ring, precision):
+    # round coordinates, then drop repeated and collinear vertices
+    points = []
+    for coords in ring:
+        point = (round(coords[0], precision), round(coords[1], precision))
+        if points and point == points[-1]:
+            continue
+        if len(points) >= 2:
+            (ax, ay), (bx, by) = points[-2], points[-1]
+            if (bx - ax) * (point[1] - ay) - (by - ay) * (point[0] - ax) == 0:
+                points.pop()
+        points.append(point)
+    return points
+
+
+def _simplify_line(points, tolerance):
+    # Douglas-Peucker, iterative to stay clear of the recursion limit on long rings
+    if len(points) < 3:
+        return points
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (ax, ay), (bx, by) = points[first], points[last]
+        dx, dy = bx - ax, by - ay
+        norm = (dx * dx + dy * dy) ** 0.5
+        max_dist, index = 0, None
+        for i in range(first + 1, last):
+            px, py = points[i]
+            if norm == 0:
+                dist = ((px - ax) ** 2 + (py - ay) ** 2) ** 0.5
+            else:
+                dist = abs(dy * px - dx * py + bx * ay - by * ax) / norm
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if index is not None and max_dist > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+def _simplify_ring(ring, tolerance, precision):
+    points = _clean_ring(ring, precision)
+    if len(points) > 1 and points[0] == points[-1]:
+        points = points[:-1]
+    if len(points) < 3:
+        return None
+    # split the closed ring at the vertex farthest from its start so that
+    # both halves have distinct end points
+    ax, ay = points[0]
+    split = max(range(len(points)), key=lambda i: (points[i][0] - ax) ** 2 + (points[i][1] - ay) ** 2)
+    simplified = _simplify_line(points[:split + 1], tolerance)[:-1] + \
+        _simplify_line(points[split:] + [points[0]], tolerance)
+    if len(simplified) < 4:
+        return None
+    return [list(p) for p in simplified]
+
+
+def _simplify_polygon(rings, tolerance, precision):
+    polygon = []
+    for i, ring in enumerate(rings):
+        simplified = _simplify_ring(ring, tolerance, precision)
+        if simplified is None:
+            if i > 0:
+                # holes smaller than the tolerance are dropped
+                continue
+            # never let the exterior ring collapse
+            simplified = [[round(c[0], precision), round(c[1], precision)] for c in ring]
+        polygon.append(simplified)
+    return polygon
+
+
+def simplify_geometry(geometry, tolerance, precision=6):
+    """Simplify a GeoJSON geometry and round its coordinates.
+
+    Args:
+        geometry (dict): A GeoJSON geometry.
+        tolerance (float): Douglas-Peucker tolerance, in the unit of the coordinates.
+        precision (int, optional): Number of decimals kept in the coordinates. Defaults to 6.
+
+    Returns:
+        dict: The simplified geometry
+    """
+    if geometry is None:
+        return None
+    geom_type = geometry['type']
+    if geom_type == 'GeometryCollection':
+        return {'type': geom_type,
+                'geometries': [simplify_geometry(g, tolerance, precision) for g in geometry['geometries']]}
+    coords = geometry['coordinates']
+    if geom_type == 'Point':
+        coords = [round(c, precision) for c in coords]
+    elif geom_type in ('MultiPoint', 'LineString'):
+        coords = [[round(c, precision) for c in p] for p in coords]
+        if geom_type == 'LineString':
+            coords = [list(p) for p in _simplify_line(_clean_ring(coords, precision), tolerance)]
+    elif geom_type == 'MultiLineString':
+        coords = [[list(p) for p in _simplify_line(_clean_ring(line, precision), tolerance)] for line in coords]
+    elif geom_type == 'Polygon':
+        coords = _simplify_polygon(coords, tolerance, precision)
+    elif geom_type == 'MultiPolygon':
+        coords = [_simplify_polygon(polygon, tolerance, precision) for polygon in coords]
+    return {'type': geom_type, 'coordinates': coords}
+
+
+def count_vertices(geo_json):
+    """Count the coordinate pairs of a GeoJSON object."""
+    if isinstance(geo_json, dict):
+        if geo_json.get('type') == 'FeatureCollection':
+            return sum(count_vertices(f) for f in geo_json['features'])
+        if geo_json.get('type') == 'Feature':
+            return count_vertices(geo_json['geometry'])
+        if geo_json.get('type') == 'GeometryCollection':
+            return sum(count_vertices(g) for g in geo_json['geometries'])
+        return count_vertices(geo_json.get('coordinates', []))
+    if isinstance(geo_json, (list, tuple)):
+        if geo_json and not isinstance(geo_json[0], (list, tuple)):
+            return 1
+        return sum(count_vertices(c) for c in geo_json)
+    return 0
+
+
+def geojson_bounds(geo_json):
+    """Bounding box of a GeoJSON object.
+
+    Args:
+        geo_json (dict): A GeoJSON FeatureCollection, Feature or geometry.
+
+    Returns:
+        list: [west, south, east, north]
+    """
+    def positions(obj):
+        if isinstance(obj, dict):
+            if obj.get('type') == 'FeatureCollection':
+                for f in obj['features']:
+                    yield from positions(f)
+            elif obj.get('type') == 'Feature':
+                yield from positions(obj['geometry'])
+            elif obj.get('type') == 'GeometryCollection':
+                for g in obj['geometries']:
+                    yield from positions(g)
+            else:
+                yield from positions(obj.get('coordinates', []))
+        elif isinstance(obj, (list, tuple)) and obj:
+            if not isinstance(obj[0], (list, tuple)):
+                yield obj
+            else:
+                for c in obj:
+                    yield from positions(c)
+
+    xs, ys = zip(*((p[0], p[1]) for p in positions(geo_json)))
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def simplify_geojson(geo_json, tolerance, precision=6):
+    """Simplify the geometries of a GeoJSON object before it is sent to GEE.
+
+    Drops repeated and collinear vertices, applies Douglas-Peucker with the given
+    tolerance and rounds coordinates to ``precision`` decimals.
+
+    Args:
+        geo_json (dict): A GeoJSON FeatureCollection, Feature or geometry.
+        tolerance (float): Douglas-Peucker tolerance in degrees, see scale_to_tolerance().
+        precision (int, optional): Number of decimals kept in the coordinates. Defaults to 6.
+
+    Returns:
+        tuple(dict, dict): The simplified GeoJSON and the vertex count and payload bytes before and after
+    """
+    if geo_json['type'] == 'FeatureCollection':
+        simplified = {**geo_json, 'features': [simplify_geojson(f, tolerance, precision)[0] for f in geo_json['features']]}
+    elif geo_json['type'] == 'Feature':
+        simplified = {**geo_json, 'geometry': simplify_geometry(geo_json['geometry'], tolerance, precision)}
+    else:
+        simplified = simplify_geometry(geo_json, tolerance, precision)
+    
+    stats = {
+        'vertices_before': count_vertices(geo_json),
+        'vertices_after': count_vertices(simplified),
+        'bytes_before': len(json.dumps(geo_json, separators=(',', ':'))),
+        'bytes_after': len(json.dumps(simplified, separators=(',', ':'))),
+    }
+    return simplified, stats
+
+
+def _simplify_and_report(geo_json, tolerance, label):
+    simplified, stats = simplify_geojson(geo_json, tolerance)
+    logger.debug("Simplified boundary %s: %d -> %d vertices, %d -> %d bytes", label,
+                 stats['vertices_before'], stats['vertices_after'], stats['bytes_before'], stats['bytes_after'])
+    return simplified
+
+
+def shp_zip_to_geojson(file):
     from zipfile import ZipFile
     import re
     from shapefile import Reader
@@ -139,9 +385,134 @@ def shp_zip_to_ee(file):
     
     reader = Reader(shp=zip.open(shp_filename), shx=zip.open(shx_filename), dbf=zip.open(dbf_filename))
     
-    geojson_str = shp_reader_to_geojson(reader)
+    return {"type": "FeatureCollection", "features": shp_reader_to_features(reader)}
+
+
+# parsed uploaded boundaries keyed by the digest of the zip file
+_boundary_cache = None
+
+def get_boundary_cache():
+    global _boundary_cache
+    if _boundary_cache is None:
+        from django.conf import settings
+        from .metrics import registry
+        _boundary_cache = LRUCache(
+            maxsize=getattr(settings, 'BOUNDARY_CACHE_SIZE', 32),
+            ttl=getattr(settings, 'BOUNDARY_CACHE_TTL', None),
+        )
+        registry.register_cache('boundary_cache', _boundary_cache)
+    return _boundary_cache
+
+
+def load_shp_zip(file, tolerance=None):
+    """Parse a zipped shapefile, reusing the result of earlier uploads of the same file.
+
+    Args:
+        file (str | file-like): The zip file.
+        tolerance (float, optional): Simplify the geometries with this tolerance, see simplify_geojson(). Defaults to None.
+
+    Returns:
+        tuple(str, dict): The digest of the zip file and its GeoJSON FeatureCollection
+    """
+    digest = file_digest(file)
+    cache = get_boundary_cache()
+    geojson = cache.get_or_set(digest, lambda: shp_zip_to_geojson(file))
+    if tolerance is not None:
+        geojson = cache.get_or_set((digest, tolerance), lambda: _simplify_and_report(geojson, tolerance, digest[:12]))
+    return digest, geojson
+
+
+def shp_zip_to_ee(file, tolerance=None):
+    _, geojson = load_shp_zip(file, tolerance)
     
-    ee_obj = geojson_to_ee(json.loads(geojson_str))
+    ee_obj = geojson_to_ee(geojson)
     
     return ee_obj
-    
\ No newline at end of file
+
+
+class BoundaryRegistry:
+    """In-memory index of the features of a boundary shapefile.
+
+    The shapefile is parsed once, on first use, and every feature is kept as a
+    GeoJSON dictionary keyed by the value of ``key_field``, so that looking up a
+    boundary neither touches the disk nor ships the whole collection to GEE.
+
+    Args:
+        in_shp (str): File path to a shapefile.
+        key_field (str, optional): Attribute used to index the features. Defaults to 'DISTRICT'.
+    """
+
+    def __init__(self, in_shp, key_field='DISTRICT'):
+        self.in_shp = in_shp
+        self.key_field = key_field
+        self._features = None
+        self._simplified = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Parse the shapefile if it has not been parsed yet.
+
+        Returns:
+            dict: GeoJSON features keyed by the value of ``key_field``
+        """
+        if self._features is None:
+            with self._lock:
+                if self._features is None:
+                    from shapefile import Reader
+                    with Reader(os.path.abspath(self.in_shp)) as reader:
+                        features = shp_reader_to_features(reader)
+                    self._features = {f['properties'][self.key_field]: f for f in features}
+        return self._features
+
+    def names(self):
+        return sorted(self.load().keys())
+
+    def get(self, name, tolerance=None):
+        """Get the GeoJSON feature of a boundary.
+
+        Args:
+            name (str): Value of ``key_field`` of the boundary, e.g. a district name.
+            tolerance (float, optional): Simplify the geometry with this tolerance, see simplify_geojson(). Defaults to None.
+
+        Raises:
+            BadRequest: the boundary does not exist
+
+        Returns:
+            dict: A GeoJSON feature
+        """
+        features = self.load()
+        if name not in features:
+            raise BadRequest(f"Unknown boundary: {name}")
+        if tolerance is None:
+            return features[name]
+        key = (name, tolerance)
+        if key not in self._simplified:
+            with self._lock:
+                if key not in self._simplified:
+                    self._simplified[key] = _simplify_and_report(features[name], tolerance, name)
+        return self._simplified[key]
+
+    def get_ee(self, name, tolerance=None):
+        """Get a boundary as an ee.Feature that only carries its own geometry.
+
+        Args:
+            name (str): Value of ``key_field`` of the boundary, e.g. a district name.
+            tolerance (float, optional): Simplify the geometry with this tolerance, see simplify_geojson(). Defaults to None.
+
+        Returns:
+            ee.Feature: The boundary feature
+        """
+        feature = self.get(name, tolerance)
+        return ee.Feature(ee.Geometry(feature['geometry']), feature['properties'])
+
+    def get_ee_collection(self, names, tolerance=None):
+        """Get several boundaries as an ee.FeatureCollection, to reduce an image over each of them in one call.
+
+        Args:
+            names (list): Values of ``key_field`` of the boundaries, e.g. district names.
+            tolerance (float, optional): Simplify the geometries with this tolerance, see simplify_geojson(). Defaults to None.
+
+        Returns:
+            ee.FeatureCollection: One feature per boundary, in the order of ``names``
+        """
+        return ee.FeatureCollection([self.get_ee(name, tolerance) for name in names])
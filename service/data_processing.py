@@ -1,7 +1,11 @@
-import ee
+from __future__ import annotations
+from .ee_client import ee
 from django.core.exceptions import BadRequest
+from .cache import cache_from_settings, canonical_hash
 from .constants import DATASET_LIST, FEATURE_LIST
+from .executor import run_concurrently
 from .speckle_filters import dbToPower
+from .tracing import ee_call
 # from .conversion import geojson_to_ee
 
 # seasons = ['sowing', 'peak', 'harvesting']
@@ -141,22 +145,34 @@ def make_false_color_monthly_composite(start_date: str, end_date: str):
     
     if sdate.year > 2015 or (sdate.year == 2015 and sdate.month > 6):
         # Use sentinel-2 if start year > 2015
-        data = ee.ImageCollection("COPERNICUS/S2")
+        collection_id = "COPERNICUS/S2"
         scale, offset = 0.0001, 0
         vis_params = {"bands": ["B8", "B4", "B3"], "max": 0.5}
     elif sdate.year > 2013 or (sdate.year == 2013 and sdate.month >= 5):
         # use Landsat-8 
-        data = ee.ImageCollection("LANDSAT/LC08/C02/T1_L2")
+        collection_id = "LANDSAT/LC08/C02/T1_L2"
         scale, offset = 0.0000275, -0.2
         vis_params = {"bands": ["SR_B5", "SR_B4", "SR_B3"], "max": 0.5}
     else:
         # if end year > 2011, use Landsat-7
-        data = ee.ImageCollection("LANDSAT/LE07/C02/T1_L2")
+        collection_id = "LANDSAT/LE07/C02/T1_L2"
         scale, offset = 0.0000275, -0.2
         vis_params = {"bands": ["SR_B4", "SR_B3", "SR_B2"], "max": 0.5}
 
+    data = ee.ImageCollection(collection_id)
+
+    # tile urls are cached per month until their map id expires, and the missing ones are requested concurrently
+    cache = get_tile_cache()
     urls = {}
+    missing = {}
     for month in month_ranges:
+        month_start, month_end = month_ranges[month]
+        key = canonical_hash(collection_id, month_start, month_end, scale, offset, vis_params)
+        urls[month] = cache.get(key)
+        if urls[month] is None:
+            missing[month] = key
+    
+    def get_tile_url(month):
         month_start, month_end = month_ranges[month]
         data_filtered = data.filterDate(month_start, month_end)
         # composite = ee.Algorithms.Landsat.simpleComposite(collection=data_filtered, asFloat=True)
@@ -166,6 +182,21 @@ def make_false_color_monthly_composite(start_date: str, end_date: str):
         # vis_params["min"] = min
         # vis_params["max"] = max
         
-        urls[month] = composite.getMapId(vis_params)['tile_fetcher'].url_format
+        return ee_call(composite, 'getMapId', vis_params)['tile_fetcher'].url_format
+    
+    tile_urls = run_concurrently(*[lambda month=month: get_tile_url(month) for month in missing])
+    for month, url in zip(missing, tile_urls):
+        urls[month] = url
+        cache.set(missing[month], url)
         
-    return urls
\ No newline at end of file
+    return urls
+
+
+# tile urls of monthly composites, see make_false_color_monthly_composite()
+_tile_cache = None
+
+def get_tile_cache():
+    global _tile_cache
+    if _tile_cache is None:
+        _tile_cache = cache_from_settings('TILE_CACHE', maxsize=1024, ttl=3600)
+    return _tile_cache
@@ -0,0 +1,51 @@
+from datetime import timezone
+
+DAY_MILLIS = 86400000
+
+
+def to_millis(date):
+    """Convert a date string like the ones accepted by ee.Date, e.g. '2021-06' or '2021-06-15', to UTC milliseconds."""
+    from dateutil.parser import isoparse
+    date = isoparse(date)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return int(date.timestamp() * 1000)
+
+
+def composite_windows(start_date, end_date, days):
+    """Start and end, in milliseconds, of the ``days``-day composite windows between two dates.
+
+    Like ``ee.List.sequence(start, end, gap)``, windows start every ``days`` days from ``start_date``;
+    the last one is cut at ``end_date``.
+
+    Returns:
+        list(tuple(int, int)): the windows, in order
+    """
+    start, end = to_millis(start_date), to_millis(end_date)
+    gap = days * DAY_MILLIS
+    return [(s, min(s + gap, end)) for s in range(start, end, gap)]
+
+
+def season_date_range(season_filters):
+    """Get the period covering all seasons
+
+    Args:
+        season_filters (list): seasons with start and end dates
+
+    Returns:
+        tuple(str, str): the earliest start date and the latest end date
+    """
+    start_date = min((season['start'] for season in season_filters), key=to_millis)
+    end_date = max((season['end'] for season in season_filters), key=to_millis)
+    return start_date, end_date
+
+
+def shift_years(date, years):
+    """Shift a date string like the ones accepted by ee.Date by whole years, keeping its precision, e.g. '2021-06' by 2 to '2023-06'.
+
+    February 29 becomes February 28 in years that are not leap years.
+    """
+    from dateutil.parser import isoparse
+    from dateutil.relativedelta import relativedelta
+    shifted = (isoparse(date) + relativedelta(years=years)).isoformat()
+    return shifted[:len(date)] if len(date) <= 10 else shifted
@@ -0,0 +1,195 @@
+import io
+import os
+import re
+import tempfile
+import threading
+from collections import namedtuple
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+from .cache import cache_from_settings
+
+# local copies of the exported files, named after their Drive title
+RESULTS_DIR = 'results'
+
+# a result file is either cached locally (path) or streamed from Drive while it is cached (chunks)
+ResultFile = namedtuple('ResultFile', ['filename', 'path', 'chunks', 'size'])
+
+_drive = None
+_drive_lock = threading.Lock()
+
+
+def get_drive():
+    """Get the Google Drive client of this process, authenticated once with the service account of Earth Engine.
+
+    Returns:
+        pydrive.drive.GoogleDrive: the client
+    """
+    global _drive
+    if _drive is None:
+        with _drive_lock:
+            if _drive is None:
+                from pydrive.auth import GoogleAuth
+                from pydrive.drive import GoogleDrive
+                from oauth2client.service_account import ServiceAccountCredentials
+                from utils.credential import EE_PRIVATE_KEY
+                import json
+
+                gauth = GoogleAuth()
+                scopes = ['https://www.googleapis.com/auth/drive']
+                gauth.credentials = ServiceAccountCredentials.from_json_keyfile_dict(
+                    json.loads(EE_PRIVATE_KEY),
+                    scopes=scopes
+                )
+                gauth.Authorize()
+                _drive = GoogleDrive(gauth)
+    return _drive
+
+
+# Drive file ids and sizes, by title
+_file_cache = None
+
+
+def get_drive_file_cache():
+    global _file_cache
+    if _file_cache is None:
+        _file_cache = cache_from_settings('DRIVE_FILE_CACHE', maxsize=1024)
+    return _file_cache
+
+
+def find_drive_file(title):
+    """Look up a file of the Drive of the service account by title; the answer is cached.
+
+    Returns:
+        dict: id and fileSize of the file, or None if there is no such file
+    """
+    cache = get_drive_file_cache()
+    file = cache.get(title)
+    if file is not None:
+        return file
+    query = "title = '{}' and trashed = false".format(title.replace('\\', '\\\\').replace("'", "\\'"))
+    # the client is shared by the threads of the process, and so is its connection
+    with _drive_lock:
+        file_list = get_drive().ListFile({'q': query, 'maxResults': 1}).GetList()
+    if not file_list:
+        return None
+    file = {'id': file_list[0]['id'], 'fileSize': file_list[0].get('fileSize')}
+    cache.set(title, file)
+    return file
+
+
+def _download_chunks(file_id, path, chunk_size):
+    # yields the content of a Drive file while writing it to path; the file only appears there once complete
+    import httplib2
+    from googleapiclient.http import MediaIoBaseDownload
+
+    gauth = get_drive().auth
+    request = gauth.service.files().get_media(fileId=file_id)
+    # a connection of its own, the credentials are shared
+    request.http = gauth.credentials.authorize(httplib2.Http())
+    buffer = io.BytesIO()
+    downloader = MediaIoBaseDownload(buffer, request, chunksize=chunk_size)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, part_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as part:
+            done = False
+            while not done:
+                _, done = downloader.next_chunk()
+                chunk = buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                part.write(chunk)
+                yield chunk
+        os.replace(part_path, path)
+    finally:
+        # the download failed or the client went away
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def open_result_file(filename):
+    """Open an exported file, from the local cache or from Drive
+
+    Args:
+        filename (str): title of the file on Drive
+
+    Returns:
+        ResultFile: the local path of the file, or the chunks of its content if it is not cached yet;
+            None if the file does not exist
+    """
+    from django.conf import settings
+
+    path = os.path.join(RESULTS_DIR, filename)
+    if os.path.exists(path):
+        return ResultFile(filename, path, None, os.path.getsize(path))
+    file = find_drive_file(filename)
+    if file is None:
+        return None
+    chunk_size = getattr(settings, 'DRIVE_DOWNLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+    size = int(file['fileSize']) if file.get('fileSize') else None
+    return ResultFile(filename, None, _download_chunks(file['id'], path, chunk_size), size)
+
+
+_range = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _read_range(path, start, length, block_size=64 * 1024):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(block_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def result_file_response(request, result, content_type='image/tiff'):
+    """Make the response of a download, with support for single byte ranges once the file is cached
+
+    Args:
+        request (HttpRequest): the request, whose Range header is honoured
+        result (ResultFile): the file, see open_result_file()
+        content_type (str, optional): Defaults to 'image/tiff'.
+
+    Returns:
+        HttpResponse: the whole file, a 206 partial response, or 416 for a range outside the file
+    """
+    disposition = 'attachment; filename="{}"'.format(result.filename)
+    if result.path is None:
+        # streamed from Drive, ranges are ignored
+        response = StreamingHttpResponse(result.chunks, content_type=content_type)
+        response['Content-Disposition'] = disposition
+        if result.size is not None:
+            response['Content-Length'] = str(result.size)
+        return response
+
+    size = result.size
+    match = _range.match(request.headers.get('Range', ''))
+    # a missing or invalid range is ignored
+    if match is None or match.groups() == ('', '') or (all(match.groups()) and int(match[2]) < int(match[1])):
+        response = FileResponse(open(result.path, 'rb'), as_attachment=True, filename=result.filename, content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(size)
+        return response
+
+    response = StreamingHttpResponse(_read_range(result.path, start, end - start + 1), status=206, content_type=content_type)
+    response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+    response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = disposition
+    return response
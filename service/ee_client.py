@@ -0,0 +1,103 @@
+"""The Earth Engine API used by the app: the ``ee`` client library, or the emulator of service.ee_emulator
+
+The backend is chosen once with the ``EE_BACKEND`` setting, 'earthengine' (the default) or
+'emulator'; the options of the emulator come from the ``EE_EMULATOR`` setting. Modules import
+the API with ``from service.ee_client import ee`` instead of ``import ee``.
+
+Nothing happens on import: the backend is imported and initialized with the service account
+of utils.credential the first time an attribute of ``ee`` is used, once per process. Modules
+that annotate with ``ee`` types postpone the evaluation of their annotations for that reason.
+"""
+import importlib
+import threading
+
+_module = None
+_initialized = False
+_lock = threading.Lock()
+
+
+def load_module():
+    """Import the backend, without initializing it
+
+    Returns:
+        module: ee or service.ee_emulator
+    """
+    global _module
+    if _module is None:
+        with _lock:
+            if _module is None:
+                from django.conf import settings
+                if getattr(settings, 'EE_BACKEND', 'earthengine') == 'emulator':
+                    module = importlib.import_module('.ee_emulator', __package__)
+                    module.configure(**getattr(settings, 'EE_EMULATOR', {}))
+                else:
+                    module = importlib.import_module('ee')
+                _module = module
+    return _module
+
+
+def use_emulator(**options):
+    """Make the emulator the backend of this process, whatever the ``EE_BACKEND`` setting, e.g. in tests
+
+    Args:
+        **options: options of the emulator, see service.ee_emulator.configure()
+
+    Raises:
+        RuntimeError: the ``ee`` client library is already the backend
+
+    Returns:
+        module: service.ee_emulator
+    """
+    global _module
+    with _lock:
+        if _module is None:
+            _module = importlib.import_module('.ee_emulator', __package__)
+        elif _module.__name__ != f'{__package__}.ee_emulator':
+            raise RuntimeError("The Earth Engine client library is already in use")
+    _module.configure(**options)
+    return _module
+
+
+def ensure_initialized():
+    """Initialize the backend with the service account credentials, once per process; thread-safe
+
+    A failed initialization raises and is attempted again on the next use.
+    """
+    global _initialized
+    if not _initialized:
+        module = load_module()
+        from utils.credential import get_credentials
+        credentials = get_credentials()
+        with _lock:
+            if not _initialized:
+                module.Initialize(credentials)
+                _initialized = True
+
+
+def prepare_fork():
+    """Import the backend and fetch the access token of the credentials, without initializing the backend
+
+    For a process that forks the workers, e.g. the gunicorn master (see gunicorn.conf.py): the
+    workers share the imported modules and start with a valid token, and each one initializes its
+    own client and connections.
+    """
+    from utils.credential import warm_credentials
+    load_module()
+    warm_credentials()
+
+
+class _LazyModule:
+    """Stands for the backend module and initializes it on first use, see ensure_initialized()"""
+
+    def __getattr__(self, name):
+        ensure_initialized()
+        value = getattr(_module, name)
+        # later lookups of the attribute skip __getattr__
+        setattr(self, name, value)
+        return value
+
+    def __repr__(self):
+        return f"<lazy Earth Engine module {_module!r}>"
+
+
+ee = _LazyModule()
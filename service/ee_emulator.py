@@ -0,0 +1,1727 @@
+"""In-process stand-in for the subset of the Earth Engine API used by the service.
+
+It is selected with ``EE_BACKEND = 'emulator'``, see service.ee_client, to run the pipelines
+offline in benchmarks and tests. Objects build a graph like the ``ee`` client library does, and
+the requests (getInfo, getMapId, getThumbURL, task starts...) evaluate it with NumPy on small
+synthetic rasters instead of sending it to Earth Engine:
+
+- every dataset is a time series of random images on a single grid of ``width`` x ``height``
+  pixels covering ``bounds``, the Terai belt by default, with seasonal rice fields;
+- the scale and projection of reductions and samples are ignored, everything is computed on that
+  grid; geometries are rasterized on the pixel centers;
+- classifiers are nearest-centroid models, whatever the algorithm and its parameters;
+- map ids, thumbnails and exports are computed but produce no file, their urls are fake.
+
+Every request sleeps for ``latency`` seconds and is counted with the number of nodes of its
+graph, see get_stats(). Only the functions and arguments used by the service are implemented.
+"""
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+import warnings
+import zlib
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+_config = {
+    # west, south, east, north of the grid
+    'bounds': (80.0, 26.3, 88.3, 29.2),
+    'width': 256,
+    'height': 96,
+    # dates of the synthetic datasets
+    'start_date': '2015-01-01',
+    'end_date': '2024-01-01',
+    # seconds added to every request
+    'latency': 0.0,
+    'seed': 0,
+}
+
+
+def configure(**options):
+    """Change the grid, the dates of the datasets, the latency of the requests or the random seed
+
+    Raises:
+        ValueError: unknown option
+    """
+    unknown = set(options) - set(_config)
+    if unknown:
+        raise ValueError(f"Unknown emulator options: {', '.join(sorted(unknown))}")
+    _config.update(options)
+    with _cache_lock:
+        _datasets.clear()
+        _masks.clear()
+        _rice_fields.clear()
+
+
+class EEException(Exception):
+    pass
+
+
+# -- requests ---------------------------------------------------------------------------------
+
+_stats_lock = threading.Lock()
+_round_trips = Counter()
+_nodes = Counter()
+
+
+def get_stats():
+    """Requests made since the last reset_stats()
+
+    Returns:
+        dict: the number of requests (round_trips) and the total number of graph nodes they sent (nodes), by method
+    """
+    with _stats_lock:
+        return {'round_trips': dict(_round_trips), 'nodes': dict(_nodes)}
+
+
+def reset_stats():
+    with _stats_lock:
+        _round_trips.clear()
+        _nodes.clear()
+
+
+def evaluate(obj):
+    """Value of an object, computed without a request, for the tests comparing the pipelines with service.local_engine
+
+    Returns:
+        dict of float32 arrays, NaN where masked, for an image; list of (properties, bands) tuples
+        for a collection of images; the result of getInfo() for anything else
+    """
+    value = _evaluate(obj._node, _Scope())
+    if isinstance(value, _Image):
+        return dict(value.bands)
+    if isinstance(value, _Collection) and all(isinstance(e, _Image) for e in value.elements):
+        return [(dict(e.props), dict(e.bands)) for e in value.elements]
+    return _to_info(value)
+
+
+def _request(method, obj, compute):
+    nodes = _count_nodes(obj) if obj is not None else 0
+    with _stats_lock:
+        _round_trips[method] += 1
+        _nodes[method] += nodes
+    if _config['latency']:
+        time.sleep(_config['latency'])
+    return compute()
+
+
+def Initialize(credentials=None, **kwargs):
+    pass
+
+
+def Reset():
+    pass
+
+
+class ServiceAccountCredentials:
+    def __init__(self, email, key_file=None, key_data=None):
+        self.email = email
+        self.key_file = key_file
+        self.key_data = key_data
+
+
+# -- graph ------------------------------------------------------------------------------------
+
+_seq = itertools.count()
+_MISSING = object()
+
+
+class _Node:
+    """A function call of the graph, evaluated once per scope"""
+    __slots__ = ('seq', 'name', 'func', 'args', 'raw')
+
+    def __init__(self, name, func, args=(), raw=False):
+        self.seq = next(_seq)
+        self.name = name
+        self.func = func
+        self.args = args
+        # raw functions get the scope and their unevaluated arguments
+        self.raw = raw
+
+
+class _Body:
+    """A function mapped over a collection, traced once with a variable standing for the element"""
+
+    def __init__(self, cls, func):
+        self.variable = _Node('variable', None)
+        result = func(cls(self.variable))
+        self.result = result if isinstance(result, ComputedObject) else ComputedObject(_constant(result))
+        # nodes created while tracing may depend on the variable, their values are kept per element
+        self.start, self.end = self.variable.seq, next(_seq)
+
+
+class _Scope:
+    def __init__(self, parent=None, start=None, end=None):
+        self.parent = parent
+        self.start, self.end = start, end
+        self.values = {}
+
+    def lookup(self, seq):
+        scope = self
+        while scope is not None:
+            value = scope.values.get(seq, _MISSING)
+            if value is not _MISSING:
+                return value
+            scope = scope.parent
+        return _MISSING
+
+    def store(self, seq, value):
+        scope = self
+        while scope.parent is not None and not scope.start <= seq < scope.end:
+            scope = scope.parent
+        scope.values[seq] = value
+
+
+def _constant(value):
+    return _Node('constant', lambda: value)
+
+
+def _evaluate(node, scope):
+    value = scope.lookup(node.seq)
+    if value is not _MISSING:
+        return value
+    if node.func is None:
+        raise EEException("A mapped function's arguments cannot be used outside of the function")
+    if node.raw:
+        value = node.func(scope, *node.args)
+    else:
+        value = node.func(*[_resolve(arg, scope) for arg in node.args])
+    scope.store(node.seq, value)
+    return value
+
+
+def _resolve(arg, scope):
+    if isinstance(arg, ComputedObject):
+        return _evaluate(arg._node, scope)
+    if isinstance(arg, _Spec):
+        return arg._bind(scope)
+    if isinstance(arg, (list, tuple)):
+        return type(arg)(_resolve(a, scope) for a in arg)
+    if isinstance(arg, dict):
+        return {k: _resolve(v, scope) for k, v in arg.items()}
+    return arg
+
+
+def _children(arg):
+    # nodes and specs referenced by an argument
+    if isinstance(arg, ComputedObject):
+        yield arg._node
+    elif isinstance(arg, (_Node, _Spec)):
+        yield arg
+    elif isinstance(arg, _Body):
+        yield arg.result._node
+    elif isinstance(arg, (list, tuple)):
+        for a in arg:
+            yield from _children(a)
+    elif isinstance(arg, dict):
+        for a in arg.values():
+            yield from _children(a)
+
+
+def _walk(obj):
+    seen = {}
+    stack = list(_children(obj))
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen[id(item)] = item
+        stack.extend(_children(list(item.args)))
+    return list(seen.values())
+
+
+def _count_nodes(obj):
+    return len(_walk(obj))
+
+
+def _json_value(arg, ids):
+    if isinstance(arg, (ComputedObject, _Node, _Spec)):
+        return {'valueReference': ids[id(arg._node if isinstance(arg, ComputedObject) else arg)]}
+    if isinstance(arg, _Body):
+        return {'functionDefinitionValue': {'argumentNames': ['_MAPPING_VAR_0'], 'body': ids[id(arg.result._node)]}}
+    if isinstance(arg, (list, tuple)):
+        return [_json_value(a, ids) for a in arg]
+    if isinstance(arg, dict):
+        return {str(k): _json_value(v, ids) for k, v in arg.items()}
+    if callable(arg):
+        return getattr(arg, '__name__', 'function')
+    return arg
+
+
+def _to_json(obj, opt_pretty=False):
+    """Serialize the graph of an object; its size grows with the graph like the one of the ee client"""
+    items = _walk(obj)
+    ids = {id(item): str(i) for i, item in enumerate(items)}
+    values = {ids[id(item)]: {'functionInvocationValue': {'functionName': item.name, 'arguments': _json_value(list(item.args), ids)}}
+              for item in items}
+    result = ids[id(obj._node if isinstance(obj, ComputedObject) else obj)]
+    return json.dumps({'result': result, 'values': values}, indent=2 if opt_pretty else None, default=str)
+
+
+class serializer:
+    toJSON = staticmethod(_to_json)
+
+
+# -- values -----------------------------------------------------------------------------------
+
+class _Image:
+    """Value of an image: float32 bands, NaN where masked, loaded on first use for the datasets"""
+    __slots__ = ('_bands', '_loader', 'names', 'props')
+
+    def __init__(self, bands=None, props=None, names=None, loader=None):
+        self._bands = bands
+        self._loader = loader
+        self.names = list(bands) if bands is not None else list(names)
+        self.props = dict(props or {})
+
+    @property
+    def bands(self):
+        if self._bands is None:
+            self._bands = self._loader()
+            self._loader = None
+        return self._bands
+
+    def with_props(self, props):
+        return _Image(self._bands, props, self.names, self._loader) if self._bands is None else _Image(self._bands, props)
+
+
+class _Feature:
+    __slots__ = ('geometry', 'props')
+
+    def __init__(self, geometry, props=None):
+        self.geometry = geometry
+        self.props = dict(props or {})
+
+    def with_props(self, props):
+        return _Feature(self.geometry, props)
+
+
+class _Collection:
+    __slots__ = ('elements', 'props')
+
+    def __init__(self, elements, props=None):
+        self.elements = list(elements)
+        self.props = dict(props or {})
+
+
+class _Model:
+    """A trained nearest-centroid classifier"""
+
+    def __init__(self, inputs, classes, centroids, spread):
+        self.inputs = inputs
+        self.classes = classes
+        self.centroids = centroids
+        self.spread = spread
+
+    def predict(self, values):
+        # values of shape (n, inputs); NaN where any input is NaN
+        distances = (((values[:, np.newaxis, :] - self.centroids[np.newaxis]) / self.spread) ** 2).sum(axis=2)
+        with np.errstate(invalid='ignore'):
+            res = self.classes[np.argmin(np.nan_to_num(distances, nan=np.inf), axis=1)].astype(np.float32)
+        res[np.isnan(values).any(axis=1)] = np.nan
+        return res
+
+
+def _to_info(value):
+    if isinstance(value, _Image):
+        return {
+            'type': 'Image',
+            'bands': [{'id': name, 'data_type': {'type': 'PixelType', 'precision': 'float'},
+                       'dimensions': [_config['width'], _config['height']], 'crs': 'EPSG:4326'}
+                      for name in value.names],
+            'properties': _to_info(value.props),
+        }
+    if isinstance(value, _Feature):
+        info = {'type': 'Feature', 'geometry': value.geometry,
+                'properties': _to_info({k: v for k, v in value.props.items() if not k.startswith('system:')})}
+        if 'system:index' in value.props:
+            info['id'] = value.props['system:index']
+        return info
+    if isinstance(value, _Collection):
+        images = bool(value.elements) and isinstance(value.elements[0], _Image)
+        info = {'type': 'ImageCollection' if images else 'FeatureCollection', 'features': [_to_info(e) for e in value.elements]}
+        if images:
+            info['bands'] = []
+        else:
+            info['columns'] = {}
+        info['properties'] = _to_info(value.props)
+        return info
+    if isinstance(value, _Model):
+        return {'type': 'Classifier'}
+    if isinstance(value, np.ndarray):
+        return _to_info(value.tolist())
+    if isinstance(value, np.generic):
+        return _to_info(value.item())
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, (list, tuple)):
+        return [_to_info(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _to_info(v) for k, v in value.items()}
+    return value
+
+
+# -- grid and geometries ----------------------------------------------------------------------
+
+_cache_lock = threading.Lock()
+_masks = OrderedDict()
+_MASK_CACHE_SIZE = 64
+
+
+def _grid():
+    west, south, east, north = _config['bounds']
+    width, height = _config['width'], _config['height']
+    return west, north, (east - west) / width, (north - south) / height, width, height
+
+
+def grid_transform():
+    """Affine transform of the grid as [x scale, x shear, west, y shear, y scale, north], see service.local_export.plan_tiles()"""
+    west, north, dx, dy, _, _ = _grid()
+    return [dx, 0, west, 0, -dy, north]
+
+
+def _pixel_centers():
+    west, north, dx, dy, width, height = _grid()
+    return west + (np.arange(width) + 0.5) * dx, north - (np.arange(height) + 0.5) * dy
+
+
+def _polygon_mask(rings, mask):
+    # even-odd rule on the pixel centers, row by row
+    west, north, dx, dy, width, height = _grid()
+    crossings = np.zeros((height, width + 1), dtype=np.int32)
+    for ring in rings:
+        ring = np.asarray(ring, dtype=np.float64)[:, :2]
+        x0, y0 = ring[:-1, 0], ring[:-1, 1]
+        x1, y1 = ring[1:, 0], ring[1:, 1]
+        for ax, ay, bx, by in zip(x0, y0, x1, y1):
+            if ay == by:
+                continue
+            # rows whose center lies in [min y, max y)
+            low, high = min(ay, by), max(ay, by)
+            first = max(int(np.ceil((north - high) / dy - 0.5)), 0)
+            last = min(int(np.floor((north - low) / dy - 0.5)), height - 1)
+            if first > last:
+                continue
+            rows = np.arange(first, last + 1)
+            y = north - (rows + 0.5) * dy
+            rows, y = rows[(y >= low) & (y < high)], y[(y >= low) & (y < high)]
+            x = ax + (y - ay) * (bx - ax) / (by - ay)
+            # the pixels left of the crossing
+            cols = np.clip(np.ceil((x - west) / dx - 0.5), 0, width).astype(int)
+            np.add.at(crossings, (rows, cols), 1)
+    inside = np.cumsum(crossings[:, ::-1], axis=1)[:, ::-1][:, 1:] % 2 == 1
+    mask |= inside
+
+
+def _point_index(lon, lat):
+    west, north, dx, dy, width, height = _grid()
+    col, row = int(np.floor((lon - west) / dx)), int(np.floor((north - lat) / dy))
+    if 0 <= row < height and 0 <= col < width:
+        return row, col
+    return None
+
+
+def _rasterize(geometry, mask):
+    kind = geometry['type']
+    if kind == 'Point':
+        index = _point_index(*geometry['coordinates'][:2])
+        if index is not None:
+            mask[index] = True
+    elif kind == 'MultiPoint':
+        for point in geometry['coordinates']:
+            _rasterize({'type': 'Point', 'coordinates': point}, mask)
+    elif kind == 'Polygon':
+        _polygon_mask(geometry['coordinates'], mask)
+    elif kind == 'MultiPolygon':
+        for polygon in geometry['coordinates']:
+            _polygon_mask(polygon, mask)
+    elif kind == 'GeometryCollection':
+        for part in geometry['geometries']:
+            _rasterize(part, mask)
+
+
+def _geometry_mask(geometry):
+    """Pixels of the grid covered by a GeoJSON geometry, cached by geometry object"""
+    # the cache holds the geometry, so its id is not reused while it is cached
+    key = id(geometry)
+    with _cache_lock:
+        cached = _masks.get(key)
+        if cached is not None and cached[0] is geometry:
+            _masks.move_to_end(key)
+            return cached[1]
+    mask = np.zeros((_config['height'], _config['width']), dtype=bool)
+    _rasterize(geometry, mask)
+    mask.flags.writeable = False
+    with _cache_lock:
+        _masks[key] = (geometry, mask)
+        while len(_masks) > _MASK_CACHE_SIZE:
+            _masks.popitem(last=False)
+    return mask
+
+
+def _as_geometry(value):
+    # geometry of a Geometry, Feature or FeatureCollection value
+    if isinstance(value, _Feature):
+        return value.geometry
+    if isinstance(value, _Collection):
+        return {'type': 'GeometryCollection', 'geometries': [e.geometry for e in value.elements if e.geometry is not None]}
+    return value
+
+
+def _flatten_positions(coords):
+    if coords and isinstance(coords[0], (int, float)):
+        yield coords
+    else:
+        for c in coords:
+            yield from _flatten_positions(c)
+
+
+def _bounds(geometry):
+    positions = list(_flatten_positions(_geometry_positions(geometry)))
+    xs, ys = [p[0] for p in positions], [p[1] for p in positions]
+    west, south, east, north = min(xs), min(ys), max(xs), max(ys)
+    return {'type': 'Polygon', 'coordinates': [[[west, south], [east, south], [east, north], [west, north], [west, south]]]}
+
+
+def _geometry_positions(geometry):
+    if geometry['type'] == 'GeometryCollection':
+        return [_geometry_positions(part) for part in geometry['geometries']]
+    return geometry['coordinates']
+
+
+def _buffer(geometry, distance):
+    # only points, as the circles drawn on the map; a 32-gon of the radius in meters
+    if geometry['type'] != 'Point':
+        raise NotImplementedError("The emulator only buffers points")
+    lon, lat = geometry['coordinates'][:2]
+    angles = np.linspace(0, 2 * np.pi, 33)
+    r_lat = distance / 111320
+    r_lon = r_lat / np.cos(np.radians(lat))
+    ring = [[lon + r_lon * np.cos(a), lat + r_lat * np.sin(a)] for a in angles]
+    return {'type': 'Polygon', 'coordinates': [ring]}
+
+
+# -- synthetic datasets -----------------------------------------------------------------------
+
+_rice_fields = {}
+
+
+def _fields():
+    """Rice fields and other cropland of the grid, in blocks of 4x4 pixels"""
+    with _cache_lock:
+        if 'fields' not in _rice_fields:
+            height, width = _config['height'], _config['width']
+            rng = np.random.default_rng(_config['seed'])
+            blocks = rng.random((-(-height // 4), -(-width // 4)))
+            rice = np.kron(blocks < 0.35, np.ones((4, 4), dtype=bool))[:height, :width]
+            cropland = rice | np.kron(blocks > 0.7, np.ones((4, 4), dtype=bool))[:height, :width]
+            _rice_fields['fields'] = (rice, cropland)
+        return _rice_fields['fields']
+
+
+# reflectance of the surfaces: blue, green, red, nir, swir1, swir2
+_REFLECTANCE = {
+    'vegetation': np.array([0.04, 0.07, 0.06, 0.30, 0.20, 0.10]),
+    'water': np.array([0.06, 0.08, 0.05, 0.04, 0.02, 0.01]),
+    'crop': np.array([0.03, 0.06, 0.03, 0.45, 0.22, 0.09]),
+}
+_ROLES = ['blue', 'green', 'red', 'nir', 'swir1', 'swir2']
+
+_SENTINEL2_BANDS = {'B1': 'blue', 'B2': 'blue', 'B3': 'green', 'B4': 'red', 'B5': 'nir', 'B6': 'nir', 'B7': 'nir', 'B8': 'nir',
+                    'B8A': 'nir', 'B9': None, 'B11': 'swir1', 'B12': 'swir2'}
+
+# revisit time in days, band roles, scaling of the reflectance to the stored values, and cloud property
+_DATASETS = {
+    'COPERNICUS/S1_GRD': {'revisit': 6, 'radar': True},
+    'MODIS/006/MOD13Q1': {'revisit': 16, 'indices': True},
+    'LANDSAT/LT05/C01/T1_TOA': {'revisit': 16, 'bands': {'B1': 'blue', 'B2': 'green', 'B3': 'red', 'B4': 'nir', 'B5': 'swir1', 'B6': None, 'B7': 'swir2'},
+                                'scale': 1, 'offset': 0, 'cloud': 'CLOUD_COVER'},
+    'LANDSAT/LT05/C01/T1_SR': {'revisit': 16, 'bands': {'B1': 'blue', 'B2': 'green', 'B3': 'red', 'B4': 'nir', 'B5': 'swir1', 'B6': None, 'B7': 'swir2'},
+                               'scale': 1e-4, 'offset': 0, 'cloud': 'CLOUD_COVER'},
+    'LANDSAT/LC08/C01/T1_TOA': {'revisit': 16, 'bands': {'B1': 'blue', 'B2': 'blue', 'B3': 'green', 'B4': 'red', 'B5': 'nir', 'B6': 'swir1', 'B7': 'swir2',
+                                                          'B8': 'red', 'B9': None, 'B10': None, 'B11': None},
+                                'scale': 1, 'offset': 0, 'cloud': 'CLOUD_COVER'},
+    'LANDSAT/LC08/C02/T1_L2': {'revisit': 16, 'bands': {'SR_B1': 'blue', 'SR_B2': 'blue', 'SR_B3': 'green', 'SR_B4': 'red', 'SR_B5': 'nir',
+                                                         'SR_B6': 'swir1', 'SR_B7': 'swir2'},
+                               'scale': 0.0000275, 'offset': -0.2, 'cloud': 'CLOUD_COVER'},
+    'LANDSAT/LE07/C02/T1_L2': {'revisit': 16, 'bands': {'SR_B1': 'blue', 'SR_B2': 'green', 'SR_B3': 'red', 'SR_B4': 'nir', 'SR_B5': 'swir1',
+                                                         'SR_B7': 'swir2'},
+                               'scale': 0.0000275, 'offset': -0.2, 'cloud': 'CLOUD_COVER'},
+    'COPERNICUS/S2': {'revisit': 5, 'bands': {**_SENTINEL2_BANDS, 'B10': None}, 'scale': 1e-4, 'offset': 0, 'cloud': 'CLOUDY_PIXEL_PERCENTAGE'},
+    'COPERNICUS/S2_SR': {'revisit': 5, 'bands': _SENTINEL2_BANDS, 'scale': 1e-4, 'offset': 0, 'cloud': 'CLOUDY_PIXEL_PERCENTAGE'},
+}
+
+_datasets = {}
+
+
+def _season(millis):
+    # weights of the flooding and of the crop of the rice fields on that date
+    doy = (millis / 86400000) % 365.25
+    return np.exp(-((doy - 180) / 20) ** 2), np.exp(-((doy - 250) / 30) ** 2)
+
+
+def _load(asset_id, index, millis):
+    spec = _DATASETS[asset_id]
+    rng = np.random.default_rng([_config['seed'], zlib.crc32(asset_id.encode()), index])
+    rice, _ = _fields()
+    shape = rice.shape
+    flood, crop = _season(millis)
+
+    if spec.get('radar'):
+        vh = -15 + np.where(rice, 4 * crop - 8 * flood, 0) + rng.normal(0, 1.5, shape)
+        vv = vh + 6 + rng.normal(0, 1, shape)
+        return {'VV': vv.astype(np.float32), 'VH': vh.astype(np.float32)}
+
+    surface = {role: np.where(rice, _REFLECTANCE['vegetation'][i] * (1 - flood - crop) + _REFLECTANCE['water'][i] * flood
+                              + _REFLECTANCE['crop'][i] * crop, _REFLECTANCE['vegetation'][i])
+               + rng.normal(0, 0.01, shape) for i, role in enumerate(_ROLES)}
+    if spec.get('indices'):
+        nir, red, blue = surface['nir'], surface['red'], surface['blue']
+        ndvi = (nir - red) / (nir + red)
+        evi = 2.5 * (nir - red) / (nir + 6 * red - 7.5 * blue + 1)
+        return {'NDVI': (ndvi * 1e4).astype(np.float32), 'EVI': (evi * 1e4).astype(np.float32)}
+    return {band: (((surface[role] if role else np.full(shape, 0.1)) - spec['offset']) / spec['scale']).astype(np.float32)
+            for band, role in spec['bands'].items()}
+
+
+def _dataset(asset_id):
+    """Dates and properties of the images of a synthetic dataset; the pixels are generated on use"""
+    with _cache_lock:
+        if asset_id in _datasets:
+            return _datasets[asset_id]
+    if asset_id not in _DATASETS:
+        raise EEException(f"ImageCollection.load: ImageCollection asset '{asset_id}' not found.")
+    spec = _DATASETS[asset_id]
+    from .dates import DAY_MILLIS, to_millis
+
+    rng = np.random.default_rng([_config['seed'], zlib.crc32(asset_id.encode())])
+    start, end = to_millis(_config['start_date']), to_millis(_config['end_date'])
+    images = []
+    for i, millis in enumerate(range(start, end, spec['revisit'] * DAY_MILLIS)):
+        props = {'system:time_start': millis, 'system:index': time.strftime('%Y%m%d', time.gmtime(millis // 1000)) + f'_{i}'}
+        if spec.get('radar'):
+            props.update({'instrumentMode': 'IW', 'transmitterReceiverPolarisation': ['VV', 'VH'],
+                          'orbitProperties_pass': 'ASCENDING' if i % 2 else 'DESCENDING'})
+            names = ['VV', 'VH']
+        elif spec.get('indices'):
+            names = ['NDVI', 'EVI']
+        else:
+            props[spec['cloud']] = float(rng.uniform(0, 100))
+            names = list(spec['bands'])
+        images.append((i, millis, names, props))
+    with _cache_lock:
+        _datasets[asset_id] = images
+    return images
+
+
+def _load_collection(asset_id):
+    return _Collection(_Image(None, props, names, lambda i=i, millis=millis: _load(asset_id, i, millis))
+                       for i, millis, names, props in _dataset(asset_id))
+
+
+def _load_image(asset_id):
+    if asset_id in _DATASETS:
+        raise EEException(f"Image.load: Asset '{asset_id}' is not an Image.")
+    # any other asset is a crop mask
+    _, cropland = _fields()
+    return _Image({'b1': cropland.astype(np.float32)}, {'system:index': asset_id})
+
+
+# -- image operations -------------------------------------------------------------------------
+
+def _full(value):
+    return np.full((_config['height'], _config['width']), value, dtype=np.float32)
+
+
+def _as_image(value):
+    if isinstance(value, _Image):
+        return value
+    if isinstance(value, (list, tuple)):
+        return _Image({f'constant_{i}': _full(v) for i, v in enumerate(value)})
+    return _Image({'constant': _full(value)})
+
+
+def _pairs(a, b):
+    # band matching of binary operations: a single band is paired with every band of the other image
+    if len(a.names) == 1 and len(b.names) > 1:
+        return [(n, a.bands[a.names[0]], b.bands[n]) for n in b.names]
+    if len(b.names) == 1:
+        return [(n, a.bands[n], b.bands[b.names[0]]) for n in a.names]
+    if len(a.names) == len(b.names):
+        return [(n, a.bands[n], b.bands[m]) for n, m in zip(a.names, b.names)]
+    raise EEException(f"Images must contain the same number of bands or only 1 band. Got {len(a.names)} and {len(b.names)}.")
+
+
+def _binary(op, logical=False):
+    def apply(a, b):
+        a, b = _as_image(a), _as_image(b)
+        bands = {}
+        with np.errstate(all='ignore'):
+            for name, x, y in _pairs(a, b):
+                res = op(x, y).astype(np.float32)
+                if logical:
+                    res[np.isnan(x) | np.isnan(y)] = np.nan
+                bands[name] = res
+        return _Image(bands)
+    return apply
+
+
+def _unary(op):
+    def apply(a):
+        with np.errstate(all='ignore'):
+            return _Image({n: op(v).astype(np.float32) for n, v in a.bands.items()})
+    return apply
+
+
+def _update_mask(image, mask):
+    if mask is None:
+        # like an omitted argument
+        return image
+    mask = _as_image(mask)
+    bands = {}
+    for name, x, m in _pairs(image, mask):
+        bands[name] = np.where((m != 0) & ~np.isnan(m), x, np.nan).astype(np.float32)
+    return _Image(bands, image.props)
+
+
+def _unmask(image, value=0):
+    return _Image({n: np.where(np.isnan(v), np.float32(value), v) for n, v in image.bands.items()}, image.props)
+
+
+def _clip(image, geometry):
+    mask = _geometry_mask(_as_geometry(geometry))
+    return _Image({n: np.where(mask, v, np.nan).astype(np.float32) for n, v in image.bands.items()}, image.props)
+
+
+def _select_names(names, selectors):
+    selected = []
+    for selector in selectors:
+        if isinstance(selector, int):
+            selected.append(names[selector])
+            continue
+        matches = [n for n in names if n == selector] or [n for n in names if re.fullmatch(selector, n)]
+        if not matches:
+            raise EEException(f"Image.select: Pattern '{selector}' did not match any bands.")
+        selected.extend(matches)
+    return selected
+
+
+def _select(image, selectors, new_names=None):
+    names = _select_names(image.names, selectors)
+    new_names = new_names or names
+    if image._bands is None:
+        return _Image(None, image.props, new_names, lambda: {m: image.bands[n] for n, m in zip(names, new_names)})
+    return _Image({m: image.bands[n] for n, m in zip(names, new_names)}, image.props)
+
+
+def _rename(image, names):
+    if len(names) != len(image.names):
+        raise EEException(f"Image.rename: The number of names ({len(names)}) must match the number of bands ({len(image.names)}).")
+    return _Image(dict(zip(names, image.bands.values())), image.props)
+
+
+def _add_bands(image, other):
+    return _Image({**image.bands, **other.bands}, image.props)
+
+
+_EXPRESSION_FUNCTIONS = {
+    'abs': np.abs, 'sqrt': np.sqrt, 'exp': np.exp, 'log': np.log, 'log10': np.log10,
+    'min': np.minimum, 'max': np.maximum, 'pi': np.pi,
+}
+
+
+def _expression(image, expression, variables=None):
+    match = re.match(r'^\s*(\w+)\s*=(?!=)(.*)$', expression, re.S)
+    name, expression = (match[1], match[2]) if match else ('constant', expression)
+
+    def band(selector):
+        return image.bands[image.names[selector] if isinstance(selector, int) else selector]
+
+    namespace = dict(_EXPRESSION_FUNCTIONS, b=band)
+    for key, value in (variables or {}).items():
+        namespace[key] = value.bands[value.names[0]] if isinstance(value, _Image) else value
+    with np.errstate(all='ignore'):
+        res = eval(compile(expression.strip(), '<expression>', 'eval'), {'__builtins__': {}}, namespace)
+    return _Image({name: np.broadcast_to(np.asarray(res, dtype=np.float32), (_config['height'], _config['width'])).copy()})
+
+
+def _normalized_difference(image, names=None):
+    a, b = names or image.names[:2]
+    x, y = image.bands[a], image.bands[b]
+    with np.errstate(all='ignore'):
+        return _Image({'nd': ((x - y) / (x + y)).astype(np.float32)})
+
+
+def _reduce_neighborhood(image, reducer, kernel, inputWeight='kernel', skipMasked=True, optimization=None):
+    from .local_speckle_filters import boxcar
+
+    if kernel.shape != 'square':
+        raise NotImplementedError("The emulator only supports square kernels")
+    if reducer.name not in ('median', 'mean'):
+        raise NotImplementedError("The emulator only supports median and mean neighborhoods")
+    return _Image({f'{n}_{reducer.name}': boxcar(v, int(kernel.radius), reducer.name) for n, v in image.bands.items()})
+
+
+def _pixel_area():
+    west, north, dx, dy, width, height = _grid()
+    _, lats = _pixel_centers()
+    rows = (dx * 111320 * np.cos(np.radians(lats))) * (dy * 110574)
+    return _Image({'area': np.repeat(rows[:, np.newaxis], width, axis=1).astype(np.float32)})
+
+
+def _reduce_region(image, reducer, geometry=None, scale=None, crs=None, crsTransform=None, bestEffort=False, maxPixels=None, tileScale=1):
+    mask = _geometry_mask(_as_geometry(geometry)) if geometry is not None else np.ones((_config['height'], _config['width']), dtype=bool)
+    res = {}
+    for name, values in image.bands.items():
+        values = values[mask]
+        res[name] = reducer.reduce(values[~np.isnan(values)])
+    return res
+
+
+def _reduce_regions(image, collection, reducer, scale=None, crs=None, crsTransform=None, tileScale=1):
+    # a single band is reduced into a property named after the reducer, like Earth Engine does
+    out = []
+    for feature in collection.elements:
+        stats = _reduce_region(image, reducer, feature)
+        if len(stats) == 1:
+            stats = {reducer.name: next(iter(stats.values()))}
+        out.append(feature.with_props({**feature.props, **stats}))
+    return _Collection(out, collection.props)
+
+
+def _reduce_bands(image, reducer):
+    stack = np.stack(list(image.bands.values()))
+    return _Image({reducer.name: reducer.reduce_axis(stack).astype(np.float32)})
+
+
+def _geometry_pixels(geometry):
+    if geometry['type'] == 'Point':
+        index = _point_index(*geometry['coordinates'][:2])
+        return (np.array([index[0]]), np.array([index[1]])) if index else (np.array([], int), np.array([], int))
+    return np.nonzero(_geometry_mask(geometry))
+
+
+def _sample_regions(image, collection, properties=None, scale=None, projection=None, tileScale=1, geometries=False):
+    west, north, dx, dy, _, _ = _grid()
+    names = image.names
+    out = []
+    for feature in collection.elements:
+        rows, cols = _geometry_pixels(_as_geometry(feature))
+        if not len(rows):
+            continue
+        values = np.stack([image.bands[n][rows, cols] for n in names], axis=1)
+        copied = {k: v for k, v in feature.props.items() if not k.startswith('system:') and (properties is None or k in properties)}
+        index = feature.props.get('system:index', '0')
+        for k in np.nonzero(~np.isnan(values).any(axis=1))[0]:
+            props = {**copied, **{n: float(v) for n, v in zip(names, values[k])}, 'system:index': f'{index}_{k}'}
+            geometry = None
+            if geometries:
+                geometry = {'type': 'Point', 'coordinates': [west + (cols[k] + 0.5) * dx, north - (rows[k] + 0.5) * dy]}
+            out.append(_Feature(geometry, props))
+    return _Collection(out)
+
+
+def _classify_image(image, model, outputName='classification'):
+    values = np.stack([image.bands[n].ravel() for n in model.inputs], axis=1)
+    return _Image({outputName: model.predict(values).reshape(_config['height'], _config['width'])})
+
+
+# -- collection operations --------------------------------------------------------------------
+
+def _collection_reduce(method):
+    def reduce(collection):
+        from .local_engine import reduce_images
+
+        if not collection.elements:
+            return _Image({})
+        names = collection.elements[0].names
+        bands = {}
+        for name in names:
+            stack = np.stack([image.bands[name] for image in collection.elements])
+            if method == 'or':
+                res = np.where(np.isnan(stack).all(axis=0), np.nan, (np.nan_to_num(stack) != 0).any(axis=0))
+            elif method == 'and':
+                res = np.where(np.isnan(stack).all(axis=0), np.nan, ((stack != 0) | np.isnan(stack)).all(axis=0))
+            elif method == 'sum':
+                res = np.where(np.isnan(stack).all(axis=0), np.nan, np.nansum(stack, axis=0))
+            else:
+                res = reduce_images(stack, {'min': 'minimum', 'max': 'maximum'}.get(method, method))
+            bands[name] = np.asarray(res, dtype=np.float32)
+        return _Image(bands)
+    return reduce
+
+
+def _to_bands(collection):
+    bands = {}
+    for i, image in enumerate(collection.elements):
+        index = image.props.get('system:index', str(i))
+        for name in image.names:
+            bands[f'{index}_{name}'] = image.bands[name]
+    return _Image(bands)
+
+
+def _map(scope, collection, body):
+    collection = _evaluate(collection._node, scope)
+    out = []
+    for element in collection.elements:
+        child = _Scope(scope, body.start, body.end)
+        child.values[body.variable.seq] = element
+        value = _evaluate(body.result._node, child)
+        if value is None:
+            continue
+        if isinstance(value, (_Image, _Feature)) and 'system:index' not in value.props and 'system:index' in element.props:
+            value = value.with_props({**value.props, 'system:index': element.props['system:index']})
+        out.append(value)
+    return _Collection(out, collection.props)
+
+
+def _map_list(scope, values, body):
+    out = []
+    for value in _resolve(values, scope):
+        child = _Scope(scope, body.start, body.end)
+        child.values[body.variable.seq] = value
+        out.append(_evaluate(body.result._node, child))
+    return out
+
+
+def _millis(value):
+    if isinstance(value, str):
+        from .dates import to_millis
+        return to_millis(value)
+    return int(value)
+
+
+def _filter_date(collection, start, end=None):
+    start = _millis(start)
+    end = _millis(end) if end is not None else start + 1
+    return _Collection([e for e in collection.elements if start <= e.props.get('system:time_start', -1) < end], collection.props)
+
+
+def _set(element, *args):
+    props = dict(element.props)
+    if len(args) == 1:
+        props.update(args[0])
+    else:
+        for key, value in zip(args[::2], args[1::2]):
+            props[key] = value
+    if isinstance(element, _Collection):
+        return _Collection(element.elements, props)
+    return element.with_props(props)
+
+
+def _copy_properties(element, source, properties=None, exclude=None):
+    if properties is None:
+        copied = {k: v for k, v in source.props.items() if not k.startswith('system:') and k not in (exclude or [])}
+    else:
+        copied = {k: source.props[k] for k in properties if k in source.props}
+    return element.with_props({**element.props, **copied})
+
+
+def _get(element, key):
+    if isinstance(element, dict):
+        if key not in element:
+            raise EEException(f"Dictionary.get: Dictionary does not contain key: {key}.")
+        return element[key]
+    return element.props.get(key)
+
+
+def _random_column(collection, columnName='random', seed=0, distribution='uniform'):
+    rng = np.random.default_rng([_config['seed'], seed])
+    values = rng.random(len(collection.elements))
+    return _Collection([e.with_props({**e.props, columnName: float(v)}) for e, v in zip(collection.elements, values)], collection.props)
+
+
+def _train(features, classProperty, inputProperties=None):
+    if not features.elements:
+        raise EEException("Classifier.train: Training data is empty.")
+    if inputProperties is None:
+        inputProperties = features.props.get('band_order') or \
+            [k for k in features.elements[0].props if not k.startswith('system:') and k != classProperty]
+    values = np.array([[f.props[k] for k in inputProperties] for f in features.elements], dtype=np.float64)
+    labels = np.array([f.props[classProperty] for f in features.elements])
+    classes = np.unique(labels)
+    centroids = np.stack([values[labels == c].mean(axis=0) for c in classes])
+    spread = values.std(axis=0)
+    spread[spread == 0] = 1
+    return _Model(list(inputProperties), classes, centroids, spread)
+
+
+def _classify_features(collection, model, outputName='classification'):
+    if not collection.elements:
+        return collection
+    values = np.array([[f.props.get(k, np.nan) for k in model.inputs] for f in collection.elements], dtype=np.float64)
+    predicted = model.predict(values)
+    return _Collection([f.with_props({**f.props, outputName: int(p) if not np.isnan(p) else None})
+                        for f, p in zip(collection.elements, predicted)], collection.props)
+
+
+def _error_matrix(collection, actual, predicted, order=None):
+    pairs = [(int(f.props[actual]), int(f.props[predicted])) for f in collection.elements if f.props.get(predicted) is not None]
+    size = max([max(p) for p in pairs], default=0) + 1
+    matrix = np.zeros((size, size), dtype=np.int64)
+    for a, p in pairs:
+        matrix[a, p] += 1
+    return matrix
+
+
+def _accuracy(matrix):
+    total = matrix.sum()
+    return float(np.trace(matrix) / total) if total else 0.0
+
+
+def _kappa(matrix):
+    total = matrix.sum()
+    if not total:
+        return 0.0
+    observed = np.trace(matrix) / total
+    expected = (matrix.sum(axis=0) * matrix.sum(axis=1)).sum() / total ** 2
+    return float((observed - expected) / (1 - expected)) if expected != 1 else 0.0
+
+
+def _join_save_all(primary, secondary, condition, matches_key, ordering=None, ascending=True, outer=False):
+    out = []
+    for left in primary.elements:
+        matches = [right for right in secondary.elements if condition.join_test(left.props, right.props)]
+        if ordering is not None:
+            matches.sort(key=lambda e: e.props.get(ordering), reverse=not ascending)
+        if matches or outer:
+            out.append(left.with_props({**left.props, matches_key: matches}))
+    return _Collection(out, primary.props)
+
+
+def _features_from_geojson(geojson):
+    features = geojson['features'] if geojson['type'] == 'FeatureCollection' else [geojson]
+    return [_Feature(f['geometry'], {**f.get('properties', {}), 'system:index': str(f.get('id', i))})
+            for i, f in enumerate(features)]
+
+
+# -- specs: filters, reducers, kernels, joins -------------------------------------------------
+
+class _Spec:
+    """An argument of a function that is not computed on its own, e.g. a filter or a reducer"""
+    name = 'Spec'
+    args = ()
+
+    def _bind(self, scope):
+        return self
+
+
+_COMPARISONS = {
+    'eq': lambda a, b: a == b,
+    'neq': lambda a, b: a != b,
+    'lt': lambda a, b: a is not None and a < b,
+    'lte': lambda a, b: a is not None and a <= b,
+    'gt': lambda a, b: a is not None and a > b,
+    'gte': lambda a, b: a is not None and a >= b,
+}
+
+
+class Filter(_Spec):
+
+    def __init__(self, filters=None, kind=None, args=()):
+        if isinstance(filters, Filter):
+            kind, args = filters.kind, filters.args
+        elif filters is not None:
+            kind, args = 'and', tuple(filters)
+        self.kind = kind or 'all'
+        self.args = args
+        self.name = f'Filter.{self.kind}'
+
+    def _bind(self, scope):
+        return Filter(kind=self.kind, args=tuple(_resolve(a, scope) for a in self.args))
+
+    def test(self, props):
+        kind, args = self.kind, self.args
+        if kind == 'all':
+            return True
+        if kind == 'and':
+            return all(f.test(props) for f in args)
+        if kind == 'or':
+            return any(f.test(props) for f in args)
+        if kind == 'not':
+            return not args[0].test(props)
+        if kind == 'date':
+            start, end = args
+            time_start = props.get('system:time_start')
+            return time_start is not None and _millis(start) <= time_start and (end is None or time_start < _millis(end))
+        if kind == 'listContains':
+            return args[1] in (props.get(args[0]) or [])
+        if kind == 'inList':
+            return props.get(args[0]) in args[1]
+        if kind in _COMPARISONS:
+            return _COMPARISONS[kind](props.get(args[0]), args[1])
+        raise NotImplementedError(f"The emulator cannot apply Filter.{kind} to an element")
+
+    def join_test(self, left, right):
+        if self.kind != 'equals':
+            raise NotImplementedError("The emulator only joins on Filter.equals")
+        left_field, right_field, left_value, right_value = self.args
+        a = left.get(left_field) if left_field is not None else left_value
+        b = right.get(right_field) if right_field is not None else right_value
+        return a is not None and a == b
+
+    @staticmethod
+    def date(start, end=None):
+        return Filter(kind='date', args=(start, end))
+
+    @staticmethod
+    def eq(name, value):
+        return Filter(kind='eq', args=(name, value))
+
+    @staticmethod
+    def neq(name, value):
+        return Filter(kind='neq', args=(name, value))
+
+    @staticmethod
+    def lt(name, value):
+        return Filter(kind='lt', args=(name, value))
+
+    @staticmethod
+    def lte(name, value):
+        return Filter(kind='lte', args=(name, value))
+
+    @staticmethod
+    def gt(name, value):
+        return Filter(kind='gt', args=(name, value))
+
+    @staticmethod
+    def gte(name, value):
+        return Filter(kind='gte', args=(name, value))
+
+    @staticmethod
+    def listContains(leftField=None, rightValue=None, rightField=None, leftValue=None):
+        return Filter(kind='listContains', args=(leftField, rightValue))
+
+    @staticmethod
+    def inList(leftField=None, rightValue=None, rightField=None, leftValue=None):
+        return Filter(kind='inList', args=(leftField, rightValue))
+
+    @staticmethod
+    def equals(leftField=None, rightValue=None, rightField=None, leftValue=None):
+        return Filter(kind='equals', args=(leftField, rightField, leftValue, rightValue))
+
+    @staticmethod
+    def And(*filters):
+        return Filter(kind='and', args=filters)
+
+    @staticmethod
+    def Or(*filters):
+        return Filter(kind='or', args=filters)
+
+    def Not(self):
+        return Filter(kind='not', args=(self,))
+
+
+_REDUCERS = {
+    'sum': (np.sum, np.nansum),
+    'mean': (np.mean, np.nanmean),
+    'median': (np.median, np.nanmedian),
+    'min': (np.min, np.nanmin),
+    'max': (np.max, np.nanmax),
+    'variance': (np.var, np.nanvar),
+    'stdDev': (np.std, np.nanstd),
+}
+
+
+class Reducer(_Spec):
+
+    def __init__(self, name):
+        self.name = name
+
+    def reduce(self, values):
+        """Reduce the valid values of a region"""
+        if self.name == 'count':
+            return int(values.size)
+        if not values.size:
+            return None
+        return float(_REDUCERS[self.name][0](values.astype(np.float64)))
+
+    def reduce_axis(self, stack):
+        """Reduce along the first axis, ignoring NaN"""
+        if self.name == 'count':
+            return (~np.isnan(stack)).sum(axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return _REDUCERS[self.name][1](stack, axis=0)
+
+    @staticmethod
+    def sum():
+        return Reducer('sum')
+
+    @staticmethod
+    def mean():
+        return Reducer('mean')
+
+    @staticmethod
+    def median():
+        return Reducer('median')
+
+    @staticmethod
+    def min():
+        return Reducer('min')
+
+    @staticmethod
+    def max():
+        return Reducer('max')
+
+    @staticmethod
+    def variance():
+        return Reducer('variance')
+
+    @staticmethod
+    def stdDev():
+        return Reducer('stdDev')
+
+    @staticmethod
+    def count():
+        return Reducer('count')
+
+
+class Kernel(_Spec):
+
+    def __init__(self, shape, radius):
+        self.shape = shape
+        self.radius = radius
+        self.name = f'Kernel.{shape}'
+
+    @staticmethod
+    def square(radius, units='pixels', normalize=True, magnitude=1):
+        return Kernel('square', radius)
+
+    @staticmethod
+    def circle(radius, units='pixels', normalize=True, magnitude=1):
+        return Kernel('circle', radius)
+
+
+class Join(_Spec):
+
+    def __init__(self, kind, matches_key, ordering=None, ascending=True, outer=False):
+        self.kind = kind
+        self.name = f'Join.{kind}'
+        self.args = (matches_key, ordering, ascending, outer)
+
+    @staticmethod
+    def saveAll(matchesKey, ordering=None, ascending=True, measureKey=None, outer=False):
+        return Join('saveAll', matchesKey, ordering, ascending, outer)
+
+    def apply(self, primary, secondary, condition):
+        cls = type(primary) if isinstance(primary, (ImageCollection, FeatureCollection)) else FeatureCollection
+        return _apply(cls, 'Join.apply', lambda p, s, c, join: _join_save_all(p, s, c, *join.args), primary, secondary, condition, self)
+
+
+# -- API --------------------------------------------------------------------------------------
+
+def _apply(cls, name, func, *args, raw=False):
+    return cls(_Node(name, func, args, raw))
+
+
+def _method(cls, name, func):
+    def method(self, *args, **kwargs):
+        return _apply(cls, name, lambda value, args, kwargs: func(value, *args, **kwargs), self, args, kwargs)
+    method.__name__ = name.split('.')[-1]
+    return method
+
+
+class ComputedObject:
+
+    def __init__(self, node):
+        self._node = node
+
+    def getInfo(self):
+        return _request('getInfo', self, lambda: _to_info(_evaluate(self._node, _Scope())))
+
+    def _cast(self, arg):
+        if isinstance(arg, ComputedObject):
+            self._node = arg._node
+            return True
+        if isinstance(arg, _Node):
+            self._node = arg
+            return True
+        return False
+
+    def get(self, prop):
+        return _apply(ComputedObject, 'Element.get', _get, self, prop)
+
+    def set(self, *args):
+        # cast to the class of the object, like the ee client does
+        return _apply(type(self), 'Element.set', lambda value, args: _set(value, *args), self, args)
+
+    def copyProperties(self, source=None, properties=None, exclude=None):
+        return _apply(Element, 'Element.copyProperties', _copy_properties, self, source, properties, exclude)
+
+
+class Element(ComputedObject):
+
+    def __init__(self, arg):
+        if not self._cast(arg):
+            raise EEException("Element can only be cast from a computed object")
+
+
+class Number(ComputedObject):
+
+    def __init__(self, number):
+        if not self._cast(number):
+            self._node = _constant(number)
+
+    def format(self, pattern='%s'):
+        def format_number(value):
+            try:
+                return pattern % value
+            except TypeError:
+                return pattern % int(value)
+        return _apply(String, 'Number.format', format_number, self)
+
+
+def _number_operation(name, op):
+    def method(self, *args):
+        return _apply(Number, f'Number.{name}', lambda *values: op(*values), self, *args)
+    method.__name__ = name
+    return method
+
+
+for _name, _op in {
+    'add': lambda a, b: a + b, 'subtract': lambda a, b: a - b, 'multiply': lambda a, b: a * b,
+    'divide': lambda a, b: a / b if b else 0, 'mod': lambda a, b: a % b, 'pow': lambda a, b: a ** b,
+    'min': min, 'max': max, 'floor': lambda a: float(np.floor(a)), 'ceil': lambda a: float(np.ceil(a)),
+    'round': lambda a: float(np.round(a)), 'abs': abs, 'int': int, 'toInt': int, 'long': int, 'float': float,
+    'double': float, 'lt': lambda a, b: int(a < b), 'lte': lambda a, b: int(a <= b), 'gt': lambda a, b: int(a > b),
+    'gte': lambda a, b: int(a >= b), 'eq': lambda a, b: int(a == b), 'neq': lambda a, b: int(a != b),
+}.items():
+    setattr(Number, _name, _number_operation(_name, _op))
+
+
+class String(ComputedObject):
+
+    def __init__(self, string):
+        if not self._cast(string):
+            self._node = _constant(string)
+
+    def cat(self, other):
+        return _apply(String, 'String.cat', lambda a, b: a + b, self, other)
+
+
+class List(ComputedObject):
+
+    def __init__(self, values):
+        if not self._cast(values):
+            self._node = _Node('List', lambda values: list(values), (list(values),))
+
+    def get(self, index):
+        return _apply(ComputedObject, 'List.get', lambda values, index: values[index], self, index)
+
+    def size(self):
+        return _apply(Number, 'List.size', len, self)
+
+    def cat(self, other):
+        return _apply(List, 'List.cat', lambda a, b: a + b, self, other)
+
+    def map(self, baseAlgorithm):
+        return _apply(List, 'List.map', _map_list, self, _Body(ComputedObject, baseAlgorithm), raw=True)
+
+    def removeAll(self, other):
+        return _apply(List, 'List.removeAll', lambda values, other: [v for v in values if v not in other], self, other)
+
+    @staticmethod
+    def sequence(start, end=None, step=None, count=None):
+        def sequence(start, end, step, count):
+            if count is not None:
+                return list(np.linspace(start, end, count))
+            return list(np.arange(start, end + (step or 1) / 2, step or 1))
+        return _apply(List, 'List.sequence', sequence, start, end, step, count)
+
+    @staticmethod
+    def repeat(value, count):
+        return _apply(List, 'List.repeat', lambda value, count: [value] * count, value, count)
+
+
+class Dictionary(ComputedObject):
+
+    def __init__(self, values=None):
+        if not self._cast(values):
+            self._node = _Node('Dictionary', lambda values: dict(values), (dict(values or {}),))
+
+    def get(self, key, defaultValue=None):
+        return _apply(ComputedObject, 'Dictionary.get', lambda d, key, default: d[key] if key in d or default is None else default,
+                      self, key, defaultValue)
+
+    def keys(self):
+        return _apply(List, 'Dictionary.keys', lambda d: sorted(d), self)
+
+    @staticmethod
+    def fromLists(keys, values):
+        return _apply(Dictionary, 'Dictionary.fromLists', lambda keys, values: dict(zip(keys, values)), keys, values)
+
+
+class Date(ComputedObject):
+
+    def __init__(self, date, tz=None):
+        if not self._cast(date):
+            self._node = _Node('Date', _millis, (date,))
+
+    def millis(self):
+        return _apply(Number, 'Date.millis', lambda millis: millis, self)
+
+    def advance(self, delta, unit):
+        def advance(millis, delta, unit):
+            from datetime import datetime, timezone
+            from dateutil.relativedelta import relativedelta
+
+            date = datetime.fromtimestamp(millis / 1000, tz=timezone.utc) + relativedelta(**{unit + 's': delta})
+            return int(date.timestamp() * 1000)
+        return _apply(Date, 'Date.advance', advance, self, delta, unit)
+
+
+class Geometry(ComputedObject):
+
+    def __init__(self, geo_json, opt_proj=None, opt_geodesic=None, opt_evenOdd=None):
+        if not self._cast(geo_json):
+            self._node = _constant(geo_json)
+
+    @staticmethod
+    def Point(coords, *args, **kwargs):
+        coords = [coords, args[0]] if args and not isinstance(coords, (list, tuple)) else coords
+        return Geometry({'type': 'Point', 'coordinates': list(coords)})
+
+    @staticmethod
+    def Polygon(coords, *args, **kwargs):
+        return Geometry({'type': 'Polygon', 'coordinates': coords})
+
+    @staticmethod
+    def MultiPolygon(coords, *args, **kwargs):
+        return Geometry({'type': 'MultiPolygon', 'coordinates': coords})
+
+    @staticmethod
+    def Rectangle(coords, *args, **kwargs):
+        west, south, east, north = coords
+        return Geometry({'type': 'Polygon', 'coordinates': [[[west, south], [east, south], [east, north], [west, north], [west, south]]]})
+
+    def bounds(self, maxError=None, proj=None):
+        return _apply(Geometry, 'Geometry.bounds', _bounds, self)
+
+    def buffer(self, distance, maxError=None, proj=None):
+        return _apply(Geometry, 'Geometry.buffer', _buffer, self, distance)
+
+
+def _geometry_method(self):
+    return _apply(Geometry, 'Collection.geometry', _as_geometry, self)
+
+
+class Feature(ComputedObject):
+
+    def __init__(self, geom, opt_properties=None):
+        if isinstance(geom, Geometry) or not self._cast(geom):
+            geometry = geom.get('geometry') if isinstance(geom, dict) and geom.get('type') == 'Feature' else geom
+            properties = geom.get('properties') if isinstance(geom, dict) and geom.get('type') == 'Feature' else opt_properties
+            self._node = _Node('Feature', lambda geometry, properties: _Feature(geometry, properties), (geometry, properties))
+
+    geometry = _geometry_method
+
+
+class Classifier(ComputedObject):
+
+    def __init__(self, arg):
+        if not self._cast(arg):
+            raise EEException("Classifier can only be cast from a computed object")
+
+    def train(self, features, classProperty, inputProperties=None, subsampling=1, subsamplingSeed=0):
+        return _apply(Classifier, 'Classifier.train', lambda _, *args: _train(*args), self, features, classProperty, inputProperties)
+
+    @staticmethod
+    def _spec(name, **specs):
+        return _apply(Classifier, f'Classifier.{name}', lambda specs: specs, specs)
+
+    @staticmethod
+    def smileRandomForest(numberOfTrees=None, **specs):
+        return Classifier._spec('smileRandomForest', numberOfTrees=numberOfTrees, **specs)
+
+    @staticmethod
+    def smileGradientTreeBoost(numberOfTrees=None, **specs):
+        return Classifier._spec('smileGradientTreeBoost', numberOfTrees=numberOfTrees, **specs)
+
+    @staticmethod
+    def libsvm(**specs):
+        return Classifier._spec('libsvm', **specs)
+
+    @staticmethod
+    def smileCart(**specs):
+        return Classifier._spec('smileCart', **specs)
+
+    @staticmethod
+    def smileNaiveBayes(**specs):
+        return Classifier._spec('smileNaiveBayes', **specs)
+
+
+class ConfusionMatrix(ComputedObject):
+
+    def __init__(self, arg):
+        if not self._cast(arg):
+            self._node = _constant(np.asarray(arg))
+
+    def array(self):
+        return _apply(ComputedObject, 'ConfusionMatrix.array', lambda m: m, self)
+
+    def accuracy(self):
+        return _apply(Number, 'ConfusionMatrix.accuracy', _accuracy, self)
+
+    def kappa(self):
+        return _apply(Number, 'ConfusionMatrix.kappa', _kappa, self)
+
+
+class _TileFetcher:
+    def __init__(self, url_format):
+        self.url_format = url_format
+
+
+def _fake_id(obj):
+    return hashlib.sha1(_to_json(obj).encode()).hexdigest()[:20]
+
+
+class Image(ComputedObject):
+
+    def __init__(self, args=None, version=None):
+        if self._cast(args):
+            return
+        if args is None:
+            args = 0
+        if isinstance(args, str):
+            self._node = _Node('Image.load', _load_image, (args,))
+        else:
+            self._node = _Node('Image.constant', _as_image, (args,))
+
+    @staticmethod
+    def constant(value):
+        return Image(value)
+
+    @staticmethod
+    def pixelArea():
+        return _apply(Image, 'Image.pixelArea', _pixel_area)
+
+    def select(self, *args, **kwargs):
+        selectors = args[0] if args and isinstance(args[0], (list, tuple, List)) else list(args)
+        new_names = args[1] if len(args) > 1 and isinstance(args[0], (list, tuple, List)) else kwargs.get('opt_names')
+        return _apply(Image, 'Image.select', _select, self, selectors, new_names)
+
+    def rename(self, *args):
+        names = args[0] if len(args) == 1 and isinstance(args[0], (list, tuple, List)) else list(args)
+        return _apply(Image, 'Image.rename', lambda image, names: _rename(image, [names] if isinstance(names, str) else names),
+                      self, names)
+
+    def bandNames(self):
+        return _apply(List, 'Image.bandNames', lambda image: list(image.names), self)
+
+    def getMapId(self, vis_params=None):
+        def compute():
+            _evaluate(self._node, _Scope()).bands
+            mapid = f'projects/emulator/maps/{_fake_id(self)}'
+            return {'mapid': mapid, 'token': '', 'image': self,
+                    'tile_fetcher': _TileFetcher(f'emulator://{mapid}/tiles/{{z}}/{{x}}/{{y}}')}
+        return _request('getMapId', self, compute)
+
+    def getThumbURL(self, params=None):
+        def compute():
+            _evaluate(self._node, _Scope()).bands
+            return f"emulator://thumbnails/{_fake_id(self)}.{(params or {}).get('format', 'png')}"
+        return _request('getThumbURL', self, compute)
+
+    def getDownloadURL(self, params=None):
+        def compute():
+            _evaluate(self._node, _Scope()).bands
+            return f'emulator://downloads/{_fake_id(self)}'
+        return _request('getDownloadURL', self, compute)
+
+
+for _name, _func in {
+    'add': _binary(np.add), 'subtract': _binary(np.subtract), 'multiply': _binary(np.multiply),
+    'divide': _binary(np.divide), 'pow': _binary(np.power), 'min': _binary(np.fmin), 'max': _binary(np.fmax),
+    'lt': _binary(np.less, True), 'lte': _binary(np.less_equal, True), 'gt': _binary(np.greater, True),
+    'gte': _binary(np.greater_equal, True), 'eq': _binary(np.equal, True), 'neq': _binary(np.not_equal, True),
+    'And': _binary(lambda a, b: (a != 0) & (b != 0), True), 'Or': _binary(lambda a, b: (a != 0) | (b != 0), True),
+    'Not': _unary(lambda a: np.where(np.isnan(a), np.nan, a == 0)), 'abs': _unary(np.abs), 'log10': _unary(np.log10),
+    'log': _unary(np.log), 'exp': _unary(np.exp), 'sqrt': _unary(np.sqrt), 'floor': _unary(np.floor),
+    'toByte': _unary(lambda a: np.where(np.isnan(a), np.nan, np.clip(np.round(a), 0, 255))),
+    'toInt': _unary(lambda a: np.where(np.isnan(a), np.nan, np.round(a))), 'toFloat': _unary(lambda a: a), 'float': _unary(lambda a: a),
+    'updateMask': _update_mask, 'unmask': _unmask, 'clip': _clip, 'addBands': _add_bands,
+    'expression': _expression, 'normalizedDifference': _normalized_difference,
+    'reduceNeighborhood': _reduce_neighborhood, 'reduce': _reduce_bands, 'classify': _classify_image,
+}.items():
+    setattr(Image, _name, _method(Image, f'Image.{_name}', _func))
+
+Image.reduceRegion = _method(Dictionary, 'Image.reduceRegion', _reduce_region)
+
+
+class Collection(ComputedObject):
+    _element = Element
+
+    def filter(self, new_filter):
+        return _apply(type(self), 'Collection.filter', lambda c, f: _Collection([e for e in c.elements if f.test(e.props)], c.props),
+                      self, new_filter)
+
+    def filterBounds(self, geometry):
+        # every image of the emulated datasets covers the whole grid
+        return _apply(type(self), 'Collection.filterBounds', lambda c, g: c, self, geometry)
+
+    def filterDate(self, start, opt_end=None):
+        return _apply(type(self), 'Collection.filterDate', _filter_date, self, start, opt_end)
+
+    def map(self, algorithm, opt_dropNulls=False):
+        return _apply(type(self), 'Collection.map', _map, self, _Body(self._element, algorithm), raw=True)
+
+    def size(self):
+        return _apply(Number, 'Collection.size', lambda c: len(c.elements), self)
+
+    def first(self):
+        return _apply(self._element, 'Collection.first', lambda c: c.elements[0] if c.elements else None, self)
+
+    def limit(self, maximum, opt_property=None, opt_ascending=True):
+        def limit(c, maximum, prop, ascending):
+            elements = sorted(c.elements, key=lambda e: e.props.get(prop), reverse=not ascending) if prop else c.elements
+            return _Collection(elements[:maximum], c.props)
+        return _apply(type(self), 'Collection.limit', limit, self, maximum, opt_property, opt_ascending)
+
+    def sort(self, prop, opt_ascending=True):
+        return _apply(type(self), 'Collection.sort',
+                      lambda c, prop, ascending: _Collection(sorted(c.elements, key=lambda e: e.props.get(prop), reverse=not ascending), c.props),
+                      self, prop, opt_ascending)
+
+    def aggregate_array(self, prop):
+        return _apply(List, 'Collection.aggregate_array', lambda c, prop: [e.props.get(prop) for e in c.elements if prop in e.props],
+                      self, prop)
+
+    def merge(self, collection2):
+        return _apply(type(self), 'Collection.merge', lambda a, b: _Collection(a.elements + b.elements, a.props), self, collection2)
+
+    def toList(self, count, offset=0):
+        return _apply(List, 'Collection.toList', lambda c, count, offset: c.elements[offset:offset + count], self, count, offset)
+
+
+
+class ImageCollection(Collection):
+    _element = Image
+
+    def __init__(self, args):
+        if self._cast(args):
+            return
+        if isinstance(args, str):
+            self._node = _Node('ImageCollection.load', _load_collection, (args,))
+        else:
+            self._node = _Node('ImageCollection.fromImages', lambda images: _Collection(images), (list(args),))
+
+    @staticmethod
+    def fromImages(images):
+        return _apply(ImageCollection, 'ImageCollection.fromImages', lambda images: _Collection(images), images)
+
+    def select(self, *args):
+        return self.map(lambda img: img.select(*args))
+
+    def toBands(self):
+        return _apply(Image, 'ImageCollection.toBands', _to_bands, self)
+
+
+for _name in ('median', 'min', 'max', 'mean', 'mode', 'sum', 'Or', 'And'):
+    setattr(ImageCollection, _name, _method(Image, f'ImageCollection.{_name}', _collection_reduce(_name.lower())))
+
+
+class FeatureCollection(Collection):
+    _element = Feature
+
+    def __init__(self, args, opt_column=None):
+        if not isinstance(args, (Feature, Geometry)) and self._cast(args):
+            return
+        if isinstance(args, str):
+            raise EEException(f"FeatureCollection.load: the emulator has no table asset '{args}'.")
+        if isinstance(args, dict):
+            self._node = _Node('FeatureCollection', lambda geojson: _Collection(_features_from_geojson(geojson)), (args,))
+        else:
+            features = [args] if isinstance(args, (Feature, Geometry)) else list(args)
+            features = [Feature(f) if isinstance(f, Geometry) else f for f in features]
+            self._node = _Node('FeatureCollection', lambda features: _Collection(
+                f.with_props({'system:index': str(i), **f.props}) for i, f in enumerate(features)), (features,))
+
+    geometry = _geometry_method
+
+    def randomColumn(self, columnName='random', seed=0, distribution='uniform'):
+        return _apply(FeatureCollection, 'FeatureCollection.randomColumn', _random_column, self, columnName, seed, distribution)
+
+    def classify(self, classifier, outputName='classification'):
+        return _apply(FeatureCollection, 'FeatureCollection.classify', _classify_features, self, classifier, outputName)
+
+    def errorMatrix(self, actual, predicted, order=None):
+        return _apply(ConfusionMatrix, 'Collection.errorMatrix', _error_matrix, self, actual, predicted, order)
+
+
+Image.sampleRegions = _method(FeatureCollection, 'Image.sampleRegions', _sample_regions)
+Image.reduceRegions = _method(FeatureCollection, 'Image.reduceRegions', _reduce_regions)
+
+
+class Algorithms:
+
+    @staticmethod
+    def If(condition, trueCase=None, falseCase=None):
+        def branch(scope, condition, trueCase, falseCase):
+            return _resolve(trueCase if _resolve(condition, scope) else falseCase, scope)
+        return _apply(ComputedObject, 'Algorithms.If', branch, condition, trueCase, falseCase, raw=True)
+
+
+# -- tasks ------------------------------------------------------------------------------------
+
+_tasks = OrderedDict()
+_tasks_lock = threading.Lock()
+
+
+class batch:
+
+    class Task:
+
+        def __init__(self, image, config):
+            self.id = hashlib.sha1(f'{time.time()}{id(self)}'.encode()).hexdigest()[:24].upper()
+            self.image = image
+            self.config = config
+
+        def _status(self):
+            with _tasks_lock:
+                return dict(_tasks.get(self.id) or {'id': self.id, 'state': 'UNSUBMITTED', 'description': self.config.get('description')})
+
+        def start(self):
+            def compute():
+                now = int(time.time() * 1000)
+                _evaluate(self.image._node, _Scope()).bands
+                with _tasks_lock:
+                    _tasks[self.id] = {'id': self.id, 'task_type': 'EXPORT_IMAGE', 'state': 'COMPLETED',
+                                       'description': self.config.get('description'), 'creation_timestamp_ms': now,
+                                       'start_timestamp_ms': now, 'update_timestamp_ms': int(time.time() * 1000)}
+            return _request('Task.start', self.image, compute)
+
+        def status(self):
+            return _request('Task.status', None, self._status)
+
+        @staticmethod
+        def list():
+            return []
+
+    class Export:
+
+        class image:
+
+            @staticmethod
+            def toDrive(image, description='myExportImageTask', **config):
+                return batch.Task(image, {**config, 'description': description})
+
+
+class data:
+
+    @staticmethod
+    def getTaskList():
+        with _tasks_lock:
+            statuses = [dict(status) for status in reversed(_tasks.values())]
+        return _request('getTaskList', None, lambda: statuses)
+
+    @staticmethod
+    def getTaskStatus(taskId):
+        ids = [taskId] if isinstance(taskId, str) else taskId
+        with _tasks_lock:
+            statuses = [dict(_tasks[i]) if i in _tasks else {'id': i, 'state': 'UNKNOWN'} for i in ids]
+        return _request('getTaskStatus', None, lambda: statuses)
@@ -0,0 +1,111 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# threads of the pool mark themselves so that nested calls do not wait on the pool they run in
+_local = threading.local()
+
+_executor = None
+_view_executor = None
+_executor_lock = threading.Lock()
+
+
+def _mark_worker():
+    _local.in_pool = True
+
+
+def get_executor():
+    """Get the thread pool that issues blocking Earth Engine requests.
+
+    Its size is set by the ``EE_MAX_CONCURRENT_CALLS`` setting.
+
+    Returns:
+        ThreadPoolExecutor: the shared pool
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                from django.conf import settings
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'EE_MAX_CONCURRENT_CALLS', 8),
+                    thread_name_prefix='ee',
+                    initializer=_mark_worker,
+                )
+    return _executor
+
+
+def run_concurrently(*funcs):
+    """Call independent functions, typically Earth Engine round-trips, on the shared pool.
+
+    Args:
+        funcs: functions without arguments
+
+    Returns:
+        list: the return values of ``funcs``, in order. The first exception raised by a function is re-raised.
+    """
+    if getattr(_local, 'in_pool', False) or len(funcs) < 2:
+        return [func() for func in funcs]
+    # each call runs in a copy of the caller's context, e.g. its trace, see service.tracing
+    futures = [get_executor().submit(contextvars.copy_context().run, func) for func in funcs]
+    return [future.result() for future in futures]
+
+
+def imap_bounded(func, iterable, max_in_flight=4):
+    """Lazily map a function over an iterable on the shared pool, keeping at most ``max_in_flight`` calls pending.
+
+    Results are yielded in the order of ``iterable``, so memory use does not grow with its length.
+    """
+    if getattr(_local, 'in_pool', False):
+        yield from map(func, iterable)
+        return
+    from collections import deque
+    pending = deque()
+    try:
+        for item in iterable:
+            pending.append(get_executor().submit(contextvars.copy_context().run, func, item))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # the consumer stopped early, e.g. the client went away
+        for future in pending:
+            future.cancel()
+
+
+def get_view_executor():
+    """Get the thread pool that runs blocking views on behalf of their async versions.
+
+    Its size, set by the ``ASYNC_VIEW_MAX_CONCURRENCY`` setting, caps how many requests of an
+    ASGI worker are processed at the same time; further requests wait without blocking the event loop.
+    It is separate from the Earth Engine pool so that views waiting on it cannot starve it.
+
+    Returns:
+        ThreadPoolExecutor: the shared pool
+    """
+    global _view_executor
+    if _view_executor is None:
+        with _executor_lock:
+            if _view_executor is None:
+                from django.conf import settings
+                _view_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ASYNC_VIEW_MAX_CONCURRENCY', 32),
+                    thread_name_prefix='view',
+                )
+    return _view_executor
+
+
+def async_view(view):
+    """Make an async version of a blocking view that runs it on the view pool.
+
+    Attributes set by view decorators, such as ``csrf_exempt``, are kept.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(get_view_executor(), functools.partial(context.run, view, request, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,257 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'QUEUED'
+RUNNING = 'RUNNING'
+SUCCEEDED = 'SUCCEEDED'
+FAILED = 'FAILED'
+CANCELLED = 'CANCELLED'
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# key of the cancellation request of a job in the job store, next to the key of the job
+CANCEL_SUFFIX = ':cancel'
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    """A long-running computation executed by a JobManager.
+
+    The job function receives the job as its first argument and reports progress
+    with set_progress(), which is also where a cancellation request takes effect:
+    a job is not interrupted between two progress reports.
+    """
+
+    def __init__(self, kind, description=''):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.description = description
+        self.state = QUEUED
+        self.progress = 0.0
+        self.message = ''
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel_requested = threading.Event()
+        self._future = None
+        self._store = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Snapshot of a job saved in the job store by another process, see save()
+
+        A job that the process running it left unfinished when it stopped is reported as failed.
+        """
+        from .metrics import is_running
+
+        job = cls(data['kind'], data['description'])
+        job.id = data['id']
+        job.state = data['state']
+        job.progress = data['progress']
+        job.message = data['message']
+        job.result = data.get('result')
+        job.error = data['error']
+        job.created = data['creation_timestamp']
+        job.started = data['start_timestamp']
+        job.finished = data['update_timestamp']
+        if job.state not in FINISHED_STATES and 'pid' in data and not is_running(data['pid']):
+            job.state = FAILED
+            job.error = "The worker process running the job has stopped"
+        return job
+
+    @property
+    def cancel_requested(self):
+        # the cancellation can be requested by another process through the store
+        if not self._cancel_requested.is_set() and self._store is not None and self._store.get(self.id + CANCEL_SUFFIX):
+            self._cancel_requested.set()
+        return self._cancel_requested.is_set()
+
+    def save(self):
+        """Write the state of the job to the job store, where every process finds it"""
+        if self._store is not None:
+            # the process running the job, see from_dict()
+            self._store.set(self.id, {**self.to_dict(), 'pid': os.getpid()})
+
+    def set_progress(self, progress, message=None):
+        """Report progress between 0 and 1.
+
+        Raises:
+            JobCancelled: the job has been asked to stop
+        """
+        if self.cancel_requested:
+            raise JobCancelled()
+        self.progress = progress
+        if message is not None:
+            self.message = message
+        self.save()
+
+    def to_dict(self, with_result=True):
+        res = {
+            'id': self.id,
+            'kind': self.kind,
+            'description': self.description,
+            'state': self.state,
+            'progress': self.progress,
+            'message': self.message,
+            'error': self.error,
+            'creation_timestamp': self.created,
+            'start_timestamp': self.started,
+            'update_timestamp': self.finished,
+        }
+        if with_result:
+            res['result'] = self.result
+        return res
+
+
+class JobManager:
+    """Runs jobs on a bounded thread pool and keeps their state in memory.
+
+    Jobs run in the process that accepted them. With a store shared by the worker
+    processes, e.g. a FileCache, their state is also saved there at every change, so
+    that status and cancellation requests answered by another worker find them.
+    Without a store, the app must be served by a single process.
+
+    Args:
+        max_workers (int, optional): Maximum number of jobs running at the same time. Defaults to 2.
+        max_history (int, optional): Maximum number of finished jobs kept for status requests. Defaults to 100.
+        max_queued (int, optional): Maximum number of jobs waiting for a thread, None for no limit. Defaults to None.
+        store (FileCache, optional): Store of the jobs of all processes. Defaults to None.
+    """
+
+    def __init__(self, max_workers=2, max_history=100, max_queued=None, store=None):
+        self.max_history = max_history
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._store = store
+
+    def submit(self, kind, func, *args, description=''):
+        """Enqueue ``func(job, *args)``; its return value becomes the result of the job.
+
+        Raises:
+            JobQueueFull: ``max_queued`` jobs are already waiting for a thread
+
+        Returns:
+            Job: the queued job
+        """
+        job = Job(kind, description)
+        job._store = self._store
+        with self._lock:
+            if self.max_queued is not None and sum(j.state == QUEUED for j in self._jobs.values()) >= self.max_queued:
+                raise JobQueueFull("Too many jobs are waiting, please try again later")
+            self._jobs[job.id] = job
+            self._prune()
+        job.save()
+        job._future = self._executor.submit(self._run, job, func, args)
+        return job
+
+    def _run(self, job, func, args):
+        if job.cancel_requested:
+            job.state = CANCELLED
+            job.finished = time.time()
+            job.save()
+            return
+        job.state = RUNNING
+        job.started = time.time()
+        job.save()
+        try:
+            job.result = func(job, *args)
+            job.progress = 1.0
+            job.state = SUCCEEDED
+        except JobCancelled:
+            job.state = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job.state = FAILED
+        job.finished = time.time()
+        job.save()
+
+    def _prune(self):
+        finished = [id for id, job in self._jobs.items() if job.state in FINISHED_STATES]
+        for id in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[id]
+
+    def get(self, id):
+        """Get a job of this process, or a snapshot of a job of another process from the store
+
+        Returns:
+            Job: the job, or None if it does not exist
+        """
+        job = self._jobs.get(id)
+        if job is None and self._store is not None:
+            data = self._store.get(id)
+            if isinstance(data, dict):
+                job = Job.from_dict(data)
+        return job
+
+    def list(self):
+        jobs = dict(self._jobs)
+        if self._store is not None:
+            for data in self._store.values():
+                # cancellation requests are stored next to the jobs
+                if isinstance(data, dict) and data['id'] not in jobs:
+                    jobs[data['id']] = Job.from_dict(data)
+        return sorted(jobs.values(), key=lambda job: job.created)
+
+    def cancel(self, id):
+        """Ask a job to stop. A queued job never starts; a running job stops at its next progress report.
+
+        The job of another process is asked to stop through the store and reported in its current state.
+
+        Returns:
+            Job: the job, or None if it does not exist
+        """
+        job = self._jobs.get(id)
+        if job is None:
+            job = self.get(id)
+            if job is not None and job.state not in FINISHED_STATES:
+                self._store.set(id + CANCEL_SUFFIX, True)
+            return job
+        job._cancel_requested.set()
+        if job._future is not None and job._future.cancel():
+            job.state = CANCELLED
+            job.finished = time.time()
+            job.save()
+        return job
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Get the job manager of this process, sized by the ``JOB_MAX_WORKERS``, ``JOB_HISTORY_SIZE`` and ``JOB_MAX_QUEUED`` settings.
+
+    The jobs are shared with the other worker processes through the files of the ``JOB_STORE_LOCATION``
+    directory, if it is set.
+    """
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                from django.conf import settings
+                from .cache import FileCache
+                max_history = getattr(settings, 'JOB_HISTORY_SIZE', 100)
+                location = getattr(settings, 'JOB_STORE_LOCATION', None)
+                _manager = JobManager(
+                    max_workers=getattr(settings, 'JOB_MAX_WORKERS', 2),
+                    max_history=max_history,
+                    max_queued=getattr(settings, 'JOB_MAX_QUEUED', None),
+                    # room for the cancellation requests next to the jobs
+                    store=FileCache(location, maxsize=2 * max_history) if location else None,
+                )
+    return _manager
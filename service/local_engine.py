@@ -0,0 +1,395 @@
+"""NumPy implementation of the processing pipeline for raster stacks held locally.
+
+The functions mirror compute_feature() and make_composite() of service.data_processing and
+run_threshold_based_classification() of service.main, with a RasterStack in place of the
+ee.ImageCollection. Masked pixels are NaN. Stacks are processed in spatial tiles that are spread
+over a process pool; a stack loaded with RasterStack.from_npy() is memory-mapped and each worker
+only reads its own tile.
+"""
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from django.core.exceptions import BadRequest
+
+from .constants import DATASET_LIST, FEATURE_LIST, get_dataset_scale
+from .dates import composite_windows, season_date_range, to_millis
+from .local_speckle_filters import boxcar, halo_windows
+
+# radius of the boxcar filter of despeckle(), also the halo of the tiles of radar stacks
+DESPECKLE_RADIUS = 2
+
+
+class RasterStack:
+    """A time series of multi-band rasters, the local counterpart of an ee.ImageCollection.
+
+    Args:
+        data (np.ndarray): array of shape (time, band, rows, cols), possibly memory-mapped
+        bands (list): band names
+        timestamps (list): system:time_start of each image, in milliseconds
+        properties (list, optional): metadata dictionary of each image, used by filter_dataset(). Defaults to None.
+    """
+
+    def __init__(self, data, bands, timestamps, properties=None):
+        self.data = data
+        self.bands = list(bands)
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.properties = properties if properties is not None else [{} for _ in self.timestamps]
+        # set by from_npy() so that tiles sent to worker processes are re-read from the file
+        self.source = None
+        self.window = None
+
+    @classmethod
+    def from_npy(cls, path, bands, timestamps, properties=None):
+        """Memory-map a (time, band, rows, cols) array saved with np.save()."""
+        stack = cls(np.load(path, mmap_mode='r'), bands, timestamps, properties)
+        stack.source = os.path.abspath(path)
+        return stack
+
+    @classmethod
+    def from_geotiffs(cls, paths, timestamps, bands=None, properties=None):
+        """Read one multi-band GeoTIFF per image. Requires rasterio."""
+        import rasterio
+        arrays = []
+        for path in paths:
+            with rasterio.open(path) as src:
+                arrays.append(src.read(masked=True).filled(np.nan).astype(np.float32))
+                if bands is None:
+                    bands = [d or f'B{i + 1}' for i, d in enumerate(src.descriptions)]
+        return cls(np.stack(arrays), bands, timestamps, properties)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.source is not None:
+            state['data'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.data is None:
+            data = np.load(self.source, mmap_mode='r')
+            if self.window is not None:
+                data = data[(slice(None), slice(None)) + self.window]
+            self.data = data
+
+    @property
+    def shape(self):
+        return self.data.shape[2:]
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _subset(self, indices):
+        stack = RasterStack(self.data[indices], self.bands, self.timestamps[indices],
+                            [self.properties[i] for i in np.arange(len(self))[indices]])
+        return stack
+
+    def filter_date(self, start_date, end_date):
+        """Images with start_date <= system:time_start < end_date, like ee.ImageCollection.filterDate."""
+        start, end = to_millis(start_date), to_millis(end_date)
+        return self._subset(np.flatnonzero((self.timestamps >= start) & (self.timestamps < end)))
+
+    def filter(self, predicate):
+        """Images whose properties satisfy ``predicate``."""
+        return self._subset(np.array([i for i, p in enumerate(self.properties) if predicate(p)], dtype=int))
+
+    def select(self, band):
+        """Array of shape (time, rows, cols) of one band, as float32."""
+        return np.asarray(self.data[:, self.bands.index(band)], dtype=np.float32)
+
+    def tile(self, rows, cols):
+        """The stack restricted to a window of rows and cols slices."""
+        stack = RasterStack(self.data[:, :, rows, cols], self.bands, self.timestamps, self.properties)
+        if self.source is not None:
+            stack.source = self.source
+            stack.window = (rows, cols) if self.window is None else \
+                (_compose(self.window[0], rows), _compose(self.window[1], cols))
+        return stack
+
+
+def _compose(outer, inner):
+    start = (outer.start or 0) + (inner.start or 0)
+    stop = (outer.start or 0) + inner.stop if inner.stop is not None else outer.stop
+    return slice(start, stop)
+
+
+def filter_dataset(data_filters: dict, stack: RasterStack) -> RasterStack:
+    """Apply the metadata filters of service.data_processing.filter_dataset() that the image properties support
+
+    Args:
+        data_filters (dict): json-like Python dictionary that contains filter settings
+        stack (RasterStack): the images
+
+    Raises:
+        BadRequest: invalid parameters
+
+    Returns:
+        RasterStack: the filtered images
+    """
+    dataset_name = data_filters['name']
+    if dataset_name not in DATASET_LIST['radar'] and dataset_name not in DATASET_LIST['optical']:
+        raise BadRequest("dataset name not found")
+
+    if 'start_date' in data_filters and 'end_date' in data_filters:
+        stack = stack.filter_date(data_filters['start_date'], data_filters['end_date'])
+
+    if dataset_name in DATASET_LIST['radar']:
+        if data_filters['feature'] not in FEATURE_LIST['radar']:
+            raise BadRequest("Wrong features")
+        if not data_filters.get('ascd', True):
+            stack = stack.filter(lambda p: p.get('orbitProperties_pass') != 'ASCENDING')
+        if not data_filters.get('desc', True):
+            stack = stack.filter(lambda p: p.get('orbitProperties_pass') != 'DESCENDING')
+    else:
+        cloud_fieldname = None
+        if dataset_name.startswith('COPERNICUS/S2'):
+            cloud_fieldname = "CLOUDY_PIXEL_PERCENTAGE"
+        elif dataset_name.startswith('LANDSAT'):
+            cloud_fieldname = "CLOUD_COVER"
+        if cloud_fieldname is not None and 'cloud' in data_filters:
+            cloud = int(data_filters['cloud'])
+            stack = stack.filter(lambda p: p.get(cloud_fieldname, 0) <= cloud)
+    return stack
+
+
+def _normalized_difference(a, b):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res = (a - b) / (a + b)
+    res[~np.isfinite(res)] = np.nan
+    return res
+
+
+def compute_feature(dataset_name: str, pool: RasterStack, feature: str) -> RasterStack:
+    """Compute a feature of FEATURE_LIST for every image, see service.data_processing.compute_feature()
+
+    Returns:
+        RasterStack: a single-band stack, the band is named 'feature'
+    """
+    if feature in FEATURE_LIST['radar']:
+        if feature in ['VV', 'VH']:
+            res = pool.select(feature)
+        else:
+            # like the Earth Engine expression, the ratio uses the bands of the input image, in dB
+            with np.errstate(divide='ignore', invalid='ignore'):
+                res = pool.select('VH') / pool.select('VV')
+            res[~np.isfinite(res)] = np.nan
+    elif feature in FEATURE_LIST['optical']:
+        bands = DATASET_LIST['optical'][dataset_name]['bands']
+        if feature == 'NDVI':
+            res = _normalized_difference(pool.select(bands['nir']), pool.select(bands['red']))
+        elif feature == 'EVI':
+            nir, red, blue = pool.select(bands['nir']), pool.select(bands['red']), pool.select(bands['blue'])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                res = 2.5 * (nir - red) / (nir + 6 * red - 7.5 * blue + 1)
+            res[~np.isfinite(res)] = np.nan
+        elif feature == 'NDWI':
+            res = _normalized_difference(pool.select(bands['green']), pool.select(bands['nir']))
+        else:
+            res = _normalized_difference(pool.select(bands['green']), pool.select(bands['swir1']))
+    else:
+        raise BadRequest("Wrong features")
+    return RasterStack(res[:, np.newaxis], ['feature'], pool.timestamps, pool.properties)
+
+
+def _nanmode(a):
+    # most frequent value along the first axis, the smallest one on ties; NaN never wins over a value.
+    # Sorted, equal values form runs (NaN last, each NaN a run of its own), and the length of the run
+    # ending at each position is reached first at the end of the longest, smallest-valued run
+    s = np.sort(a, axis=0)
+    positions = np.arange(len(s)).reshape((-1,) + (1,) * (s.ndim - 1))
+    starts = np.ones(s.shape, dtype=bool)
+    starts[1:] = s[1:] != s[:-1]
+    run_start = np.maximum.accumulate(np.where(starts, positions, 0), axis=0)
+    index = (positions - run_start).argmax(axis=0)
+    return np.take_along_axis(s, index[np.newaxis], axis=0)[0]
+
+
+_REDUCERS = {
+    'minimum': np.nanmin,
+    'maximum': np.nanmax,
+    'median': np.nanmedian,
+    'mean': np.nanmean,
+}
+
+
+def reduce_images(data, method):
+    """Reduce an array of shape (time, ...) along time, ignoring NaN like an Earth Engine reducer ignores masked pixels."""
+    if method == 'mode':
+        return _nanmode(data)
+    if method not in _REDUCERS:
+        raise BadRequest("Unrecognized composite type")
+    with warnings.catch_warnings():
+        # all-NaN pixels stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return _REDUCERS[method](data, axis=0)
+
+
+def make_composite(data_pool: RasterStack, start_date, end_date, days, method="median") -> RasterStack:
+    """Reduce the images of every ``days``-day window, see service.main.make_composite(); empty windows are skipped"""
+    if method not in _REDUCERS and method != 'mode':
+        raise BadRequest("Unrecognized composite type")
+    composites, timestamps = [], []
+    for start, end in composite_windows(start_date, end_date, days):
+        indices = np.flatnonzero((data_pool.timestamps >= start) & (data_pool.timestamps < end))
+        if len(indices) == 0:
+            continue
+        composites.append(reduce_images(np.asarray(data_pool.data[indices], dtype=np.float32), method))
+        timestamps.append(start)
+    if composites:
+        data = np.stack(composites)
+    else:
+        data = np.empty((0, len(data_pool.bands)) + data_pool.shape, dtype=np.float32)
+    return RasterStack(data, data_pool.bands, timestamps)
+
+
+def despeckle(stack: RasterStack) -> RasterStack:
+    """Boxcar filter applied to radar images before features are computed, like service.main does"""
+    data = boxcar(np.asarray(stack.data, dtype=np.float32), radius=DESPECKLE_RADIUS)
+    return RasterStack(data, stack.bands, stack.timestamps, stack.properties)
+
+
+def _threshold_tile(stack, filters, crop_mask=None):
+    data_filters = filters['dataset']
+    pool = filter_dataset(data_filters, stack)
+
+    # the images of all seasons are despeckled and mapped to the feature once
+    pool = pool.filter_date(*season_date_range(filters['seasons']))
+    if data_filters['name'] in DATASET_LIST['radar']:
+        pool = despeckle(pool)
+    pool = compute_feature(data_filters['name'], pool, data_filters['feature'])
+
+    season_res = []
+    for season in filters['seasons']:
+        start_date, end_date = season['start'], season['end']
+        thres_min, thres_max = float(season['min']), float(season['max'])
+
+        composites = make_composite(pool, start_date, end_date,
+                                    days=int(data_filters["composite_days"]), method=data_filters['composite'])
+
+        values = composites.data[:, 0]
+        valid = ~np.isnan(values)
+        with np.errstate(invalid='ignore'):
+            hit = (values <= thres_max) & (values >= thres_min)
+        # like ImageCollection.Or(): 1 if any composite is within the thresholds, masked where all are masked
+        res = hit.any(axis=0).astype(np.float32)
+        res[~valid.any(axis=0)] = np.nan
+        season_res.append(res)
+
+    combined_res = season_res[0]
+    for res in season_res[1:]:
+        if filters['op'] == 'and':
+            combined_res = _combine(combined_res, res, np.logical_and)
+        else:
+            combined_res = _combine(combined_res, res, np.logical_or)
+
+    if crop_mask is not None:
+        combined_res[~(np.asarray(crop_mask) > 0)] = np.nan
+    return combined_res
+
+
+def _combine(a, b, op):
+    # masked where either input is masked, like Image.And/Image.Or
+    res = op(a == 1, b == 1).astype(np.float32)
+    res[np.isnan(a) | np.isnan(b)] = np.nan
+    return res
+
+
+def map_tiles(func, stack, tile_size=512, workers=None, crop_mask=None, halo=0):
+    """Apply ``func(tile_stack, crop_mask=tile_mask)`` to every spatial tile and assemble the 2-D results.
+
+    Args:
+        func (callable): picklable function returning an array of the tile's shape
+        stack (RasterStack): the images
+        tile_size (int, optional): tile width and height in pixels. Defaults to 512.
+        workers (int, optional): number of worker processes; 1 runs in this process. Defaults to the number of CPUs.
+        crop_mask (np.ndarray, optional): 2-D mask split along with the stack. Defaults to None.
+        halo (int, optional): pixels around each tile passed to ``func`` for neighbourhood filters, and cropped
+            from its result. Defaults to 0.
+
+    Returns:
+        np.ndarray: the assembled result
+    """
+    windows = halo_windows(stack.shape, tile_size, halo)
+    tasks = [(stack.tile(w[0], w[1]), None if crop_mask is None else crop_mask[w[0], w[1]]) for w in windows]
+    out = np.empty(stack.shape, dtype=np.float32)
+    if workers == 1 or len(windows) == 1:
+        for w, (tile, mask) in zip(windows, tasks):
+            out[w[2], w[3]] = func(tile, crop_mask=mask)[w[4], w[5]]
+        return out
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(func, tile, crop_mask=mask) for tile, mask in tasks]
+        for w, future in zip(windows, futures):
+            out[w[2], w[3]] = future.result()[w[4], w[5]]
+    return out
+
+
+def run_threshold_based_classification(filters, stack, crop_mask=None, tile_size=512, workers=None):
+    """Run classification using thresholds on a local stack, see service.main.run_threshold_based_classification()
+
+    The stack is expected to be clipped to the study region already, so the boundary of the filters is not used.
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request
+        stack (RasterStack): the images of the dataset
+        crop_mask (np.ndarray, optional): 2-D array, pixels <= 0 are excluded. Defaults to None.
+        tile_size (int, optional): tile width and height in pixels. Defaults to 512.
+        workers (int, optional): number of worker processes. Defaults to the number of CPUs.
+
+    Returns:
+        tuple(np.ndarray, float): the combined result (1 rice, 0 other, NaN no data) and the scale of the dataset
+    """
+    scale = get_dataset_scale(filters['dataset']['name'])
+    halo = DESPECKLE_RADIUS if filters['dataset']['name'] in DATASET_LIST['radar'] else 0
+    res = map_tiles(partial(_threshold_tile, filters=filters), stack, tile_size, workers, crop_mask, halo)
+    return res, scale
+
+
+# semi-major axis in meters and squared eccentricity of the WGS 84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+
+
+def _authalic_q(lat):
+    # the area between the equator and ``lat`` (radians) of a 1 radian wide band is WGS84_A ** 2 / 2 * q
+    e = np.sqrt(WGS84_E2)
+    sin = np.sin(lat)
+    return (1 - WGS84_E2) * (sin / (1 - WGS84_E2 * sin ** 2) - np.log((1 - e * sin) / (1 + e * sin)) / (2 * e))
+
+
+def pixel_areas(transform, height):
+    """Area in square meters of a pixel of every row of a grid in degrees, the local counterpart of ee.Image.pixelArea()
+
+    Args:
+        transform (list): affine transform as [x scale, x shear, west, y shear, y scale, north], see
+            service.local_export.plan_tiles()
+        height (int): number of rows
+
+    Returns:
+        np.ndarray: array of shape (height, 1), the area of the pixels of each row on the WGS 84 ellipsoid
+    """
+    x_scale, _, _, _, y_scale, north = transform
+    edges = np.radians(north + y_scale * np.arange(height + 1))
+    areas = WGS84_A ** 2 / 2 * abs(np.radians(x_scale)) * np.abs(np.diff(_authalic_q(edges)))
+    return areas[:, np.newaxis]
+
+
+def compute_hectare_area(img, scale, transform=None):
+    """Area in hectares of the pixels equal to 1, see service.main.compute_hectare_area()
+
+    Earth Engine sums ee.Image.pixelArea(), which shrinks with the latitude. Without ``transform``,
+    every pixel counts for ``scale * scale``: a planar approximation, right for a grid in meters of
+    an equal-area projection but 1 / cos(latitude) times too large for a grid in degrees.
+
+    Args:
+        img (np.ndarray): 2-D result of run_threshold_based_classification()
+        scale (float): pixel size in meters
+        transform (list, optional): affine transform of a grid in degrees, see pixel_areas(). Defaults to None.
+
+    Returns:
+        float: the area in hectares
+    """
+    if transform is None:
+        return float(np.nansum(img == 1)) * scale * scale / 1e4
+    return float(((img == 1) * pixel_areas(transform, img.shape[0])).sum()) / 1e4
@@ -0,0 +1,210 @@
+"""Export of a classification to a local GeoTIFF, without the Earth Engine batch queue.
+
+The bounding box of the boundary is split into a grid of tiles small enough for synchronous
+downloads. The tiles are fetched with getDownloadURL on the Earth Engine pool, a few at a time,
+and written one by one into a tiled, compressed GeoTIFF, so the mosaic is never held in memory.
+Writing requires rasterio, see the conda requirements.
+"""
+import math
+import os
+import time
+
+from .conversion import METERS_PER_DEGREE
+from .executor import imap_bounded
+from .jobs import CANCELLED, FAILED, QUEUED, RUNNING, SUCCEEDED
+from .tracing import ee_call
+
+# value of the pixels outside the boundary
+NODATA = 255
+
+# synchronous downloads are limited to 32 MB per request
+DOWNLOAD_MAX_BYTES = 32 * 1024 * 1024
+
+# block size of the GeoTIFF; tiles are a multiple of it so that every block is written once
+BLOCK_SIZE = 256
+
+# task states of ee.batch.Task.status() for the job states, see job_to_task_status()
+TASK_STATES = {
+    QUEUED: 'READY',
+    RUNNING: 'RUNNING',
+    SUCCEEDED: 'COMPLETED',
+    FAILED: 'FAILED',
+    CANCELLED: 'CANCELLED',
+}
+
+
+def plan_tiles(bounds, pixel_size, tile_size=2048, bytes_per_pixel=1):
+    """Split a bounding box into a grid of tiles
+
+    Args:
+        bounds (tuple): west, south, east and north, in degrees
+        pixel_size (float): pixel size in degrees
+        tile_size (int, optional): maximum tile width and height in pixels; reduced to stay under DOWNLOAD_MAX_BYTES. Defaults to 2048.
+        bytes_per_pixel (int, optional): size of a pixel of the downloaded image. Defaults to 1.
+
+    Returns:
+        tuple(int, int, list, list): width and height of the raster, its affine transform as
+            [x scale, x shear, west, y shear, y scale, north], and the tiles as (row, col, height, width)
+    """
+    west, south, east, north = bounds
+    width = max(1, math.ceil((east - west) / pixel_size))
+    height = max(1, math.ceil((north - south) / pixel_size))
+    max_side = int(math.sqrt(DOWNLOAD_MAX_BYTES / bytes_per_pixel))
+    tile_size = max(BLOCK_SIZE, min(tile_size, max_side) // BLOCK_SIZE * BLOCK_SIZE)
+    tiles = [(row, col, min(tile_size, height - row), min(tile_size, width - col))
+             for row in range(0, height, tile_size) for col in range(0, width, tile_size)]
+    return width, height, [pixel_size, 0, west, 0, -pixel_size, north], tiles
+
+
+def tile_download_params(transform, tile):
+    """Parameters of ee.Image.getDownloadURL() for a tile of the grid, see plan_tiles()"""
+    row, col, height, width = tile
+    x_scale, x_shear, west, y_shear, y_scale, north = transform
+    return {
+        'format': 'GEO_TIFF',
+        'crs': 'EPSG:4326',
+        'crs_transform': [x_scale, x_shear, west + col * x_scale, y_shear, y_scale, north + row * y_scale],
+        'dimensions': f'{width}x{height}',
+    }
+
+
+def fetch_tile(url, retries=3, backoff=1.0, timeout=300, session=None):
+    """Download a tile, retrying on connection errors, timeouts, 429 and 5xx responses
+
+    Args:
+        url (str): the download url
+        retries (int, optional): number of retries after the first attempt. Defaults to 3.
+        backoff (float, optional): seconds before the first retry, doubled after every retry. Defaults to 1.0.
+        timeout (float, optional): seconds to wait for the server. Defaults to 300.
+        session (requests.Session, optional): Defaults to None.
+
+    Raises:
+        requests.RequestException: the last error, or a 4xx response
+
+    Returns:
+        bytes: the content
+    """
+    import requests
+
+    get = session.get if session is not None else requests.get
+    for attempt in range(retries + 1):
+        try:
+            response = get(url, timeout=timeout)
+            if response.status_code == 429 or response.status_code >= 500:
+                response.raise_for_status()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError):
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+            continue
+        response.raise_for_status()
+        return response.content
+
+
+def write_mosaic(path, width, height, transform, tiles, count=None, progress=None):
+    """Write downloaded GeoTIFF tiles into a single tiled and compressed GeoTIFF
+
+    The file is written to ``path + '.part'`` and renamed once complete.
+
+    Args:
+        path (str): the output file
+        width (int): width of the raster
+        height (int): height of the raster
+        transform (list): affine transform of the raster, see plan_tiles()
+        tiles (iterable): pairs of (row, col, height, width) and the content of the tile
+        count (int, optional): number of tiles, for the progress. Defaults to len(tiles).
+        progress (callable, optional): called with the fraction of tiles written and a message. Defaults to None.
+    """
+    import rasterio
+    from rasterio.io import MemoryFile
+    from rasterio.transform import Affine
+    from rasterio.windows import Window
+
+    if count is None:
+        count = len(tiles)
+    part_path = path + '.part'
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    profile = {
+        'driver': 'GTiff',
+        'width': width,
+        'height': height,
+        'count': 1,
+        'dtype': 'uint8',
+        'crs': 'EPSG:4326',
+        'transform': Affine(*transform),
+        'nodata': NODATA,
+        'tiled': True,
+        'blockxsize': BLOCK_SIZE,
+        'blockysize': BLOCK_SIZE,
+        'compress': 'deflate',
+        'BIGTIFF': 'IF_SAFER',
+    }
+    try:
+        with rasterio.open(part_path, 'w', **profile) as dst:
+            for i, ((row, col, tile_height, tile_width), content) in enumerate(tiles):
+                with MemoryFile(content) as memfile, memfile.open() as src:
+                    data = src.read(1)[:tile_height, :tile_width]
+                dst.write(data, 1, window=Window(col, row, data.shape[1], data.shape[0]))
+                if progress is not None:
+                    progress((i + 1) / count, f"{i + 1} of {count} tiles written")
+        os.replace(part_path, path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def export_local(img, boundary, scale, path, progress=None):
+    """Download a classification into a local GeoTIFF, see the module docstring
+
+    Tiles are fetched ``LOCAL_EXPORT_MAX_IN_FLIGHT`` at a time, retried ``LOCAL_EXPORT_RETRIES``
+    times, and are at most ``LOCAL_EXPORT_TILE_SIZE`` pixels wide and high.
+
+    Args:
+        img (ee.Image): the classification, 1 for rice and 0 for other pixels
+        boundary (ee.Feature | ee.FeatureCollection): the study region
+        scale (float): pixel size in meters
+        path (str): the output file
+        progress (callable, optional): called with the fraction of tiles written and a message. Defaults to None.
+    """
+    from .ee_client import ee
+    from django.conf import settings
+
+    ring = ee_call(boundary.geometry().bounds(), 'getInfo')['coordinates'][0]
+    bounds = (min(x for x, _ in ring), min(y for _, y in ring), max(x for x, _ in ring), max(y for _, y in ring))
+    width, height, transform, tiles = plan_tiles(bounds, scale / METERS_PER_DEGREE,
+                                                 getattr(settings, 'LOCAL_EXPORT_TILE_SIZE', 2048))
+    image = ee.Image(img).toByte().unmask(NODATA)
+    retries = getattr(settings, 'LOCAL_EXPORT_RETRIES', 3)
+
+    def download(tile):
+        url = ee_call(image, 'getDownloadURL', tile_download_params(transform, tile))
+        return tile, fetch_tile(url, retries=retries)
+
+    if progress is not None:
+        progress(0, f"0 of {len(tiles)} tiles written")
+    contents = imap_bounded(download, tiles, getattr(settings, 'LOCAL_EXPORT_MAX_IN_FLIGHT', 4))
+    try:
+        write_mosaic(path, width, height, transform, contents, len(tiles), progress)
+    finally:
+        # cancels the pending downloads if the job has been cancelled
+        contents.close()
+
+
+def job_to_task_status(job):
+    """Describe a local export job like ee.batch.Task.status() describes an export task"""
+    status = {
+        'id': job.id,
+        'task_type': 'EXPORT_IMAGE',
+        'state': TASK_STATES[job.state],
+        'description': job.description,
+        'progress': job.progress,
+        'message': job.message,
+        'creation_timestamp_ms': int(job.created * 1000),
+    }
+    if job.started is not None:
+        status['start_timestamp_ms'] = int(job.started * 1000)
+    if job.finished is not None:
+        status['update_timestamp_ms'] = int(job.finished * 1000)
+    if job.error is not None:
+        status['error_message'] = job.error
+    return status
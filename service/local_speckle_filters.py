@@ -0,0 +1,247 @@
+"""NumPy implementations of the speckle filters of service.speckle_filters.
+
+The filters work on arrays whose last two axes are rows and cols, with NaN for masked pixels.
+Pixels outside the array are treated as masked, like pixels outside the footprint of an Earth
+Engine image, so a tile processed with a halo of filter_halo() pixels gives the same values as
+the whole array. filter_tiles() spreads tiles and bands over a process pool.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def powerToDb(img):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 10 * np.log10(img)
+
+
+def dbToPower(img):
+    return np.power(10, img / 10)
+
+
+def _pad(img, radius, value=np.nan):
+    pad = [(0, 0)] * (img.ndim - 2) + [(radius, radius), (radius, radius)]
+    return np.pad(img, pad, constant_values=value)
+
+
+def _kernel_sums(img, kernel):
+    # sums under a binary kernel centered on each pixel, as a sum of shifted views of the padded array
+    radius = kernel.shape[0] // 2
+    padded = _pad(img, radius, 0)
+    rows, cols = img.shape[-2:]
+    res = np.zeros(img.shape, dtype=np.float64)
+    for i, j in zip(*np.nonzero(kernel)):
+        res += padded[..., i:i + rows, j:j + cols]
+    return res
+
+
+def _window_stats(img, kernel):
+    # mean and population variance of the valid pixels under a binary kernel centered on each pixel
+    valid = ~np.isnan(img)
+    values = np.where(valid, img, 0).astype(np.float64)
+    total = _kernel_sums(values, kernel)
+    squares = _kernel_sums(values * values, kernel)
+    count = _kernel_sums(valid.astype(np.float64), kernel)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        variance = np.maximum(squares / count - mean * mean, 0)
+    return mean, variance
+
+
+def _box_sums(img, radius):
+    # sums over (2 * radius + 1)^2 windows with an integral image
+    size = 2 * radius + 1
+    integral = np.pad(_pad(img, radius, 0).cumsum(-2).cumsum(-1), [(0, 0)] * (img.ndim - 2) + [(1, 0), (1, 0)])
+    return integral[..., size:, size:] - integral[..., :-size, size:] - integral[..., size:, :-size] + integral[..., :-size, :-size]
+
+
+def boxcar(img, radius=2, reducer='median'):
+    """Boxcar filter, see service.speckle_filters.boxcar().
+
+    Args:
+        img (np.ndarray): array of shape (..., rows, cols), masked pixels are NaN
+        radius (int, optional): radius of the square kernel, in pixels. Defaults to 2.
+        reducer (str, optional): 'median' of the sorted sliding windows, like the Earth Engine filter, or 'mean' with an integral image. Defaults to 'median'.
+
+    Returns:
+        np.ndarray: the filtered array, NaN where the window has no valid pixel or the input pixel is masked
+    """
+    img = np.asarray(img, dtype=np.float32)
+    if reducer == 'median':
+        windows = sliding_window_view(_pad(img, radius), (2 * radius + 1, 2 * radius + 1), axis=(-2, -1))
+        # NaN sort last, so the median of the n valid pixels is taken from the first n sorted values
+        ordered = np.sort(windows.reshape(windows.shape[:-2] + (-1,)), axis=-1)
+        n = (~np.isnan(ordered)).sum(axis=-1, keepdims=True)
+        low = np.take_along_axis(ordered, np.maximum(n - 1, 0) // 2, axis=-1)
+        high = np.take_along_axis(ordered, n // 2 - (n == 0), axis=-1)
+        res = ((low + high) / 2)[..., 0]
+        # windows without any valid pixel stay NaN
+        res[n[..., 0] == 0] = np.nan
+    elif reducer == 'mean':
+        valid = ~np.isnan(img)
+        total = _box_sums(np.where(valid, img, 0).astype(np.float64), radius)
+        count = _box_sums(valid.astype(np.float64), radius)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            res = total / count
+    else:
+        raise ValueError(f"Unknown reducer: {reducer}")
+    res = res.astype(np.float32)
+    res[np.isnan(img)] = np.nan
+    return res
+
+
+# 3x3 windows sampled in a 7x7 neighbourhood, in the band order of neighborhoodToBands
+_SAMPLE_OFFSETS = [(dy, dx) for dy in (-2, 0, 2) for dx in (-2, 0, 2)]
+
+_RECT_KERNEL = np.array([[0] * 7] * 3 + [[1] * 7] * 4, dtype=np.float64)
+_DIAG_KERNEL = np.tril(np.ones((7, 7)))
+
+# directions 1 to 8: rect, diag, then both rotated clockwise by 90 degrees, 3 times
+_DIRECTION_KERNELS = [k for i in range(4) for k in (np.rot90(_RECT_KERNEL, -i), np.rot90(_DIAG_KERNEL, -i))]
+
+
+def _shift(img, dy, dx):
+    # value at (row + dy, col + dx), NaN outside the array
+    padded = _pad(img, 2)
+    rows, cols = img.shape[-2:]
+    return padded[..., 2 + dy:2 + dy + rows, 2 + dx:2 + dx + cols]
+
+
+def _gt(a, b):
+    with np.errstate(invalid='ignore'):
+        return np.where(np.isnan(a) | np.isnan(b), np.nan, (a > b).astype(np.float64))
+
+
+def _not(a):
+    return np.where(np.isnan(a), np.nan, (a == 0).astype(np.float64))
+
+
+def _masked_sum(values, masks):
+    # sum of the bands where the mask is true, NaN where no band is selected
+    stacked = np.where(masks, values, np.nan)
+    res = np.nansum(stacked, axis=0)
+    res[~np.any(masks & ~np.isnan(values), axis=0)] = np.nan
+    return res
+
+
+def refined_lee(img):
+    """Refined Lee filter, see service.speckle_filters.refined_lee().
+
+    Args:
+        img (np.ndarray): array of shape (..., rows, cols) in dB, masked pixels are NaN
+
+    Returns:
+        np.ndarray: the filtered array in dB
+    """
+    img = dbToPower(np.asarray(img, dtype=np.float64))
+
+    mean3, variance3 = _window_stats(img, np.ones((3, 3)))
+    # reduceNeighborhood() skips masked pixels: the windows of masked pixels are masked too, and so
+    # is sigmaV wherever one of its 9 sampled windows is centered on a masked pixel
+    mean3[np.isnan(img)] = np.nan
+    variance3[np.isnan(img)] = np.nan
+
+    sample_mean = np.stack([_shift(mean3, dy, dx) for dy, dx in _SAMPLE_OFFSETS])
+    sample_var = np.stack([_shift(variance3, dy, dx) for dy, dx in _SAMPLE_OFFSETS])
+    m = sample_mean
+
+    # the 4 gradients and the bands where the gradient is maximum
+    gradients = np.stack([np.abs(m[1] - m[7]), np.abs(m[6] - m[2]), np.abs(m[3] - m[5]), np.abs(m[0] - m[8])])
+    with np.errstate(invalid='ignore'):
+        max_gradient = np.nanmax(np.where(np.isnan(gradients), -np.inf, gradients), axis=0)
+        gradmask = gradients == max_gradient
+    gradmask = np.concatenate([gradmask, gradmask])
+
+    # the 8 directions
+    directions = [
+        _gt(m[1] - m[4], m[4] - m[7]) * 1,
+        _gt(m[6] - m[4], m[4] - m[2]) * 2,
+        _gt(m[3] - m[4], m[4] - m[5]) * 3,
+        _gt(m[0] - m[4], m[4] - m[8]) * 4,
+    ]
+    directions += [_not(directions[i]) * (i + 5) for i in range(4)]
+    directions = _masked_sum(np.stack(directions), gradmask)
+
+    # local noise variance: mean of the 5 lowest of the 9 sampled variance / mean^2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sample_stats = sample_var / (sample_mean * sample_mean)
+    sigmaV = np.sort(sample_stats, axis=0)[:5].mean(axis=0)
+    # like toArray(), a masked band masks the pixel
+    sigmaV[np.isnan(sample_stats).any(axis=0)] = np.nan
+
+    # directional statistics, keeping the direction of each pixel
+    dir_mean = np.full(img.shape, np.nan)
+    dir_var = np.full(img.shape, np.nan)
+    for i, kernel in enumerate(_DIRECTION_KERNELS):
+        selected = directions == i + 1
+        if selected.any():
+            mean, variance = _window_stats(img, kernel)
+            dir_mean[selected] = mean[selected]
+            dir_var[selected] = variance[selected]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        X = (dir_var - dir_mean * dir_mean * sigmaV) / (sigmaV + 1.0)
+        b = X / dir_var
+    # Image.divide() gives 0 for a division by 0: uniform directional windows keep their mean
+    b[(dir_var == 0) & ~np.isnan(X)] = 0
+    res = dir_mean + b * (img - dir_mean)
+    return powerToDb(res).astype(np.float32)
+
+
+def filter_halo(filter_func):
+    """Number of pixels around a tile that a filter reads"""
+    if filter_func is refined_lee:
+        return 3
+    if isinstance(filter_func, partial):
+        return filter_func.keywords.get('radius', 2)
+    return 2
+
+
+def halo_windows(shape, tile_size, halo):
+    """Tiles of a raster, as (read rows, read cols, write rows, write cols, crop rows, crop cols) slices.
+
+    The read window is the tile grown by ``halo`` pixels within the raster, and the crop slices
+    select the tile in the result of the read window.
+    """
+    rows, cols = shape
+    windows = []
+    for r in range(0, rows, tile_size):
+        for c in range(0, cols, tile_size):
+            r1, c1 = min(r + tile_size, rows), min(c + tile_size, cols)
+            rh, ch = max(r - halo, 0), max(c - halo, 0)
+            windows.append((slice(rh, min(r1 + halo, rows)), slice(ch, min(c1 + halo, cols)),
+                            slice(r, r1), slice(c, c1),
+                            slice(r - rh, r1 - rh), slice(c - ch, c1 - ch)))
+    return windows
+
+
+def filter_tiles(filter_func, img, tile_size=512, workers=None):
+    """Apply a filter to every band and spatial tile of an image, on a process pool.
+
+    Args:
+        filter_func (callable): boxcar, refined_lee, or a functools.partial of them
+        img (np.ndarray): array of shape (rows, cols) or (bands, rows, cols)
+        tile_size (int, optional): tile width and height in pixels. Defaults to 512.
+        workers (int, optional): number of worker processes; 1 runs in this process. Defaults to the number of CPUs.
+
+    Returns:
+        np.ndarray: the filtered image, float32
+    """
+    img = np.asarray(img)
+    bands = img[np.newaxis] if img.ndim == 2 else img
+    halo = filter_halo(filter_func)
+    windows = halo_windows(bands.shape[-2:], tile_size, halo)
+    tasks = [(b, w) for b in range(len(bands)) for w in windows]
+    out = np.empty(bands.shape, dtype=np.float32)
+    if workers == 1 or len(tasks) == 1:
+        results = (filter_func(bands[b, w[0], w[1]]) for b, w in tasks)
+        for (b, w), res in zip(tasks, results):
+            out[b, w[2], w[3]] = res[w[4], w[5]]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(filter_func, np.ascontiguousarray(bands[b, w[0], w[1]])) for b, w in tasks]
+            for (b, w), future in zip(tasks, futures):
+                out[b, w[2], w[3]] = future.result()[w[4], w[5]]
+    return out[0] if img.ndim == 2 else out
@@ -1,15 +1,28 @@
+from __future__ import annotations
+import os
 from django.core.exceptions import BadRequest
 from django.http import FileResponse
-import ee
+from .ee_client import ee
 from .data_processing import compute_feature, filter_dataset, make_false_color_monthly_composite
-from .conversion import geojson_to_ee, shp_to_ee, shp_zip_to_ee
-from .constants import DATASET_LIST, FEATURE_LIST, MODEL_LIST
+from .cache import cache_from_settings, canonical_hash
+from .executor import imap_bounded, run_concurrently
+from .jobs import SUCCEEDED, get_job_manager
+from .tasks import get_task_index
+from .tracing import ee_call, stage
+from .downloads import RESULTS_DIR, open_result_file
+from .local_export import export_local, job_to_task_status
+from .conversion import BoundaryRegistry, file_digest, geojson_bounds, geojson_to_ee, scale_to_tolerance, shp_zip_to_ee
+from .constants import DATASET_LIST, FEATURE_LIST, MODEL_LIST, get_dataset_scale
+from .dates import DAY_MILLIS, composite_windows, season_date_range, shift_years
 from .speckle_filters import boxcar
 
 seasons = ['sowing', 'peak', 'harvesting']
 
 default_boundary_file = "data/Terai_belt_Nepal.shp"
 
+# districts of the default boundary file, parsed once and indexed by name
+default_boundaries = BoundaryRegistry(default_boundary_file, 'DISTRICT')
+
 default_download_scale = 250
 
 rice_vis_params = {"min": 0, "max": 1, "opacity": 1, "palette": ["ffffff", "328138"]}
@@ -17,11 +30,11 @@ rice_vis_params = {"min": 0, "max": 1, "opacity": 1, "palette": ["ffffff", "3281
 rice_thumbnail_params = {"min": 0, "max": 2, "opacity": 1, "palette": ["000000", "328138", "ffffff"]}
 
 
-def get_phenology(data):
+@stage('graph')
+def make_phenology_image(data):
     '''
-    Get time-series image data for the input ground truth samples
+    Get the time-series image of the input ground truth samples, one band per composite
     '''
-    # print(data)
     from datetime import datetime
     from dateutil.relativedelta import relativedelta
     
@@ -33,7 +46,14 @@ def get_phenology(data):
     
     samples_ee = geojson_to_ee(samples) # may raise error if conversion is not possible
     
-    data_pool = filter_dataset(data_filters, samples_ee.geometry()) \
+    # the bounding box of the samples, computed here: the geometry of the samples would put all of
+    # them in the request of every batch of iter_phenology(). The margin keeps the box of a single
+    # sample from being empty.
+    west, south, east, north = geojson_bounds(samples)
+    margin = 1e-4
+    bounds = ee.Geometry.Rectangle([west - margin, south - margin, east + margin, north + margin])
+    
+    data_pool = filter_dataset(data_filters, bounds) \
                 .filterDate(start_date.strftime("%Y-%m"), end_date.strftime("%Y-%m"))
     
     composite = make_composite(data_pool, \
@@ -47,90 +67,224 @@ def get_phenology(data):
     year_img = feature_pool.map(lambda img: img.unmask(99999).rename(ee.Number(img.get('system:time_start')).format("%d").cat('_feature'))) \
                             .toBands()
     
+    return year_img, samples_ee
+
+
+def get_phenology(data):
+    '''
+    Get time-series image data for the input ground truth samples
+    '''
+    # print(data)
+    year_img, samples_ee = make_phenology_image(data)
+    
     sample_res = year_img.sampleRegions(
         samples_ee,
         scale=10,
         geometries=True
     )
     
-    return sample_res.getInfo()
+    return ee_call(sample_res, 'getInfo')
 
 
-def get_monthly_composite(start_date, end_date):
-    return make_false_color_monthly_composite(start_date, end_date)
+def iter_phenology(data, batch_size=None, max_in_flight=None):
+    """Get time-series image data for the input ground truth samples, batch by batch
 
+    The samples are split into batches of ``batch_size`` features that are sampled by separate
+    requests, at most ``max_in_flight`` at the same time, so neither the Earth Engine requests
+    nor the memory used grow with the number of samples.
 
-def make_composite(data_pool: ee.ImageCollection, start_date, end_date, days, method="median") -> ee.ImageCollection:
+    Args:
+        data (dict): the request, see get_phenology()
+        batch_size (int, optional): samples per request. Defaults to the PHENOLOGY_BATCH_SIZE setting.
+        max_in_flight (int, optional): concurrent requests. Defaults to the PHENOLOGY_MAX_IN_FLIGHT setting.
+
+    Returns:
+        generator: the sampled GeoJSON features, in the order of the input samples
+    """
+    from django.conf import settings
+    batch_size = batch_size or getattr(settings, 'PHENOLOGY_BATCH_SIZE', 500)
+    max_in_flight = max_in_flight or getattr(settings, 'PHENOLOGY_MAX_IN_FLIGHT', 4)
     
-    def getComposite(date):
-        date = ee.Date(date)
-        end_millis = date.advance(days, "day").millis().min(ee.Date(end_date).millis()) 
-        filtered_pool = data_pool.filterDate(date, ee.Date(end_millis))
-        
-        if method == 'minimum':
-            season_data = filtered_pool.min()
-        elif method == 'maximum':
-            season_data = filtered_pool.max()
-        elif method == 'median':
-            season_data = filtered_pool.median()
-        elif method == 'mean':
-            season_data = filtered_pool.mean()
-        elif method == 'mode':
-            season_data = filtered_pool.mode()
-        else:
-            raise BadRequest("Unrecognized composite type")
-        
-        return ee.Algorithms.If(filtered_pool.size().gt(0), season_data.set('system:time_start', date.millis()))
+    # build the image before streaming starts so that invalid requests fail early
+    year_img, _ = make_phenology_image(data)
+    samples = data['samples']
     
-    def map_func(dateMillis):
-        date = ee.Date(dateMillis)
-        return getComposite(date)
+    def batches():
+        features = samples['features']
+        for i in range(0, len(features), batch_size):
+            yield {**samples, 'features': features[i:i + batch_size]}
     
+    def sample_batch(batch):
+        return ee_call(year_img.sampleRegions(
+            geojson_to_ee(batch),
+            scale=10,
+            geometries=True
+        ), 'getInfo')['features']
     
-    gap_difference = ee.Date(start_date).advance(days, 'day').millis().subtract(ee.Date(start_date).millis())
-    list_map = ee.List.sequence(ee.Date(start_date).millis(), ee.Date(end_date).millis(), gap_difference)
-    composites = ee.ImageCollection.fromImages(list_map.map(map_func).removeAll([None]))
+    def features():
+        for batch_features in imap_bounded(sample_batch, batches(), max_in_flight):
+            yield from batch_features
     
-    return composites
+    return features()
+
+
+def get_monthly_composite(start_date, end_date):
+    return make_false_color_monthly_composite(start_date, end_date)
+
+
+# composite methods of make_composite(), as ee.ImageCollection methods
+COMPOSITE_METHODS = {
+    'minimum': 'min',
+    'maximum': 'max',
+    'median': 'median',
+    'mean': 'mean',
+    'mode': 'mode',
+}
+
+
+def make_composite(data_pool: ee.ImageCollection, start_date, end_date, days, method="median") -> ee.ImageCollection:
+    """Reduce the images of every ``days``-day window between two dates to a composite.
+
+    The windows are planned in Python. Every image of the period is tagged with the index of
+    its window, and a join groups the images by window in a single pass. Windows without any
+    image have no match in the join, so they are skipped.
+
+    Args:
+        data_pool (ee.ImageCollection): the images
+        start_date (str): start of the first window
+        end_date (str): end of the period, exclusive
+        days (int): length of the windows in days
+        method (str, optional): minimum, maximum, median, mean or mode. Defaults to "median".
+
+    Raises:
+        BadRequest: unknown method
+
+    Returns:
+        ee.ImageCollection: one composite per window with images, with the window start as system:time_start
+    """
+    if method not in COMPOSITE_METHODS:
+        raise BadRequest("Unrecognized composite type")
+    reduce = COMPOSITE_METHODS[method]
+
+    windows = composite_windows(start_date, end_date, days)
+    if not windows:
+        return ee.ImageCollection([])
+    start, end = windows[0][0], windows[-1][1]
+    gap = days * DAY_MILLIS
+
+    window_starts = ee.FeatureCollection([ee.Feature(None, {'window': i, 'start': s}) for i, (s, _) in enumerate(windows)])
+    tagged_pool = data_pool.filterDate(start, end) \
+        .map(lambda img: img.set('window', ee.Number(img.get('system:time_start')).subtract(start).divide(gap).floor().int()))
+    grouped = ee.Join.saveAll('images').apply(window_starts, tagged_pool, ee.Filter.equals(leftField='window', rightField='window'))
+
+    def getComposite(window):
+        composite = getattr(ee.ImageCollection.fromImages(window.get('images')), reduce)()
+        return composite.set('system:time_start', window.get('start'))
+
+    return ee.ImageCollection(grouped.map(getComposite))
+
+
+@stage('boundary')
+def get_boundary(data_filters, scale=None):
+    """Get the study region selected in the dataset filters
+
+    Args:
+        data_filters (dict): json-like Python dictionary that contains filter settings
+        scale (float, optional): pixel size of the dataset; the boundary is simplified to half of it. Defaults to None.
+
+    Returns:
+        ee.Feature | ee.FeatureCollection: the uploaded boundary or a district of the default boundary file
+    """
+    tolerance = scale_to_tolerance(scale) if scale else None
+    if data_filters['boundary'] == 'upload':
+        return shp_zip_to_ee(data_filters['boundary_file'], tolerance)
+    return default_boundaries.get_ee(data_filters['boundary'], tolerance)
 
 
 def compute_hectare_area(img, band_name, boundary, scale) -> ee.Number:
-    area = ee.Number(img.multiply(ee.Image.pixelArea()).reduceRegion(ee.Reducer.sum(),boundary,scale,None,None,False,1e13).get(band_name)).divide(1e4).getInfo()
+    area = ee.Number(img.multiply(ee.Image.pixelArea()).reduceRegion(ee.Reducer.sum(),boundary,scale,None,None,False,1e13).get(band_name)).divide(1e4)
     return area
 
-def run_threshold_based_classification(filters):
+@stage('graph')
+def run_threshold_based_classification(filters, boundary=None):
     """Run classification using thresholds
 
     Args:
         filters (dict): Json-like Python dictionary that holds all filters from request
+        boundary (ee.Feature, optional): study region, in place of the boundary of the dataset filters. Defaults to None.
 
     Returns:
         tuple(dict, str): A tuple of dict that contains tile layer urls for each season and a tile url string for combined result
     """    
-    print(filters)
     
     data_filters = filters['dataset']
+    scale = get_dataset_scale(data_filters['name'])
+    
     # boundary
-    if data_filters['boundary'] == 'upload':
-        boundary = shp_zip_to_ee(data_filters['boundary_file'])
-    else:
-        default_boundary = shp_to_ee(default_boundary_file)
-        boundary = ee.Feature(default_boundary.filterMetadata('DISTRICT', 'equals', data_filters['boundary']).first())
+    if boundary is None:
+        boundary = get_boundary(data_filters, scale)
     
     # crop mask
+    crop_mask = get_threshold_crop_mask(data_filters, boundary)
+    
+    # the scenes of all seasons are speckle filtered and mapped to the feature once,
+    # then every season makes its composites from the shared collection
+    season_filters = filters['seasons']
+    pool = make_feature_pool(data_filters, boundary, *season_date_range(season_filters))
+    
+    combined_res = combine_threshold_seasons(data_filters, pool, season_filters, filters['op'], crop_mask, boundary)
+        
+    return combined_res, boundary, scale
+
+
+def get_threshold_crop_mask(data_filters, boundary):
     crop_mask = ee.Image(1)
     if data_filters["use_crop_mask"]:
         if data_filters["crop_mask"]:
             crop_mask = ee.Image(data_filters["crop_mask"]).clip(boundary)
         else:
             raise BadRequest("Invalid crop mask argument.")
+    return crop_mask
+
+
+def make_feature_pool(data_filters, boundary, start_date, end_date) -> ee.ImageCollection:
+    """Filter the dataset to the study region and period, speckle filter radar scenes and compute the selected feature
+
+    Args:
+        data_filters (dict): json-like Python dictionary that contains filter settings
+        boundary (ee.Feature): study region
+        start_date (str): start of the period
+        end_date (str): end of the period, exclusive
+
+    Returns:
+        ee.ImageCollection: one 'feature' image per scene
+    """
+    pool = filter_dataset(data_filters, boundary.geometry()).filterDate(start_date, end_date)
     
-    # filter dataset
-    pool = filter_dataset(data_filters, boundary.geometry())
-    
-    # apply specific filter and thresholds for each season
-    op = filters['op']
-    season_filters = filters['seasons']
+    # speckle filter if radar data
+    # TODO: allow selection of speckle filter type
+    if data_filters['name'] in DATASET_LIST['radar']:
+    #     pool = pool.map(lambda img: refined_lee(img).copyProperties(img).set('system:time_start', img.get('system:time_start')))
+        pool = pool.map(lambda img: boxcar(img))
+
+    # compute selected feature
+    return compute_feature(data_filters['name'], pool, data_filters['feature'])
+
+
+def combine_threshold_seasons(data_filters, pool, season_filters, op, crop_mask, boundary) -> ee.Image:
+    """Threshold the composites of every season and combine the seasons
+
+    Args:
+        data_filters (dict): json-like Python dictionary that contains filter settings
+        pool (ee.ImageCollection): the scenes of all seasons, see make_feature_pool()
+        season_filters (list): seasons with start and end dates and thresholds
+        op (str): 'and' or 'or', how the seasons are combined
+        crop_mask (ee.Image): pixels to keep
+        boundary (ee.Feature): study region
+
+    Returns:
+        ee.Image: 1 where the thresholds of the seasons are met
+    """
     season_res = {season['name']: None for season in season_filters}
     
     def map_composites(composite):
@@ -139,7 +293,6 @@ def run_threshold_based_classification(filters):
             .And(composite.gte(thres_min)) \
             .updateMask(crop_mask).clip(boundary)
 
-
     for season in season_filters:
             
         # date range of this season
@@ -148,21 +301,8 @@ def run_threshold_based_classification(filters):
         # threshold min and max
         thres_min, thres_max = float(season['min']), float(season['max'])
 
-        # filter by season date range
-        season_data_pool = pool.filter(ee.Filter.date(start_date, end_date))
-        
-        # speckle filter if radar data
-        # TODO: allow selection of speckle filter type
-        if data_filters['name'] in DATASET_LIST['radar']:
-        #     season_data_pool = season_data_pool.map(lambda img: refined_lee(img).copyProperties(img).set('system:time_start', img.get('system:time_start')))
-            season_data_pool = season_data_pool \
-                .map(lambda img: boxcar(img))
-
-        # compute selected feature
-        season_data_pool = compute_feature(data_filters['name'], season_data_pool, data_filters['feature'])
-        
-        # make composite
-        composites = make_composite(season_data_pool, start_date, end_date, days=int(data_filters["composite_days"]), method=data_filters['composite'])
+        # make composite, from the images of the season date range
+        composites = make_composite(pool, start_date, end_date, days=int(data_filters["composite_days"]), method=data_filters['composite'])
         
         
         # print(season_data.getDownloadUrl({'name': 'data', 'region': boundary}))
@@ -180,14 +320,75 @@ def run_threshold_based_classification(filters):
             combined_res = combined_res.And(season_res_list[i])
         else:
             combined_res = combined_res.Or(season_res_list[i])
-    
-    if data_filters['name'] in DATASET_LIST['radar']:
-        scale = DATASET_LIST['radar'][data_filters['name']]['scale']
-    else:
-        scale = DATASET_LIST['optical'][data_filters['name']]['scale']
-        
-    return combined_res, boundary, scale
+    return combined_res
+
+# tile urls, thumbnail urls and areas of threshold-based classifications, see get_threshold_results()
+_result_cache = None
+
+def get_result_cache():
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = cache_from_settings('RESULT_CACHE', maxsize=256, ttl=3600)
+    return _result_cache
+
+
+def filters_cache_key(filters, *extra):
+    """Key of a request in the result caches
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request
+        extra: other json-like values the result depends on
+
+    Returns:
+        str: hash of the canonical JSON of the filters, with an uploaded boundary replaced by the hash of its content
+    """
+    return canonical_hash({**filters, 'dataset': hashable_dataset_filters(filters['dataset'])}, *extra)
+
+
+def hashable_dataset_filters(data_filters):
+    """Copy of the dataset filters for the cache keys
+
+    The boundary file is replaced by the hash of its content when the boundary is uploaded, and
+    dropped otherwise: requests for a district send ``"boundary_file": null``.
 
+    Args:
+        data_filters (dict): json-like Python dictionary that contains filter settings
+
+    Returns:
+        dict: the filters, without file objects
+    """
+    data_filters = dict(data_filters)
+    boundary_file = data_filters.pop('boundary_file', None)
+    if data_filters.get('boundary') == 'upload' and boundary_file is not None:
+        data_filters['boundary_file'] = file_digest(boundary_file)
+    return data_filters
+
+
+def get_threshold_results(filters, progress=None):
+    """Run a threshold-based classification and make its results, or reuse the results of an identical request
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request
+        progress (callable, optional): called with the progress between 0 and 1 and a message. Defaults to None.
+
+    Returns:
+        dict: see make_empirical_results()
+    """
+    cache = get_result_cache()
+    key = filters_cache_key(filters)
+    res = cache.get(key)
+    if res is None:
+        if progress:
+            progress(0.1, "Building the classification")
+        img, boundary, scale = run_threshold_based_classification(filters)
+        if progress:
+            progress(0.3, "Computing the area and map layers")
+        res = make_empirical_results(img, boundary, scale)
+        cache.set(key, res)
+    return res
+
+
+@stage('results')
 def make_empirical_results(img, boundary, scale):
     
     res = {}
@@ -197,20 +398,250 @@ def make_empirical_results(img, boundary, scale):
     
     # set nodata value to 2 for visualiztion purpose
     thumbnail_img = img.unmask(2)
-        
-    res['combined'] = {
-        'tile_url': img.getMapId(rice_vis_params)['tile_fetcher'].url_format,
-        'download_url': thumbnail_img.getThumbURL({
+    
+    # the three round-trips are independent, so issue them at the same time
+    area, map_id, thumbnail_url = run_concurrently(
+        lambda: ee_call(area, 'getInfo'),
+        lambda: ee_call(img, 'getMapId', rice_vis_params),
+        lambda: ee_call(thumbnail_img, 'getThumbURL', {
             **rice_thumbnail_params,           # the style for thumbnail picture
             'dimensions': 1920,
             'region': boundary.geometry(),
             'format': 'jpg'
         }),
+    )
+        
+    res['combined'] = {
+        'tile_url': map_id['tile_fetcher'].url_format,
+        'download_url': thumbnail_url,
         "area": area
     }
     
     return res
 
+def get_batch_districts(filters):
+    """Districts of the default boundary file selected by a batch request
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request, with a list
+            of district names under 'districts'; all districts if it is missing
+
+    Raises:
+        BadRequest: the districts are not a list of known district names
+
+    Returns:
+        list: the district names, without duplicates
+    """
+    names = filters.get('districts') or default_boundaries.names()
+    if not isinstance(names, list):
+        raise BadRequest("districts should be a list of district names")
+    for name in names:
+        # raises on unknown districts
+        default_boundaries.get(name)
+    return list(dict.fromkeys(names))
+
+
+@stage('boundary')
+def get_batch_boundaries(filters, scale):
+    """Get the districts of a batch request and the union of their boundaries
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request
+        scale (float): pixel size of the dataset; the boundaries are simplified to half of it
+
+    Returns:
+        tuple(ee.FeatureCollection, ee.Feature): the districts, and their union as the study region
+    """
+    districts = default_boundaries.get_ee_collection(get_batch_districts(filters), scale_to_tolerance(scale))
+    return districts, ee.Feature(districts.geometry())
+
+
+def compute_district_hectare_areas(img, band_name, districts, scale) -> ee.Dictionary:
+    """Area of the pixels of a band in every district, computed in a single reduceRegions pass
+
+    Returns:
+        ee.Dictionary: area in square meters by district name
+    """
+    stats = img.select(band_name).multiply(ee.Image.pixelArea()).reduceRegions(
+        collection=districts, reducer=ee.Reducer.sum(), scale=scale)
+    # a single band is reduced into the 'sum' property
+    return ee.Dictionary.fromLists(stats.aggregate_array(default_boundaries.key_field), stats.aggregate_array('sum'))
+
+
+def run_batch_threshold_classification(filters):
+    """Run a threshold-based classification once over the union of several districts
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request, see get_batch_districts();
+            the boundary of the dataset filters is not used
+
+    Returns:
+        tuple(ee.Image, ee.FeatureCollection, float): the classification, the districts and the scale
+    """
+    scale = get_dataset_scale(filters['dataset']['name'])
+    districts, union = get_batch_boundaries(filters, scale)
+    img, _, _ = run_threshold_based_classification(filters, union)
+    return img, districts, scale
+
+
+def batch_cache_key(filters, *extra):
+    """Key of a batch request in the result cache
+
+    The boundary of the dataset filters is not used by batch runs, so it is left out of the key,
+    and the districts are the ones the run uses, see get_batch_districts().
+    """
+    data_filters = {k: v for k, v in filters['dataset'].items() if k not in ('boundary', 'boundary_file')}
+    return canonical_hash({**filters, 'dataset': data_filters, 'districts': get_batch_districts(filters)}, 'batch', *extra)
+
+
+def get_batch_threshold_results(filters):
+    """Areas of a threshold-based classification in every district of a batch request, or the results of an identical request
+
+    The classification is built once over the union of the districts and the areas come back
+    in one round-trip; the tiles of a district are made on demand by get_batch_district_tiles().
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request, see get_batch_districts()
+
+    Returns:
+        dict: area in hectares by district name under 'districts', and their total under 'combined'
+    """
+    cache = get_result_cache()
+    key = batch_cache_key(filters)
+    res = cache.get(key)
+    if res is None:
+        img, districts, scale = run_batch_threshold_classification(filters)
+        res = make_batch_results(img, districts, scale, get_batch_districts(filters))
+        cache.set(key, res)
+    return res
+
+
+@stage('results')
+def make_batch_results(img, districts, scale, names):
+    areas = ee_call(compute_district_hectare_areas(img, 'feature', districts, scale), 'getInfo')
+
+    # convert to hectares
+    res = {'districts': {}}
+    for name in names:
+        area = areas.get(name)
+        res['districts'][name] = {'area': area / 1e4 if area is not None else None}
+    res['combined'] = {'area': sum(district['area'] or 0 for district in res['districts'].values())}
+    return res
+
+
+def get_batch_district_tiles(filters, district):
+    """Tile url of one district of a batch request, cached like the areas
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request, see get_batch_districts()
+        district (str): one of the districts of the request
+
+    Raises:
+        BadRequest: the district is not part of the request
+
+    Returns:
+        dict: the tile url of the classification clipped to the district
+    """
+    if district not in get_batch_districts(filters):
+        raise BadRequest(f"District not in the batch: {district}")
+    cache = get_result_cache()
+    key = batch_cache_key(filters, district)
+    res = cache.get(key)
+    if res is None:
+        img, _, scale = run_batch_threshold_classification(filters)
+        boundary = default_boundaries.get_ee(district, scale_to_tolerance(scale))
+        with stage('results'):
+            map_id = ee_call(img.clip(boundary), 'getMapId', rice_vis_params)
+        res = {'tile_url': map_id['tile_fetcher'].url_format}
+        cache.set(key, res)
+    return res
+
+
+def get_batch_years(filters, start_date):
+    """Years of a multi-year request and their offsets from the configured dates
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request, with a list
+            of years under 'years'
+        start_date (str): start of the configured period; the periods of the years start in them
+
+    Raises:
+        BadRequest: the years are not a list of years
+
+    Returns:
+        dict: offset in years by year, without duplicates
+    """
+    years = filters.get('years')
+    if not isinstance(years, list) or not years or not all(isinstance(year, int) for year in years):
+        raise BadRequest("years should be a list of years")
+    # ISO dates start with the year
+    start_year = int(start_date[:4])
+    return {year: year - start_year for year in dict.fromkeys(years)}
+
+
+def shift_seasons(season_filters, years):
+    return [{**season, 'start': shift_years(season['start'], years), 'end': shift_years(season['end'], years)}
+            for season in season_filters]
+
+
+@stage('graph')
+def run_multi_year_threshold_classification(filters):
+    """Run a threshold-based classification for several years, with the seasons shifted to each year
+
+    The years share the boundary and one filtered collection of scenes that covers all of them.
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request, see get_batch_years()
+
+    Returns:
+        tuple(dict, ee.Feature, float): the classification by year, the boundary and the scale
+    """
+    data_filters = filters['dataset']
+    scale = get_dataset_scale(data_filters['name'])
+    boundary = get_boundary(data_filters, scale)
+    crop_mask = get_threshold_crop_mask(data_filters, boundary)
+    
+    season_filters = filters['seasons']
+    offsets = get_batch_years(filters, season_date_range(season_filters)[0])
+    seasons_by_year = {year: shift_seasons(season_filters, offset) for year, offset in offsets.items()}
+    
+    # one collection covers the seasons of all years
+    pool = make_feature_pool(data_filters, boundary, *season_date_range(
+        [season for seasons in seasons_by_year.values() for season in seasons]))
+    
+    imgs = {year: combine_threshold_seasons(data_filters, pool, seasons, filters['op'], crop_mask, boundary)
+            for year, seasons in seasons_by_year.items()}
+    return imgs, boundary, scale
+
+
+def get_multi_year_threshold_results(filters):
+    """Areas of a threshold-based classification in several years, or the results of an identical request
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request, see get_batch_years()
+
+    Returns:
+        dict: area in hectares by year under 'years'
+    """
+    cache = get_result_cache()
+    key = filters_cache_key(filters, 'years')
+    res = cache.get(key)
+    if res is None:
+        imgs, boundary, scale = run_multi_year_threshold_classification(filters)
+        res = make_multi_year_threshold_results(imgs, boundary, scale)
+        cache.set(key, res)
+    return res
+
+
+@stage('results')
+def make_multi_year_threshold_results(imgs, boundary, scale):
+    # the areas of all years in a single request
+    areas = ee.Dictionary({str(year): compute_hectare_area(img, 'feature', boundary.geometry(), scale)
+                           for year, img in imgs.items()})
+    areas = ee_call(areas, 'getInfo')
+    return {'years': {str(year): {'area': areas[str(year)]} for year in imgs}}
+
+
 def export_result(img, boundary, scale):
     import time
         
@@ -221,70 +652,79 @@ def export_result(img, boundary, scale):
         "maxPixels": 1e13,
     })
     
-    task.start()
+    ee_call(task, 'start')
+    
+    status = ee_call(task, 'status')
+    get_task_index().seed(status)
+    
+    return status['id']
     
-    return task.status()['id']
+
+def _run_local_export_job(job, filters, samples=None):
+    job.set_progress(0, "Classifying")
+    if samples is None:
+        img, boundary, scale = run_threshold_based_classification(filters)
+    else:
+        img, boundary, scale, _ = run_supervised_classification(filters, samples)
+    path = os.path.join(RESULTS_DIR, job.description + ".tif")
+    export_local(img, boundary, scale, path, progress=job.set_progress)
+    return job.description + ".tif"
+
+
+def submit_local_export(filters, samples=None):
+    """Enqueue a classification downloaded to a local GeoTIFF, see export_local()
+
+    The job is reported by get_task_list() and get_the_task() like an export task, and its file
+    is served by download_file().
+
+    Args:
+        filters (dict): The filters of the classification.
+        samples (dict, optional): The ground truth samples of a supervised classification, threshold-based if None. Defaults to None.
+
+    Returns:
+        Job: the queued job
+    """
+    import time
     
+    return get_job_manager().submit('export', _run_local_export_job, filters, samples, description=str(time.time()))
+
+
+def _local_exports():
+    return [job for job in get_job_manager().list() if job.kind == 'export']
+
 
 def get_task_list():
-    tasks = ee.batch.Task.list()
-    res = []
-    for task in tasks:
-        res.append(task.status())
-    return res
+    return [job_to_task_status(job) for job in _local_exports()] + get_task_index().list()
 
 def get_the_task(id):
-    tasks = ee.batch.Task.list()
-    for task in tasks:
-        if task.status()['id'] == id:
-            return task.status()
-    return None
+    job = get_job_manager().get(id)
+    if job is not None and job.kind == 'export':
+        return job_to_task_status(job)
+    return get_task_index().get(id)
     
 
 def download_file(id):
-    from pydrive.auth import GoogleAuth
-    from pydrive.drive import GoogleDrive
-    from oauth2client.service_account import ServiceAccountCredentials
-    from utils.credential import EE_PRIVATE_KEY
-    import json
+    """Open the GeoTIFF exported by a task, see open_result_file()
+
+    Returns:
+        ResultFile: the file, or None if the task or its file does not exist
+    """
+    job = get_job_manager().get(id)
+    if job is not None and job.kind == 'export':
+        # written locally, see submit_local_export()
+        return open_result_file(job.result) if job.state == SUCCEEDED else None
     
     status = get_the_task(id)
     if status is None:
         return None
     
-    gauth = GoogleAuth()
-    scopes=['https://www.googleapis.com/auth/drive']
-    # print(json.loads(EE_PRIVATE_KEY))
-    gauth.credentials = ServiceAccountCredentials.from_json_keyfile_dict(
-        json.loads(EE_PRIVATE_KEY),
-        scopes=scopes
-    )
-    drive = GoogleDrive(gauth)
-    
-    file_list = drive.ListFile({'q': "'root' in parents and trashed=false"}).GetList()
-    
-    for file in file_list:
-        
-        filename = file['title']
-        
-        if filename == status['description'] + ".tif":
-
-            # download file into working directory (in this case a tiff-file)
-            file.GetContentFile("results/" + filename, mimetype="image/tiff")
-
-            # delete file afterwards to keep the Drive empty
-            # file.Delete()
-            
-            return "results/" + filename
-    
-    return None
-    
+    return open_result_file(status['description'] + ".tif")
     
 
 CLASS_FIELD = '$class'
 
+@stage('graph')
 def run_supervised_classification(filters, samples):
-    print(filters)
     
     dataset_filters = filters['dataset']
     classification_filters = filters['classification']
@@ -292,8 +732,36 @@ def run_supervised_classification(filters, samples):
     start_date, end_date = classification_filters['start_date'], \
                             classification_filters['end_date']
     
-    # add a class property to each sample, either 0 or 1
-    class_property = classification_filters['class_property']
+    # try convert geojson to an ee.FeatureCollection
+    samples = label_samples(samples, classification_filters['class_property'])
+    samples_ee = geojson_to_ee(samples)
+    
+    scale = get_dataset_scale(dataset_filters['name'])
+    
+    # boundary
+    boundary = get_boundary(dataset_filters, scale)
+    
+    # choosing dataset and apply filters, speckle filter and compute features from raw images, e.g., NDVI, RVI, etc.
+    pool = make_feature_pool(dataset_filters, boundary, start_date, end_date)
+    
+    # the sampled table is reused by runs that only change the model or the training ratio
+    classified, confusion_matrix = classify_period(
+        filters, pool, samples_ee, boundary, scale, start_date, end_date,
+        table_key=training_table_key(dataset_filters, samples, start_date, end_date, scale))
+        
+    return classified, boundary, scale, confusion_matrix
+
+
+def label_samples(samples, class_property):
+    """Add a class property to each sample, either 0 or 1
+
+    Args:
+        samples (dict): GeoJSON feature collection of the ground truth samples, modified in place
+        class_property (dict): the 'name' of the class property and its 'positiveValue'
+
+    Returns:
+        dict: the samples
+    """
     class_name = class_property['name']
     class_value = class_property['positiveValue']
     for feature in samples["features"]:
@@ -301,42 +769,55 @@ def run_supervised_classification(filters, samples):
             feature['properties'][CLASS_FIELD] = 1
         else:
             feature['properties'][CLASS_FIELD] = 0
+    return samples
 
-    # try convert geojson to an ee.FeatureCollection
-    samples_ee = geojson_to_ee(samples)
+
+def classify_period(filters, pool, samples_ee, boundary, scale, start_date, end_date, table_key=None):
+    """Train a classifier on the composites of a period and classify them
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request
+        pool (ee.ImageCollection): scenes covering the period, see make_feature_pool()
+        samples_ee (ee.FeatureCollection): the samples, see label_samples()
+        boundary (ee.Feature): study region
+        scale (float): pixel size of the dataset
+        start_date (str): start of the period
+        end_date (str): end of the period, exclusive
+        table_key (str, optional): key of the sampled table in the training table cache, see sample_period(). Defaults to None.
+
+    Returns:
+        tuple(ee.Image, ee.ConfusionMatrix): the classified image and the confusion matrix of the test samples
+    """
+    classification_filters = filters['classification']
     
-    if dataset_filters['name'] in DATASET_LIST['radar']:
-        scale = DATASET_LIST['radar'][dataset_filters['name']]['scale']
-    else:
-        scale = DATASET_LIST['optical'][dataset_filters['name']]['scale']
+    stacked_image, points = sample_period(filters['dataset'], pool, samples_ee, scale, start_date, end_date, table_key)
     
-    # boundary
-    if dataset_filters['boundary'] == 'upload':
-        boundary = shp_zip_to_ee(dataset_filters['boundary_file'])
-    else:
-        default_boundary = shp_to_ee(default_boundary_file)
-        boundary = ee.Feature(
-            default_boundary.filterMetadata(
-                'DISTRICT', 'equals', dataset_filters['boundary']
-            ).first()
-        )
-    
-    # choosing dataset and apply filters
-    pool = filter_dataset(dataset_filters, boundary.geometry()) \
-            .filterDate(start_date, end_date)
-            
-    # speckle filter
-    # TODO: allow more options for speckle filters
-    if dataset_filters['name'] in DATASET_LIST['radar']:
-        pool = pool.map(lambda img: boxcar(img))
+    # train test split
+    training = points.filter(ee.Filter.lt('random', classification_filters['training_ratio']))
+    testing = points.filter(ee.Filter.gte('random', classification_filters['training_ratio']))
     
-    # compute features from raw images, e.g., NDVI, RVI, etc.
-    pool = compute_feature(
-        dataset_filters['name'], 
-        pool, 
-        dataset_filters['feature']
-    )
+    # model training
+    model_ee = train_classifier(classification_filters['model'], classification_filters['model_specs'], training)
+                
+    # evaluate model
+    confusion_matrix = testing.classify(model_ee).errorMatrix(CLASS_FIELD, 'classification')
+    
+    classified = classify_stack(stacked_image, model_ee, filters['dataset'], boundary)
     
+    return classified, confusion_matrix
+
+
+def sample_period(dataset_filters, pool, samples_ee, scale, start_date, end_date, table_key=None):
+    """Stack the composites of a period and sample them at the samples
+
+    Without a table key the samples are taken in the graph of the request. With a key, the sampled
+    table is fetched once and kept in the training table cache, and later requests upload it in
+    place of sampling the stack again, see get_training_table().
+
+    Returns:
+        tuple(ee.Image, ee.FeatureCollection): the stacked composites, and the band values and class of
+            every sample with a 'random' column and the 'band_order' of the stack
+    """
     # make composite
     composites = make_composite(
         pool, 
@@ -348,25 +829,89 @@ def run_supervised_classification(filters, samples):
     
     stacked_image = composites.toBands()
     
+    if table_key is not None:
+        table = get_training_table(table_key, stacked_image, samples_ee, scale)
+        points = ee.FeatureCollection([ee.Feature(None, properties) for properties in table['features']]) \
+                            .randomColumn() \
+                            .set('band_order', table['band_order'])
+        return stacked_image, points
+    
     # get image data for each sample
     points = stacked_image.sampleRegions(samples_ee, [CLASS_FIELD], scale=scale) \
                             .randomColumn() \
                             .set('band_order', stacked_image.bandNames())
-    
-    # train test split
-    training = points.filter(ee.Filter.lt('random', classification_filters['training_ratio']))
-    testing = points.filter(ee.Filter.gte('random', classification_filters['training_ratio']))
-    
-    # model training
-    model_func = MODEL_LIST[classification_filters['model']]
-    
-    model_ee = model_func(**classification_filters['model_specs']) \
-                .train(training, CLASS_FIELD)
-                
-    # evaluate model
-    test_pred = testing.classify(model_ee)
-    confusion_matrix = test_pred.errorMatrix(CLASS_FIELD, 'classification')
-    
+    return stacked_image, points
+
+
+# band values and classes of sampled training points, see get_training_table()
+_training_table_cache = None
+
+def get_training_table_cache():
+    global _training_table_cache
+    if _training_table_cache is None:
+        _training_table_cache = cache_from_settings('TRAINING_TABLE_CACHE', maxsize=32)
+    return _training_table_cache
+
+
+def training_table_key(dataset_filters, samples, start_date, end_date, scale):
+    """Key of a sampled table in the training table cache
+
+    Args:
+        dataset_filters (dict): json-like Python dictionary that contains filter settings
+        samples (dict): GeoJSON feature collection of the labelled samples, see label_samples()
+        start_date (str): start of the period of the composites
+        end_date (str): end of the period of the composites
+        scale (float): scale of the sampling
+
+    Returns:
+        str: hash of the canonical JSON of the arguments, with an uploaded boundary replaced by the hash of its content
+    """
+    return canonical_hash(hashable_dataset_filters(dataset_filters), samples, start_date, end_date, scale)
+
+
+def get_training_table(key, stacked_image, samples_ee, scale):
+    """Sample a stack of composites at the samples, or reuse the table of an identical request
+
+    Args:
+        key (str): see training_table_key()
+        stacked_image (ee.Image): the stacked composites
+        samples_ee (ee.FeatureCollection): the labelled samples
+        scale (float): scale of the sampling
+
+    Returns:
+        dict: the band names of the stack under 'band_order' and the properties of the sampled points under 'features'
+    """
+    cache = get_training_table_cache()
+    table = cache.get(key)
+    if table is None:
+        sampled = stacked_image.sampleRegions(samples_ee, [CLASS_FIELD], scale=scale) \
+                                .set('band_order', stacked_image.bandNames())
+        with stage('sampling'):
+            sampled = ee_call(sampled, 'getInfo')
+        table = {
+            'band_order': sampled['properties']['band_order'],
+            'features': [feature['properties'] for feature in sampled['features']],
+        }
+        cache.set(key, table)
+    return table
+
+
+def train_classifier(model, model_specs, training):
+    """Train a classifier of MODEL_LIST on the class of the training points
+
+    Raises:
+        BadRequest: unknown model
+
+    Returns:
+        ee.Classifier: the trained classifier
+    """
+    if model not in MODEL_LIST:
+        raise BadRequest(f"Unknown model: {model}")
+    model_func = getattr(ee.Classifier, MODEL_LIST[model])
+    return model_func(**model_specs).train(training, CLASS_FIELD)
+
+
+def classify_stack(stacked_image, model_ee, dataset_filters, boundary):
     # Classify the image
     classified = stacked_image.classify(model_ee)
     
@@ -375,46 +920,294 @@ def run_supervised_classification(filters, samples):
     if dataset_filters["crop_mask"]:
         crop_mask = ee.Image(dataset_filters["crop_mask"]).clip(boundary.geometry())
     
-    classified = classified.updateMask(crop_mask).clip(boundary.geometry())
+    return classified.updateMask(crop_mask).clip(boundary.geometry())
+
+
+def expand_sweep(sweep):
+    """Classifier configurations of a sweep, with every combination of the model specs given as lists
+
+    Args:
+        sweep (list): models and their specs, e.g. ``[{"model": "Random Forest", "model_specs": {"numberOfTrees": [50, 100]}}]``
+
+    Raises:
+        BadRequest: the sweep is not a list of known models and their specs, or has too many configurations
+
+    Returns:
+        list: the configurations, with a 'model' and its 'model_specs'
+    """
+    import itertools
+    from django.conf import settings
+    if not isinstance(sweep, list) or not sweep:
+        raise BadRequest("sweep should be a list of models and their specs")
+    configurations = []
+    for entry in sweep:
+        if not isinstance(entry, dict) or entry.get('model') not in MODEL_LIST:
+            raise BadRequest(f"Unknown model: {entry.get('model') if isinstance(entry, dict) else entry}")
+        specs = entry.get('model_specs') or {}
+        if not isinstance(specs, dict):
+            raise BadRequest(f"model_specs of {entry['model']} should be an object of parameters")
+        values = [value if isinstance(value, list) else [value] for value in specs.values()]
+        for combination in itertools.product(*values):
+            configurations.append({'model': entry['model'], 'model_specs': dict(zip(specs, combination))})
+    max_configurations = getattr(settings, 'CLASSIFICATION_SWEEP_MAX_CONFIGURATIONS', 32)
+    if len(configurations) > max_configurations:
+        raise BadRequest(f"Too many configurations in the sweep: {len(configurations)}, at most {max_configurations}")
+    return configurations
+
+
+def sweep_confusion_matrix(configuration, points, classification_filters):
+    """Confusion matrix of a classifier configuration on the sampled points
+
+    With ``folds`` in the classification filters, the points are split in folds on their 'random'
+    column and the out-of-fold predictions of all folds make one confusion matrix; otherwise the
+    points are split on the training ratio.
+
+    Returns:
+        ee.ConfusionMatrix: the confusion matrix of the test predictions
+    """
+    folds = classification_filters.get('folds')
+    if not folds:
+        training = points.filter(ee.Filter.lt('random', classification_filters['training_ratio']))
+        testing = points.filter(ee.Filter.gte('random', classification_filters['training_ratio']))
+        model_ee = train_classifier(configuration['model'], configuration['model_specs'], training)
+        return testing.classify(model_ee).errorMatrix(CLASS_FIELD, 'classification')
+    
+    predictions = None
+    for fold in range(folds):
+        low, high = fold / folds, (fold + 1) / folds
+        training = points.filter(ee.Filter.Or(ee.Filter.lt('random', low), ee.Filter.gte('random', high)))
+        testing = points.filter(ee.Filter.And(ee.Filter.gte('random', low), ee.Filter.lt('random', high)))
+        fold_predictions = testing.classify(train_classifier(configuration['model'], configuration['model_specs'], training))
+        predictions = fold_predictions if predictions is None else predictions.merge(fold_predictions)
+    return predictions.errorMatrix(CLASS_FIELD, 'classification')
+
+
+@stage('graph')
+def run_classification_sweep(filters, samples):
+    """Sample the training points once and evaluate every classifier configuration of a sweep on them
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request, with the
+            configurations under 'sweep' (see expand_sweep()) and optionally a number of 'folds' in
+            the classification filters for k-fold cross-validation
+        samples (dict): GeoJSON feature collection of the ground truth samples
+
+    Raises:
+        BadRequest: invalid sweep or number of folds
+
+    Returns:
+        tuple(list, ee.Image, ee.FeatureCollection, ee.Feature, float): the configurations, the stacked
+            composites, the sampled points, the boundary and the scale
+    """
+    dataset_filters = filters['dataset']
+    classification_filters = filters['classification']
+    configurations = expand_sweep(filters.get('sweep'))
+    folds = classification_filters.get('folds')
+    if folds is not None and (not isinstance(folds, int) or folds < 2):
+        raise BadRequest("folds should be a number of folds of at least 2")
+    
+    start_date, end_date = classification_filters['start_date'], classification_filters['end_date']
+    samples = label_samples(samples, classification_filters['class_property'])
+    samples_ee = geojson_to_ee(samples)
+    scale = get_dataset_scale(dataset_filters['name'])
+    boundary = get_boundary(dataset_filters, scale)
+    pool = make_feature_pool(dataset_filters, boundary, start_date, end_date)
+    
+    # every configuration is trained on the same table of points
+    stacked_image, points = sample_period(dataset_filters, pool, samples_ee, scale, start_date, end_date,
+                                          training_table_key(dataset_filters, samples, start_date, end_date, scale))
+    return configurations, stacked_image, points, boundary, scale
+
+
+@stage('results')
+def make_sweep_results(filters, configurations, stacked_image, points, boundary, scale):
+    """Accuracy metrics of every configuration of a sweep, and the results of the best one
+
+    The metrics of all configurations come back in a single request. The configuration with the best
+    overall accuracy, then kappa, is trained again on all its training points and only its
+    classification is mapped, see make_classification_results().
+
+    Returns:
+        dict: the 'configurations' with their metrics, the index of the 'best' one and its 'results'
+    """
+    import json
     
-    if dataset_filters['name'] in DATASET_LIST['radar']:
-        scale = DATASET_LIST['radar'][dataset_filters['name']]['scale']
+    classification_filters = filters['classification']
+    matrices = [sweep_confusion_matrix(configuration, points, classification_filters) for configuration in configurations]
+    stats = ee.List([ee.Dictionary({
+        'confusion_matrix': confusion_matrix.array(),
+        'oa': confusion_matrix.accuracy(),
+        'kappa': confusion_matrix.kappa(),
+    }) for confusion_matrix in matrices])
+    stats = ee_call(stats, 'getInfo')
+    
+    best = max(range(len(configurations)), key=lambda i: (stats[i]['oa'] or 0, stats[i]['kappa'] or 0))
+    
+    # the best configuration is trained on all the points it was evaluated with
+    configuration = configurations[best]
+    if classification_filters.get('folds'):
+        training = points
     else:
-        scale = DATASET_LIST['optical'][dataset_filters['name']]['scale']
-        
-    return classified, boundary, scale, confusion_matrix
+        training = points.filter(ee.Filter.lt('random', classification_filters['training_ratio']))
+    model_ee = train_classifier(configuration['model'], configuration['model_specs'], training)
+    classified = classify_stack(stacked_image, model_ee, filters['dataset'], boundary)
+    
+    return {
+        'configurations': [{
+            **configuration,
+            'confusion_matrix': json.dumps(stat['confusion_matrix']),
+            'oa': stat['oa'],
+            'kappa': stat['kappa'],
+        } for configuration, stat in zip(configurations, stats)],
+        'best': best,
+        'results': make_classification_results(classified, boundary, scale, matrices[best]),
+    }
+
+
+def classification_stats(img, boundary, scale, confusion_matrix) -> ee.Dictionary:
+    """Area of a classification in hectares and its accuracy metrics, to be fetched in a single request"""
+    return ee.Dictionary({
+        'area': compute_hectare_area(img, 'classification', boundary.geometry(), scale),
+        'confusion_matrix': confusion_matrix.array(),
+        'oa': confusion_matrix.accuracy(),
+        'kappa': confusion_matrix.kappa(),
+    })
 
 
+@stage('results')
 def make_classification_results(img, boundary, scale, confusion_matrix):
     
     res = {}
     
-    # compute area with unit hectar
+    # compute area with unit hectar, and fetch it with the accuracy metrics in a single request
     # area = ee.Number(combined_res.multiply(ee.Image.pixelArea()).reduceRegion(ee.Reducer.sum(),boundary,scale,None,None,False,1e13).get('feature')).divide(1e4).getInfo()
-    area = compute_hectare_area(img, 'classification', boundary.geometry(), scale)
-    
-    oa = confusion_matrix.accuracy()
-    kappa = confusion_matrix.kappa()
+    stats = classification_stats(img, boundary, scale, confusion_matrix)
     
     thumbnail_img = img.unmask(2)
     
+    stats, map_id, thumbnail_url = run_concurrently(
+        lambda: ee_call(stats, 'getInfo'),
+        lambda: ee_call(img, 'getMapId', rice_vis_params),
+        lambda: ee_call(thumbnail_img, 'getThumbURL', {
+             **rice_thumbnail_params,           # the style for thumbnail picture
+            'dimensions': 1920,
+            'region': boundary.geometry(),
+            'format': 'jpg'
+        }),
+    )
+    
     # prepare for json return
     import json
     res = {
         'classification_result': {
-            'tile_url': img.getMapId(rice_vis_params)['tile_fetcher'].url_format,
-            'download_url': thumbnail_img.getThumbURL({
-                 **rice_thumbnail_params,           # the style for thumbnail picture
-                'dimensions': 1920,
-                'region': boundary.geometry(),
-                'format': 'jpg'
-            }),
+            'tile_url': map_id['tile_fetcher'].url_format,
+            'download_url': thumbnail_url,
         },
-        'area': area,
-        'confusion_matrix': json.dumps(confusion_matrix.getInfo()),
-        'oa': oa.getInfo(),
-        'kappa': kappa.getInfo(),
+        'area': stats['area'],
+        'confusion_matrix': json.dumps(stats['confusion_matrix']),
+        'oa': stats['oa'],
+        'kappa': stats['kappa'],
     }
     
     return res
-    
\ No newline at end of file
+
+
+@stage('graph')
+def run_multi_year_supervised_classification(filters, samples):
+    """Run a supervised classification for several years, with the classification period shifted to each year
+
+    Every year trains its own classifier on the same samples. The years share the samples, the
+    boundary and one filtered collection of scenes that covers all of them.
+
+    Args:
+        filters (dict): Json-like Python dictionary that holds all filters from request, see get_batch_years()
+        samples (dict): GeoJSON feature collection of the ground truth samples
+
+    Returns:
+        tuple(dict, ee.Feature, float): the classified image and confusion matrix by year, the boundary and the scale
+    """
+    dataset_filters = filters['dataset']
+    classification_filters = filters['classification']
+    start_date, end_date = classification_filters['start_date'], classification_filters['end_date']
+    periods = {year: (shift_years(start_date, offset), shift_years(end_date, offset))
+               for year, offset in get_batch_years(filters, start_date).items()}
+    
+    samples_ee = geojson_to_ee(label_samples(samples, classification_filters['class_property']))
+    scale = get_dataset_scale(dataset_filters['name'])
+    boundary = get_boundary(dataset_filters, scale)
+    
+    # one collection covers the periods of all years
+    pool = make_feature_pool(dataset_filters, boundary, *season_date_range(
+        [{'start': start, 'end': end} for start, end in periods.values()]))
+    
+    results = {year: classify_period(filters, pool, samples_ee, boundary, scale, start, end)
+               for year, (start, end) in periods.items()}
+    return results, boundary, scale
+
+
+@stage('results')
+def make_multi_year_classification_results(results, boundary, scale):
+    import json
+    
+    # the areas and accuracy metrics of all years in a single request
+    stats = ee.Dictionary({str(year): classification_stats(img, boundary, scale, confusion_matrix)
+                           for year, (img, confusion_matrix) in results.items()})
+    stats = ee_call(stats, 'getInfo')
+    return {'years': {
+        str(year): {
+            'area': stats[str(year)]['area'],
+            'confusion_matrix': json.dumps(stats[str(year)]['confusion_matrix']),
+            'oa': stats[str(year)]['oa'],
+            'kappa': stats[str(year)]['kappa'],
+        } for year in results
+    }}
+
+
+def _run_threshold_job(job, filters):
+    return get_threshold_results(filters, job.set_progress)
+
+
+def _run_classification_job(job, filters, samples):
+    job.set_progress(0.1, "Sampling and training the classifier")
+    img, boundary, scale, confusion_matrix = run_supervised_classification(filters, samples)
+    job.set_progress(0.3, "Classifying and computing the accuracy")
+    return make_classification_results(img, boundary, scale, confusion_matrix)
+
+
+def submit_threshold_job(filters):
+    """Enqueue a threshold-based classification, see get_threshold_results()
+
+    Returns:
+        Job: the queued job
+    """
+    return get_job_manager().submit('threshold', _run_threshold_job, filters,
+                                    description=f"Threshold-based classification of {filters['dataset']['boundary']}")
+
+
+def submit_classification_job(filters, samples):
+    """Enqueue a supervised classification, see run_supervised_classification() and make_classification_results()
+
+    Returns:
+        Job: the queued job
+    """
+    return get_job_manager().submit('classification', _run_classification_job, filters, samples,
+                                    description=f"Supervised classification of {filters['dataset']['boundary']}")
+
+
+def get_job_list():
+    return [job.to_dict(with_result=False) for job in get_job_manager().list()]
+
+
+def get_the_job(id):
+    job = get_job_manager().get(id)
+    return job.to_dict() if job is not None else None
+
+
+def cancel_job(id):
+    """Ask a job to stop, see JobManager.cancel()
+
+    A running job only stops at its next progress report, so a job that is computing
+    the results of a classification (make_*_results) is not interrupted.
+    """
+    job = get_job_manager().cancel(id)
+    return job.to_dict(with_result=False) if job is not None else None
\ No newline at end of file
@@ -0,0 +1,246 @@
+"""Counters, gauges and latency histograms of the app, exposed in the Prometheus text format.
+
+Every worker process records its metrics in memory and writes a snapshot of them to a JSON
+file named after its pid in the ``METRICS_DIR`` folder, at most every ``METRICS_FLUSH_INTERVAL``
+seconds. The /metrics endpoint merges the snapshots of all workers: counters and histograms are
+summed, and the gauges of workers that are no longer running are left out.
+"""
+import functools
+import glob
+import json
+import math
+import os
+import threading
+import time
+
+# upper bounds of the latency buckets, in seconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, math.inf)
+
+_HELP = {
+    'riceexplorer_requests_total': ('counter', 'Requests by endpoint and status code'),
+    'riceexplorer_request_duration_seconds': ('histogram', 'Time to produce the response, by endpoint'),
+    'riceexplorer_requests_in_flight': ('gauge', 'Requests being processed, by endpoint'),
+    'riceexplorer_errors_total': ('counter', 'Errors by endpoint and exception type'),
+    'riceexplorer_ee_calls_total': ('counter', 'Earth Engine calls by method'),
+    'riceexplorer_ee_call_duration_seconds': ('histogram', 'Wall time of Earth Engine calls, by method'),
+    'riceexplorer_cache_hits_total': ('counter', 'Cache hits by cache'),
+    'riceexplorer_cache_misses_total': ('counter', 'Cache misses by cache'),
+    'riceexplorer_cache_hit_ratio': ('gauge', 'Hits over lookups, by cache'),
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Registry:
+    """Metrics of this process"""
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, value=1):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_gauge(self, name, labels, delta):
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name, labels, seconds):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+                    break
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    def register_cache(self, name, cache):
+        """Report the hits and misses of a cache, see service.cache"""
+        self._caches[name] = cache
+
+    def snapshot(self):
+        """JSON-serializable state of the metrics"""
+        with self._lock:
+            counters = [[name, dict(labels), value] for (name, labels), value in self._counters.items()]
+            gauges = [[name, dict(labels), value] for (name, labels), value in self._gauges.items()]
+            histograms = [[name, dict(labels), dict(h, buckets=list(h['buckets']))] for (name, labels), h in self._histograms.items()]
+        for cache_name, cache in list(self._caches.items()):
+            stats = cache.stats()
+            counters.append(['riceexplorer_cache_hits_total', {'cache': cache_name}, stats['hits']])
+            counters.append(['riceexplorer_cache_misses_total', {'cache': cache_name}, stats['misses']])
+        return {'pid': os.getpid(), 'time': time.time(), 'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+
+registry = Registry()
+
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+
+def _metrics_dir():
+    from django.conf import settings
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def flush(force=False):
+    """Write the snapshot of this process, unless it has been written less than ``METRICS_FLUSH_INTERVAL`` seconds ago"""
+    global _last_flush
+    from django.conf import settings
+    directory = _metrics_dir()
+    if directory is None:
+        return
+    now = time.time()
+    if not force and now - _last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+        return
+    if not _flush_lock.acquire(blocking=False):
+        # another thread is writing it
+        return
+    try:
+        _last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(tmp_path, path)
+    finally:
+        _flush_lock.release()
+
+
+def is_running(pid):
+    """Whether a process of this host is alive"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """Merge the snapshots of all worker processes
+
+    Returns:
+        dict: counters, gauges and histograms keyed by (name, labels)
+    """
+    directory = _metrics_dir()
+    snapshots = []
+    if directory is not None:
+        flush(force=True)
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # being replaced, or removed
+                continue
+    else:
+        snapshots.append(registry.snapshot())
+
+    counters, gauges, histograms = {}, {}, {}
+    for snapshot in snapshots:
+        running = snapshot['pid'] == os.getpid() or is_running(snapshot['pid'])
+        for name, labels, value in snapshot['counters']:
+            key = _key(name, labels)
+            counters[key] = counters.get(key, 0) + value
+        if running:
+            for name, labels, value in snapshot['gauges']:
+                key = _key(name, labels)
+                gauges[key] = gauges.get(key, 0) + value
+        for name, labels, histogram in snapshot['histograms']:
+            key = _key(name, labels)
+            merged = histograms.setdefault(key, {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0})
+            merged['buckets'] = [a + b for a, b in zip(merged['buckets'], histogram['buckets'])]
+            merged['sum'] += histogram['sum']
+            merged['count'] += histogram['count']
+
+    for (name, labels), hits in list(counters.items()):
+        if name == 'riceexplorer_cache_hits_total':
+            misses = counters.get(('riceexplorer_cache_misses_total', labels), 0)
+            if hits + misses:
+                gauges[('riceexplorer_cache_hit_ratio', labels)] = hits / (hits + misses)
+    return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs) + '}'
+
+
+def _bound(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+
+def render():
+    """Metrics of all workers in the Prometheus text exposition format"""
+    metrics = collect()
+    series = {}
+    for kind in ('counters', 'gauges'):
+        for (name, labels), value in metrics[kind].items():
+            series.setdefault(name, []).append(f'{name}{_labels(labels)} {value}')
+    for (name, labels), histogram in metrics['histograms'].items():
+        lines = series.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram['buckets']):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(labels, le=_bound(bound))} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {histogram["sum"]}')
+        lines.append(f'{name}_count{_labels(labels)} {histogram["count"]}')
+
+    out = []
+    for name in sorted(series):
+        kind, description = _HELP.get(name, ('untyped', ''))
+        out.append(f'# HELP {name} {description}')
+        out.append(f'# TYPE {name} {kind}')
+        out.extend(sorted(series[name]))
+    return '\n'.join(out) + '\n'
+
+
+def observe_ee_call(method, seconds):
+    registry.inc('riceexplorer_ee_calls_total', {'method': method})
+    registry.observe('riceexplorer_ee_call_duration_seconds', {'method': method}, seconds)
+
+
+def record_error(endpoint, error):
+    """Count an error handled by a view"""
+    registry.inc('riceexplorer_errors_total', {'endpoint': endpoint, 'exception': type(error).__name__})
+
+
+def observe_view(endpoint):
+    """Decorator recording the latency, status codes, in-flight requests and uncaught errors of a view"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            labels = {'endpoint': endpoint}
+            registry.add_gauge('riceexplorer_requests_in_flight', labels, 1)
+            start = time.perf_counter()
+            status = '500'
+            try:
+                response = view(request, *args, **kwargs)
+                status = str(response.status_code)
+                return response
+            except Exception as e:
+                record_error(endpoint, e)
+                raise
+            finally:
+                registry.add_gauge('riceexplorer_requests_in_flight', labels, -1)
+                registry.observe('riceexplorer_request_duration_seconds', labels, time.perf_counter() - start)
+                registry.inc('riceexplorer_requests_total', {'endpoint': endpoint, 'status': status})
+                flush()
+        return wrapper
+    return decorator
@@ -0,0 +1,68 @@
+import base64
+import re
+
+# value of the samples where a composite has no data, see make_phenology_image()
+NODATA = 99999
+
+# band names of the time-series image end with "<system:time_start>_feature"
+_feature_key = re.compile(r'(-?\d+)_feature$')
+
+
+def phenology_to_columnar(feature_collection, encoding='json'):
+    """Convert the sampled time series of get_phenology() to a columnar layout.
+
+    The timestamps are sent once, and the values of all samples form a dense float32 matrix
+    of shape (samples, timestamps) with a mask that is 1 where a value exists.
+
+    Args:
+        feature_collection (dict): the GeoJSON FeatureCollection returned by get_phenology()
+        encoding (str, optional): 'json' for nested arrays with values rounded to 6 decimals, or 'base64'
+            for the little-endian float32 matrix and the bit-packed mask, both encoded in base64. Defaults to 'json'.
+
+    Raises:
+        ValueError: unknown encoding
+
+    Returns:
+        dict: timestamps, values, mask, plus the other properties and geometry of each sample
+    """
+    import numpy as np
+
+    features = feature_collection['features']
+
+    columns = {}
+    for feature in features:
+        for key in feature['properties']:
+            if key not in columns:
+                match = _feature_key.search(key)
+                if match:
+                    columns[key] = int(match.group(1))
+    keys = sorted(columns, key=columns.get)
+
+    values = np.full((len(features), len(keys)), NODATA, dtype=np.float32)
+    properties = []
+    geometries = []
+    for i, feature in enumerate(features):
+        props = feature['properties']
+        values[i] = [props.get(key, NODATA) for key in keys]
+        properties.append({k: v for k, v in props.items() if k not in columns})
+        geometries.append(feature.get('geometry'))
+    mask = values != NODATA
+    values[~mask] = 0
+
+    res = {
+        'timestamps': [columns[key] for key in keys],
+        'shape': list(values.shape),
+        'properties': properties,
+        'geometries': geometries,
+    }
+    if encoding == 'json':
+        # float32 values are printed with float64 digits, round them to keep the JSON compact
+        res['values'] = np.round(values.astype(np.float64), 6).tolist()
+        res['mask'] = mask.astype(np.uint8).tolist()
+    elif encoding == 'base64':
+        res['dtype'] = '<f4'
+        res['values'] = base64.b64encode(values.astype('<f4').tobytes()).decode('ascii')
+        res['mask'] = base64.b64encode(np.packbits(mask, axis=None).tobytes()).decode('ascii')
+    else:
+        raise ValueError(f"Unknown encoding: {encoding}")
+    return res
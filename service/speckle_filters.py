@@ -1,4 +1,5 @@
-import ee
+from __future__ import annotations
+from .ee_client import ee
 
 
 def powerToDb(img):
@@ -0,0 +1,131 @@
+import threading
+import time
+
+from .ee_client import ee
+
+# states after which the status of an Earth Engine task no longer changes
+FINISHED_STATES = ('COMPLETED', 'FAILED', 'CANCELLED')
+
+
+class TaskStatusIndex:
+    """Statuses of the Earth Engine export tasks, keyed by task id.
+
+    The whole task list is fetched with a single request, at most once every ``min_interval``
+    seconds, and the status requests of the views are answered from memory. A finished task is
+    never fetched again, and a task that Earth Engine does not know is not asked for again
+    before ``missing_ttl`` seconds.
+
+    Args:
+        min_interval (float, optional): Minimum number of seconds between two fetches of the task list. Defaults to 5.
+        missing_ttl (float, optional): Seconds during which an unknown task id is answered without a request. Defaults to min_interval.
+    """
+
+    def __init__(self, min_interval=5, missing_ttl=None):
+        self.min_interval = min_interval
+        self.missing_ttl = min_interval if missing_ttl is None else missing_ttl
+        self._statuses = {}
+        self._updated = {}
+        self._missing = {}
+        self._last_refresh = None
+        # _lock guards the statuses and is never held during a request to Earth Engine,
+        # _refresh_lock lets a single caller fetch the task list at a time
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _store(self, status, now):
+        self._statuses[status['id']] = status
+        self._updated[status['id']] = now
+        self._missing.pop(status['id'], None)
+
+    def seed(self, status):
+        """Record the status of a task known from elsewhere, e.g. the task that has just been started"""
+        with self._lock:
+            self._store(status, time.time())
+
+    def refresh(self, force=False):
+        """Fetch the task list unless it has been fetched less than ``min_interval`` seconds ago.
+
+        Concurrent callers wait for the request in progress instead of sending their own.
+        """
+        with self._refresh_lock:
+            now = time.time()
+            if not force and self._last_refresh is not None and now - self._last_refresh < self.min_interval:
+                return
+            statuses = ee.data.getTaskList()
+            with self._lock:
+                self._last_refresh = time.time()
+                # keep the order of the task list, newest first, then the tasks it no longer holds
+                known = self._statuses
+                self._statuses, self._updated = {}, {id: self._updated[id] for id in known}
+                for status in statuses:
+                    if status['id'] in known and known[status['id']]['state'] in FINISHED_STATES:
+                        status = known[status['id']]
+                        self._statuses[status['id']] = status
+                    else:
+                        self._store(status, self._last_refresh)
+                for id, status in known.items():
+                    self._statuses.setdefault(id, status)
+
+    def list(self):
+        """Get the statuses of all tasks
+
+        Returns:
+            list: status dictionaries, as returned by ee.batch.Task.status()
+        """
+        self.refresh()
+        return list(self._statuses.values())
+
+    def get(self, id):
+        """Get the status of a task
+
+        Returns:
+            dict: the status, or None if the task does not exist
+        """
+        status = self._statuses.get(id)
+        if status is not None and status['state'] in FINISHED_STATES:
+            return status
+        self.refresh()
+        status = self._statuses.get(id)
+        if status is None:
+            missing = self._missing.get(id)
+            if missing is not None and time.time() - missing < self.missing_ttl:
+                return None
+            # started after the last fetch, by another worker
+            try:
+                status = ee.data.getTaskStatus(id)[0]
+            except ee.EEException:
+                # a malformed id
+                status = {'id': id, 'state': 'UNKNOWN'}
+            if status['state'] == 'UNKNOWN':
+                with self._lock:
+                    now = time.time()
+                    self._missing = {id: t for id, t in self._missing.items() if now - t < self.missing_ttl}
+                    self._missing[id] = now
+                return None
+            self.seed(status)
+        return status
+
+    def updated(self, id):
+        """Time when the status of a task was last fetched, or None if the task is unknown"""
+        return self._updated.get(id)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_task_index():
+    """Get the task status index of this process, refreshed at most once every ``TASK_STATUS_MIN_REFRESH`` seconds
+
+    Unknown task ids are remembered for ``TASK_STATUS_MISSING_TTL`` seconds.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from django.conf import settings
+                _index = TaskStatusIndex(
+                    min_interval=getattr(settings, 'TASK_STATUS_MIN_REFRESH', 5),
+                    missing_ttl=getattr(settings, 'TASK_STATUS_MISSING_TTL', None),
+                )
+    return _index
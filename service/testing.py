@@ -0,0 +1,106 @@
+"""Fixtures of the tests and benchmarks that run the pipelines on the Earth Engine emulator, see service.ee_emulator"""
+from django.test import TestCase, override_settings
+
+BOUNDARY = 'CHITAWAN'
+
+DATASET = {
+    'name': 'COPERNICUS/S1_GRD',
+    'feature': 'VH',
+    'ascd': True,
+    'desc': True,
+    'composite': 'median',
+    'composite_days': 12,
+    'boundary': BOUNDARY,
+    'use_crop_mask': False,
+    'crop_mask': '',
+}
+
+THRESHOLD_FILTERS = {
+    'dataset': DATASET,
+    'op': 'and',
+    'seasons': [
+        {'name': 'sowing', 'start': '2021-06-01', 'end': '2021-08-01', 'min': -30, 'max': -18},
+        {'name': 'peak', 'start': '2021-08-01', 'end': '2021-10-15', 'min': -18, 'max': -10},
+    ],
+}
+
+CLASSIFICATION_FILTERS = {
+    'dataset': DATASET,
+    'classification': {
+        'start_date': '2021-05-01',
+        'end_date': '2021-11-01',
+        'class_property': {'name': 'crop', 'positiveValue': 'rice'},
+        'training_ratio': 0.7,
+        'model': 'Random Forest',
+        'model_specs': {'numberOfTrees': 50},
+    },
+}
+
+
+def make_samples(count, seed=0):
+    """Random points in the bounding box of the boundary, half of them labelled rice"""
+    import numpy as np
+    from .main import default_boundaries
+
+    rng = np.random.default_rng(seed)
+    ring = np.array(default_boundaries.get(BOUNDARY)['geometry']['coordinates'][0])
+    (west, south), (east, north) = ring.min(axis=0)[:2], ring.max(axis=0)[:2]
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [float(rng.uniform(west, east)), float(rng.uniform(south, north))]},
+            'properties': {'crop': 'rice' if i % 2 else 'other'},
+        } for i in range(count)],
+    }
+
+
+def server_side_make_composite(data_pool, start_date, end_date, days, method="median"):
+    """service.main.make_composite() before its windows were planned in Python, the reference of its tests and benchmark
+
+    A function mapped over a server-side list of window starts filters the whole pool by date for
+    every window, and ee.Algorithms.If drops the windows without images.
+    """
+    from .ee_client import ee
+
+    def getComposite(date):
+        date = ee.Date(date)
+        end_millis = date.advance(days, "day").millis().min(ee.Date(end_date).millis())
+        filtered_pool = data_pool.filterDate(date, ee.Date(end_millis))
+        season_data = getattr(filtered_pool, {'minimum': 'min', 'maximum': 'max'}.get(method, method))()
+        return ee.Algorithms.If(filtered_pool.size().gt(0), season_data.set('system:time_start', date.millis()))
+
+    gap_difference = ee.Date(start_date).advance(days, 'day').millis().subtract(ee.Date(start_date).millis())
+    list_map = ee.List.sequence(ee.Date(start_date).millis(), ee.Date(end_date).millis(), gap_difference)
+    return ee.ImageCollection.fromImages(list_map.map(getComposite).removeAll([None]))
+
+
+@override_settings(RESULT_CACHE_BACKEND='memory', TRAINING_TABLE_CACHE_BACKEND='memory', TILE_CACHE_BACKEND='memory')
+class EmulatorTestCase(TestCase):
+    """Runs on the emulator, whatever the ``EE_BACKEND`` setting, with empty caches and request counts at the start of every test"""
+
+    # a small grid, see service.ee_emulator.configure()
+    emulator_options = {'width': 96, 'height': 40, 'latency': 0}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from .ee_client import use_emulator
+        cls.ee = use_emulator(**cls.emulator_options)
+
+    def setUp(self):
+        from .conversion import get_boundary_cache
+        from .data_processing import get_tile_cache
+        from .main import get_result_cache, get_training_table_cache
+
+        for cache in (get_result_cache(), get_training_table_cache(), get_tile_cache(), get_boundary_cache()):
+            cache.clear()
+        self.ee.reset_stats()
+
+    def round_trips(self):
+        """Requests to the emulator since the start of the test, by method"""
+        return self.ee.get_stats()['round_trips']
+
+    def nodes(self):
+        """Total number of graph nodes sent to the emulator since the start of the test"""
+        return sum(self.ee.get_stats()['nodes'].values())
@@ -0,0 +1,138 @@
+"""Timing of the stages and Earth Engine calls of a request.
+
+A trace is started for each request by riceexplorer.middleware.TracingMiddleware when the
+``TRACING`` setting is on. The service functions mark their stages with ``stage()`` and make
+their Earth Engine round-trips through ``ee_call()``. Both only look up a context variable when
+no trace is active, so they cost next to nothing when tracing is off. The context is copied into
+the tasks of the Earth Engine pool, see service.executor.
+"""
+import contextvars
+import re
+import time
+from contextlib import ContextDecorator
+
+from .metrics import observe_ee_call
+
+_trace = contextvars.ContextVar('trace', default=None)
+_stage = contextvars.ContextVar('stage', default=None)
+
+
+class Trace:
+    """Spans recorded while a request is processed"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def add(self, kind, name, start, end, **extra):
+        # list.append is atomic, spans may come from several threads
+        self.spans.append({
+            'kind': kind,
+            'name': name,
+            'start_ms': round((start - self.start) * 1000, 3),
+            'duration_ms': round((end - start) * 1000, 3),
+            **extra,
+        })
+
+    def summary(self):
+        """Total duration, count and request size of the spans, by kind and name"""
+        totals = {}
+        for span in self.spans:
+            key = span['name'] if span['kind'] == 'stage' else f"ee-{span['name']}"
+            total = totals.setdefault(key, {'duration_ms': 0, 'count': 0, 'request_bytes': 0})
+            total['duration_ms'] += span['duration_ms']
+            total['count'] += 1
+            total['request_bytes'] += span.get('request_bytes', 0)
+        return totals
+
+    def server_timing(self):
+        """Value of the Server-Timing header, one metric per stage and per type of Earth Engine call"""
+        metrics = [f'{_token(name)};dur={total["duration_ms"]:.1f};desc="{total["count"]}x"'
+                   for name, total in self.summary().items()]
+        metrics.append(f'total;dur={(time.perf_counter() - self.start) * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def to_dict(self):
+        return {
+            'total_ms': round((time.perf_counter() - self.start) * 1000, 3),
+            'summary': self.summary(),
+            'spans': self.spans,
+        }
+
+
+def _token(name):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+
+def start_trace():
+    """Start a trace in the current context
+
+    Returns:
+        tuple(Trace, Token): the trace, and the token that end_trace() expects
+    """
+    trace = Trace()
+    return trace, _trace.set(trace)
+
+
+def end_trace(token):
+    _trace.reset(token)
+
+
+def current_trace():
+    return _trace.get()
+
+
+class stage(ContextDecorator):
+    """Record the time spent in a block or a function as a stage of the current trace
+
+    Usage:
+        with stage('boundary'):
+            ...
+
+        @stage('graph')
+        def build(...):
+            ...
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._entered = None
+
+    def _recreate_cm(self):
+        # a decorated function may run in several threads at once
+        return stage(self.name)
+
+    def __enter__(self):
+        trace = _trace.get()
+        if trace is not None:
+            self._entered = (trace, _stage.set(self.name), time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        if self._entered is not None:
+            trace, token, start = self._entered
+            self._entered = None
+            _stage.reset(token)
+            trace.add('stage', self.name, start, time.perf_counter())
+        return False
+
+
+def ee_call(obj, method, *args, **kwargs):
+    """Call a method of an Earth Engine object, e.g. ``ee_call(img, 'getMapId', vis_params)``
+
+    The call is counted in the metrics of service.metrics. With an active trace, it is also
+    recorded with the current stage, its wall time and the size of the serialized object.
+    """
+    trace = _trace.get()
+    if trace is not None:
+        from .ee_client import ee
+        # tasks have no graph to serialize
+        request_bytes = len(ee.serializer.toJSON(obj)) if isinstance(obj, ee.ComputedObject) else 0
+    start = time.perf_counter()
+    try:
+        return getattr(obj, method)(*args, **kwargs)
+    finally:
+        end = time.perf_counter()
+        observe_ee_call(method, end - start)
+        if trace is not None:
+            trace.add('ee', method, start, end, stage=_stage.get(), request_bytes=request_bytes)
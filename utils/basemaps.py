@@ -1,7 +1,6 @@
-import folium
-
-basemaps = {
-    'Google Maps': folium.TileLayer(
+# options of folium.TileLayer of every basemap, see get_basemaps()
+BASEMAP_OPTIONS = {
+    'Google Maps': dict(
         tiles = 'https://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}',
         attr = 'Google',
         name = 'Google Maps',
@@ -9,7 +8,7 @@ basemaps = {
         control = True,
         show = False
     ),
-    'Google Satellite': folium.TileLayer(
+    'Google Satellite': dict(
         tiles = 'https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}',
         attr = 'Google',
         name = 'Google Satellite',
@@ -17,7 +16,7 @@ basemaps = {
         control = True,
         show = False,
     ),
-    'Google Terrain': folium.TileLayer(
+    'Google Terrain': dict(
         tiles = 'https://mt1.google.com/vt/lyrs=p&x={x}&y={y}&z={z}',
         attr = 'Google',
         name = 'Google Terrain',
@@ -25,7 +24,7 @@ basemaps = {
         control = True,
         show = False,
     ),
-    # 'Google Satellite Hybrid': folium.TileLayer(
+    # 'Google Satellite Hybrid': dict(
     #     tiles = 'https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}',
     #     attr = 'Google',
     #     name = 'Google Satellite',
@@ -33,7 +32,7 @@ basemaps = {
     #     control = True,
     #     show = False,
     # ),
-    'Esri Satellite': folium.TileLayer(
+    'Esri Satellite': dict(
         tiles = 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
         attr = 'Esri',
         name = 'Esri Satellite',
@@ -41,4 +40,22 @@ basemaps = {
         control = True,
         show = False,
     )
-}
\ No newline at end of file
+}
+
+_basemaps = None
+
+
+def get_basemaps():
+    """Get the basemaps as folium tile layers, built on first use so that folium is only imported when needed"""
+    global _basemaps
+    if _basemaps is None:
+        import folium
+        _basemaps = {name: folium.TileLayer(**options) for name, options in BASEMAP_OPTIONS.items()}
+    return _basemaps
+
+
+def __getattr__(name):
+    # basemaps used to be built on import
+    if name == 'basemaps':
+        return get_basemaps()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
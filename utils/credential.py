@@ -1,15 +1,17 @@
 '''
 EE crediential configuration
+
+The credentials are built on first use by get_credentials(), see service.ee_client.ensure_initialized()
 '''
 import os
-import ee
+import threading
 from django.conf import settings
-import environ
 import glob
 
 # Initialize environment variables from .env file
 env_file_path = os.path.join(settings.BASE_DIR, ".env")
 if len(glob.glob(env_file_path)) > 0:
+    import environ
     env = environ.Env()
     environ.Env.read_env(env_file_path)
 
@@ -17,9 +19,52 @@ EE_ACCOUNT = os.environ.get("EE_ACCOUNT")
 
 EE_PRIVATE_KEY = os.environ.get("EE_CREDENTIALS")
 
-try:
-    EE_CREDENTIALS = ee.ServiceAccountCredentials(
-        EE_ACCOUNT, key_data=EE_PRIVATE_KEY)
-except Exception as e:
-    EE_CREDENTIALS = None
-    print("Cannot authenticate GEE")
\ No newline at end of file
+_credentials = None
+_credentials_lock = threading.Lock()
+
+
+def get_credentials():
+    """Get the service account credentials of Earth Engine, built once per process
+
+    Returns:
+        google.auth.credentials.Credentials: the credentials, or None if they cannot be built
+    """
+    global _credentials
+    if _credentials is None:
+        with _credentials_lock:
+            if _credentials is None:
+                from service.ee_client import load_module
+                try:
+                    _credentials = load_module().ServiceAccountCredentials(
+                        EE_ACCOUNT, key_data=EE_PRIVATE_KEY)
+                except Exception as e:
+                    print("Cannot authenticate GEE")
+                    return None
+    return _credentials
+
+
+def warm_credentials():
+    """Fetch the OAuth access token of the credentials now
+
+    Called in the gunicorn master process before the workers are forked (see gunicorn.conf.py),
+    so that every worker starts with a valid token instead of fetching its own.
+    """
+    credentials = get_credentials()
+    if credentials is None or not hasattr(credentials, 'refresh'):
+        return
+    import requests
+    from google.auth.transport.requests import Request
+    try:
+        # the connection is closed before the workers are forked
+        with requests.Session() as session:
+            credentials.refresh(Request(session))
+    except Exception as e:
+        # the workers will fetch the token themselves
+        print("Cannot fetch the GEE access token:", e)
+
+
+def __getattr__(name):
+    # EE_CREDENTIALS used to be built on import
+    if name == 'EE_CREDENTIALS':
+        return get_credentials()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")